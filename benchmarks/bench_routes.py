@@ -0,0 +1,47 @@
+"""
+Benchmark every route of the API against a generated dataset.
+
+Usage:
+    pytest benchmarks/bench_routes.py --benchmark-autosave
+    pytest benchmarks/bench_routes.py --benchmark-compare
+
+Not collected by the default test run, which only picks up test_*.py files.
+"""
+
+import random
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import Engine
+from benchmarks.dataset import Dataset, generate
+from benchmarks.scenarios import SCENARIOS, Call, Scenario
+
+pytest.importorskip("pytest_benchmark")
+
+DATASET = Dataset(medspas=20, services_per_medspa=10, appointments=20_000)
+ROUNDS = 50
+
+
+@pytest.fixture(name="dataset")
+def dataset_fixture(engine: Engine) -> Dataset:
+    generate(engine, DATASET)
+    return DATASET
+
+
+def send(client: TestClient, call: Call):
+    response = client.request(call.method, call.url, json=call.json)
+    assert response.status_code < 400, response.text
+    return response
+
+
+@pytest.mark.parametrize("scenario", SCENARIOS, ids=lambda scenario: scenario.route)
+def test_route(benchmark, client: TestClient, dataset: Dataset, scenario: Scenario):
+    rng = random.Random(42)
+
+    def setup():
+        prepared = None
+        if scenario.prepare:
+            prepared = send(client, scenario.prepare(dataset, rng)).json()
+
+        return (client, scenario.build(dataset, rng, prepared)), {}
+
+    benchmark.pedantic(send, setup=setup, rounds=ROUNDS)
@@ -0,0 +1,283 @@
+"""
+Generate a large synthetic dataset of medspas, services and appointments.
+
+Usage:
+    python -m benchmarks.dataset --url sqlite:///./bench.db --appointments 1000000
+
+Appointments fall within opening hours, around a late morning and a late
+afternoon peak, with fewer of them on weekends. Past ones are mostly completed
+and future ones scheduled, and their totals match the services they are linked
+to. Rows are written with COPY on PostgreSQL and executemany batches elsewhere.
+
+The target database is dropped and recreated, so never point it at real data.
+"""
+
+import argparse
+import csv
+import datetime
+import io
+import random
+from decimal import Decimal
+from enum import Enum
+from typing import Iterator, NamedTuple
+from sqlalchemy import Engine, Table, create_engine, insert, text
+from sqlmodel import Session, SQLModel
+from models import (
+    AppointmentStatus,
+    Appointments,
+    AppointmentsServices,
+    Medspa,
+    Services,
+)
+from repositories.stats import AppointmentStatsRepository
+from scheduling import CLOSING_TIME, OPENING_TIME, SLOT_INTERVAL
+
+BATCH_SIZE = 10_000
+FIRST_DAY = datetime.date(2024, 1, 1)
+DURATIONS = (15, 30, 45, 60, 90)
+# Relative number of bookings from Monday to Sunday
+WEEKDAY_WEIGHTS = (8, 9, 9, 10, 12, 10, 4)
+# Bookings cluster around these hours of the day
+PEAK_HOURS = (11, 16)
+CANCELLED_RATE = 0.1
+
+stats_repository = AppointmentStatsRepository()
+
+
+class Dataset(NamedTuple):
+    medspas: int = 200
+    services_per_medspa: int = 20
+    appointments: int = 1_000_000
+    days: int = 730
+
+    @property
+    def today(self) -> datetime.date:
+        # Appointments before this day are in the past
+        return FIRST_DAY + datetime.timedelta(days=self.days // 2)
+
+    def service_ids(self, medspa_id: int) -> range:
+        first = (medspa_id - 1) * self.services_per_medspa + 1
+        return range(first, first + self.services_per_medspa)
+
+
+def generate_medspas(dataset: Dataset, now: datetime.datetime) -> list[dict]:
+    return [
+        dict(
+            id=id,
+            name=f"Medspa {id}",
+            address=f"{id} Main St",
+            phone_number="555-0100",
+            email_address=f"medspa{id}@example.com",
+            created_at=now,
+            updated_at=now,
+        )
+        for id in range(1, dataset.medspas + 1)
+    ]
+
+
+def generate_services(
+    dataset: Dataset, rng: random.Random, now: datetime.datetime
+) -> list[dict]:
+    return [
+        dict(
+            id=id,
+            medspa_id=medspa_id,
+            name=f"Service {id}",
+            description="Benchmark service",
+            price=Decimal(rng.randrange(50, 1500)),
+            duration=rng.choice(DURATIONS),
+            created_at=now,
+            updated_at=now,
+        )
+        for medspa_id in range(1, dataset.medspas + 1)
+        for id in dataset.service_ids(medspa_id)
+    ]
+
+
+def generate_start_time(
+    rng: random.Random, days_by_weekday: list[list[datetime.date]]
+) -> datetime.datetime:
+    """
+    Pick a weekday by its weight, then a day among those and a start time,
+    aligned to the slot interval, around one of the peak hours
+    """
+    weekday = rng.choices(range(7), WEEKDAY_WEIGHTS)[0]
+    day = rng.choice(days_by_weekday[weekday])
+    opens_at = datetime.datetime.combine(day, OPENING_TIME)
+    closes_at = datetime.datetime.combine(day, CLOSING_TIME)
+
+    while True:
+        hour = rng.gauss(rng.choice(PEAK_HOURS), 1.5)
+        start_time = datetime.datetime.combine(day, datetime.time())
+        start_time += datetime.timedelta(hours=hour)
+        if opens_at <= start_time < closes_at:
+            return opens_at + (start_time - opens_at) // SLOT_INTERVAL * SLOT_INTERVAL
+
+
+def generate_appointments(
+    dataset: Dataset,
+    rng: random.Random,
+    services: list[dict],
+    now: datetime.datetime,
+) -> Iterator[tuple[list[dict], list[dict]]]:
+    """
+    Yield batches of appointment rows together with their service links
+    """
+    days = [FIRST_DAY + datetime.timedelta(days=day) for day in range(dataset.days)]
+    days_by_weekday = [
+        [day for day in days if day.weekday() == weekday] or days
+        for weekday in range(7)
+    ]
+
+    link_id = 0
+    for first in range(1, dataset.appointments + 1, BATCH_SIZE):
+        appointments, links = [], []
+        for id in range(first, min(first + BATCH_SIZE, dataset.appointments + 1)):
+            medspa_id = rng.randint(1, dataset.medspas)
+            booked = [
+                services[service_id - 1]
+                for service_id in rng.sample(
+                    dataset.service_ids(medspa_id),
+                    min(rng.choice((1, 1, 1, 2, 2, 3)), dataset.services_per_medspa),
+                )
+            ]
+            start_time = generate_start_time(rng, days_by_weekday)
+
+            if rng.random() < CANCELLED_RATE:
+                status = AppointmentStatus.CANCELLED
+            elif start_time.date() < dataset.today:
+                status = AppointmentStatus.COMPLETED
+            else:
+                status = AppointmentStatus.SCHEDULED
+
+            appointments.append(
+                dict(
+                    id=id,
+                    medspa_id=medspa_id,
+                    start_time=start_time,
+                    total_price=sum(service["price"] for service in booked),
+                    total_duration=sum(service["duration"] for service in booked),
+                    status=status,
+                    created_at=now,
+                    updated_at=now,
+                )
+            )
+            for service in booked:
+                link_id += 1
+                links.append(
+                    dict(
+                        id=link_id,
+                        appointment_id=id,
+                        service_id=service["id"],
+                        created_at=now,
+                        updated_at=now,
+                    )
+                )
+
+        yield appointments, links
+
+
+def copy_rows(engine: Engine, table: Table, rows: list[dict]) -> None:
+    """
+    Write rows with COPY ... FROM STDIN, the fastest bulk path of PostgreSQL
+    """
+    columns = ", ".join(rows[0])
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        # Enums are stored by name, like SQLAlchemy does
+        writer.writerow(
+            value.name if isinstance(value, Enum) else value for value in row.values()
+        )
+    buffer.seek(0)
+
+    connection = engine.raw_connection()
+    try:
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f"COPY {table.name} ({columns}) FROM STDIN WITH (FORMAT csv)", buffer
+            )
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def write_rows(engine: Engine, table: Table, rows: list[dict]) -> None:
+    if not rows:
+        return
+
+    if engine.dialect.name == "postgresql":
+        copy_rows(engine, table, rows)
+        return
+
+    with engine.begin() as conn:
+        conn.execute(insert(table), rows)
+
+
+def reset_sequences(engine: Engine) -> None:
+    """
+    Move the id sequences past the generated ids, which were set explicitly
+    """
+    if engine.dialect.name != "postgresql":
+        return
+
+    with engine.begin() as conn:
+        for model in (Medspa, Services, Appointments, AppointmentsServices):
+            table = model.__tablename__
+            conn.execute(
+                text(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                    f"COALESCE((SELECT MAX(id) FROM {table}), 1))"
+                )
+            )
+
+
+def generate(engine: Engine, dataset: Dataset, seed: int = 42) -> None:
+    """
+    Fill an empty database with the dataset. The same seed always generates
+    the same rows.
+    """
+    rng = random.Random(seed)
+    now = datetime.datetime.now()
+
+    services = generate_services(dataset, rng, now)
+    write_rows(engine, Medspa.__table__, generate_medspas(dataset, now))
+    write_rows(engine, Services.__table__, services)
+
+    for appointments, links in generate_appointments(dataset, rng, services, now):
+        write_rows(engine, Appointments.__table__, appointments)
+        write_rows(engine, AppointmentsServices.__table__, links)
+
+    reset_sequences(engine)
+
+    # Bulk writes skip the events that maintain the daily rollup
+    with Session(engine) as session:
+        stats_repository.rebuild(session)
+
+
+def main():
+    defaults = Dataset()
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", default="sqlite:///./bench.db")
+    parser.add_argument("--medspas", type=int, default=defaults.medspas)
+    parser.add_argument(
+        "--services-per-medspa", type=int, default=defaults.services_per_medspa
+    )
+    parser.add_argument("--appointments", type=int, default=defaults.appointments)
+    parser.add_argument("--days", type=int, default=defaults.days)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    engine = create_engine(args.url)
+    dataset = Dataset(
+        args.medspas, args.services_per_medspa, args.appointments, args.days
+    )
+
+    SQLModel.metadata.drop_all(engine)
+    SQLModel.metadata.create_all(engine)
+    print(f"Generating {dataset}...")
+    generate(engine, dataset, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""
+Drive concurrent requests at every route of the API and record the p50/p99
+latency and the throughput of each one into a JSON baseline.
+
+Usage:
+    DATABASE_URL=sqlite:///./bench.db python -m benchmarks.load --generate \
+        --appointments 100000 --output benchmarks/baseline.json
+    DATABASE_URL=sqlite:///./bench.db python -m benchmarks.load --generate \
+        --appointments 100000 --compare benchmarks/baseline.json
+
+Requests go to the app in-process through its ASGI interface, or to a running
+server with --base-url. The dataset options must match the generated data, and
+since the write scenarios change it, compared runs should each regenerate it.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import sys
+import time
+import httpx
+from sqlmodel import SQLModel
+from database import engine
+from main import app
+from benchmarks.dataset import Dataset, generate
+from benchmarks.scenarios import SCENARIOS, Call, Scenario
+
+# Relative change of a metric above which a route is reported as a regression
+DEFAULT_THRESHOLD = 0.2
+
+
+async def send(client: httpx.AsyncClient, call: Call) -> httpx.Response:
+    response = await client.request(call.method, call.url, json=call.json)
+    if response.status_code >= 400:
+        raise RuntimeError(f"{call.method} {call.url}: {response.status_code}")
+
+    return response
+
+
+def percentile(latencies: list[float], rank: int) -> float | None:
+    """
+    Get the nearest-rank percentile of the latencies, in milliseconds
+    """
+    if not latencies:
+        return None
+
+    ordered = sorted(latencies)
+    index = max(math.ceil(rank / 100 * len(ordered)) - 1, 0)
+    return round(ordered[index] * 1000, 3)
+
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    scenario: Scenario,
+    dataset: Dataset,
+    requests: int,
+    concurrency: int,
+    rng: random.Random,
+) -> dict:
+    latencies: list[float] = []
+    errors = 0
+    pending = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in pending:
+            try:
+                prepared = None
+                if scenario.prepare:
+                    prepared = (
+                        await send(client, scenario.prepare(dataset, rng))
+                    ).json()
+
+                call = scenario.build(dataset, rng, prepared)
+                started = time.perf_counter()
+                await send(client, call)
+                latencies.append(time.perf_counter() - started)
+            except RuntimeError:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "p50_ms": percentile(latencies, 50),
+        "p99_ms": percentile(latencies, 99),
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+    }
+
+
+async def run(
+    dataset: Dataset, requests: int, concurrency: int, base_url: str | None
+) -> dict:
+    if base_url:
+        client = httpx.AsyncClient(base_url=base_url)
+    else:
+        client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://benchmark"
+        )
+
+    rng = random.Random(42)
+    routes = {}
+    async with client:
+        for scenario in SCENARIOS:
+            routes[scenario.route] = await run_scenario(
+                client, scenario, dataset, requests, concurrency, rng
+            )
+            print(f"{scenario.route:<48}{json.dumps(routes[scenario.route])}")
+
+    return {
+        "dataset": dataset._asdict(),
+        "requests": requests,
+        "concurrency": concurrency,
+        "routes": routes,
+    }
+
+
+def compare(baseline: dict, results: dict, threshold: float) -> list[str]:
+    """
+    Get the routes whose latency or throughput got worse than the baseline by
+    more than `threshold`
+    """
+    regressions = []
+    for route, current in results["routes"].items():
+        previous = baseline["routes"].get(route)
+        if not previous:
+            continue
+
+        for metric, higher_is_worse in (
+            ("p50_ms", True),
+            ("p99_ms", True),
+            ("throughput_rps", False),
+        ):
+            before, after = previous[metric], current[metric]
+            if not before or after is None:
+                continue
+
+            change = (after - before) / before
+            if (change if higher_is_worse else -change) > threshold:
+                regressions.append(
+                    f"{route} {metric}: {before} -> {after} ({change:+.0%})"
+                )
+
+    return regressions
+
+
+def main():
+    defaults = Dataset()
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--base-url")
+    parser.add_argument("--generate", action="store_true")
+    parser.add_argument("--medspas", type=int, default=defaults.medspas)
+    parser.add_argument(
+        "--services-per-medspa", type=int, default=defaults.services_per_medspa
+    )
+    parser.add_argument("--appointments", type=int, default=defaults.appointments)
+    parser.add_argument("--days", type=int, default=defaults.days)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--output", default="benchmarks/baseline.json")
+    parser.add_argument("--compare")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args()
+
+    dataset = Dataset(
+        args.medspas, args.services_per_medspa, args.appointments, args.days
+    )
+    if args.generate:
+        SQLModel.metadata.drop_all(engine)
+        SQLModel.metadata.create_all(engine)
+        print(f"Generating {dataset}...")
+        generate(engine, dataset)
+
+    results = asyncio.run(run(dataset, args.requests, args.concurrency, args.base_url))
+
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(json.load(file), results, args.threshold)
+
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+
+        sys.exit(1 if regressions else 0)
+
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=2, sort_keys=True)
+    print(f"Baseline written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Compare the query plans and timings of the main appointment, service and
+join-table access paths with and without the indexes declared in `models.py`.
+
+Usage:
+    python -m benchmarks.query_plans --url sqlite:///./bench.db --appointments 1000000
+
+The target database is dropped and recreated, so never point it at real data.
+"""
+
+import argparse
+import datetime
+import time
+from sqlalchemy import Engine, create_engine, delete
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+from sqlmodel import SQLModel, select
+from models import (
+    AppointmentStatus,
+    Appointments,
+    AppointmentsServices,
+    Services,
+)
+from repositories.appoitments import AppointmentsRepository
+from benchmarks.dataset import Dataset, generate
+
+appointments_repository = AppointmentsRepository()
+
+
+class Explain(Executable, ClauseElement):
+    inherit_cache = False
+
+    def __init__(self, statement, analyze: bool = False):
+        self.statement = statement
+        self.analyze = analyze
+
+
+@compiles(Explain, "postgresql")
+def _explain_postgresql(element, compiler, **kw):
+    prefix = "EXPLAIN (ANALYZE, BUFFERS) " if element.analyze else "EXPLAIN "
+    return prefix + compiler.process(element.statement, **kw)
+
+
+@compiles(Explain, "sqlite")
+def _explain_sqlite(element, compiler, **kw):
+    return "EXPLAIN QUERY PLAN " + compiler.process(element.statement, **kw)
+
+
+def access_paths(dataset: Dataset) -> dict:
+    day = dataset.today
+    week_start = datetime.datetime.combine(day, datetime.time())
+    appointment_id = dataset.appointments // 2
+    medspa_id = max(dataset.medspas // 2, 1)
+
+    return {
+        "appointments by date": appointments_repository.filter_query(
+            select(Appointments), date=day
+        ),
+        "appointments by status and date": select(Appointments)
+        .where(Appointments.status == AppointmentStatus.SCHEDULED)
+        .where(Appointments.start_time >= week_start)
+        .where(Appointments.start_time < week_start + datetime.timedelta(days=1)),
+        "appointments of a medspa in a week": select(Appointments)
+        .where(Appointments.medspa_id == medspa_id)
+        .where(Appointments.start_time >= week_start)
+        .where(Appointments.start_time < week_start + datetime.timedelta(days=7)),
+        "first page of appointments": select(Appointments)
+        .order_by(Appointments.start_time, Appointments.id)
+        .limit(51),
+        "services of an appointment": select(AppointmentsServices).where(
+            AppointmentsServices.appointment_id == appointment_id
+        ),
+        "delete services of an appointment": delete(AppointmentsServices).where(
+            AppointmentsServices.appointment_id == appointment_id
+        ),
+        "services of a medspa": select(Services).where(Services.medspa_id == medspa_id),
+        "appointments using a service": select(AppointmentsServices).where(
+            AppointmentsServices.service_id == dataset.services_per_medspa
+        ),
+    }
+
+
+def report(engine: Engine, queries: dict, analyze: bool) -> dict:
+    timings = {}
+    with engine.connect() as conn:
+        for name, query in queries.items():
+            # Never run a DELETE for real, only ask for its plan
+            is_select = query.is_select
+            plan = conn.execute(Explain(query, analyze=analyze and is_select))
+            print(f"\n--- {name}")
+            for row in plan:
+                print("   ", " | ".join(str(column) for column in row))
+
+            if is_select:
+                started = time.perf_counter()
+                conn.execute(query).all()
+                timings[name] = (time.perf_counter() - started) * 1000
+            conn.rollback()
+
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", default="sqlite:///./bench.db")
+    parser.add_argument("--medspas", type=int, default=200)
+    parser.add_argument("--appointments", type=int, default=1_000_000)
+    parser.add_argument("--skip-seed", action="store_true")
+    args = parser.parse_args()
+
+    engine = create_engine(args.url)
+    dataset = Dataset(medspas=args.medspas, appointments=args.appointments)
+    indexes = [
+        index for table in SQLModel.metadata.sorted_tables for index in table.indexes
+    ]
+
+    if not args.skip_seed:
+        SQLModel.metadata.drop_all(engine)
+        SQLModel.metadata.create_all(engine)
+        print(f"Seeding {args.appointments} appointments...")
+        generate(engine, dataset)
+
+    queries = access_paths(dataset)
+    analyze = engine.dialect.name == "postgresql"
+
+    with engine.begin() as conn:
+        for index in indexes:
+            index.drop(conn, checkfirst=True)
+    print("\n======== without indexes")
+    before = report(engine, queries, analyze)
+
+    with engine.begin() as conn:
+        for index in indexes:
+            index.create(conn, checkfirst=True)
+        conn.exec_driver_sql("ANALYZE")
+    print("\n======== with indexes")
+    after = report(engine, queries, analyze)
+
+    print("\n======== timings (ms)")
+    print(f"{'query':<40}{'before':>12}{'after':>12}")
+    for name in before:
+        print(f"{name:<40}{before[name]:>12.2f}{after[name]:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+"""
+One request scenario per route of the API, shared by the pytest-benchmark
+suite and the load driver. Every scenario targets rows of a generated
+`Dataset` and is expected to succeed.
+"""
+
+import datetime
+import itertools
+import random
+from typing import Any, Callable, NamedTuple
+from fastapi import FastAPI
+from routes import internal
+from benchmarks.dataset import DURATIONS, Dataset
+
+# Bookings made by the scenarios start after the generated ones, each in its own
+# slot, so that they never overlap an existing appointment
+BOOKINGS_START = datetime.datetime(2100, 1, 1, 9)
+SERVICES_PER_BOOKING = 2
+BOOKING_INTERVAL = datetime.timedelta(minutes=SERVICES_PER_BOOKING * max(DURATIONS))
+
+
+class Call(NamedTuple):
+    method: str
+    url: str
+    json: Any = None
+
+
+class Scenario(NamedTuple):
+    # Method and path template of the route, e.g. "GET /v1/medspas/{medspa_id}"
+    route: str
+    build: Callable[[Dataset, random.Random, Any], Call]
+    # Untimed request sent first, whose JSON response is passed to `build`,
+    # e.g. to create the row that the timed DELETE removes
+    prepare: Callable[[Dataset, random.Random], Call] | None = None
+
+
+def get_routes(app: FastAPI) -> set[str]:
+    """
+    Get the method and path template of every route of the app
+    """
+    routes = {
+        f"{method.upper()} {path}"
+        for path, operations in app.openapi()["paths"].items()
+        for method in operations
+    }
+    # The internal routes are left out of the schema
+    for route in internal.router.routes:
+        routes |= {f"{method} {route.path}" for method in route.methods}
+
+    return routes
+
+
+def medspa_id(dataset: Dataset, rng: random.Random) -> int:
+    return rng.randint(1, dataset.medspas)
+
+
+def service_id(dataset: Dataset, rng: random.Random) -> int:
+    return rng.randint(1, dataset.medspas * dataset.services_per_medspa)
+
+
+def appointment_id(dataset: Dataset, rng: random.Random) -> int:
+    return rng.randint(1, dataset.appointments)
+
+
+def day(dataset: Dataset, rng: random.Random) -> datetime.date:
+    return dataset.today + datetime.timedelta(days=rng.randint(-30, 30))
+
+
+def week(dataset: Dataset, rng: random.Random) -> str:
+    start = day(dataset, rng)
+    return f"from={start}&to={start + datetime.timedelta(days=6)}"
+
+
+def medspa_body(rng: random.Random) -> dict:
+    return {
+        "name": f"Medspa {rng.random()}",
+        "address": "1 Benchmark St",
+        "phone_number": "555-0100",
+        "email_address": "benchmark@example.com",
+    }
+
+
+def service_body(dataset: Dataset, rng: random.Random) -> dict:
+    return {
+        "name": f"Service {rng.random()}",
+        "description": "Benchmark service",
+        "price": "100.00",
+        "duration": 30,
+        "medspa_id": medspa_id(dataset, rng),
+    }
+
+
+_slots = itertools.count()
+
+
+def booking_body(dataset: Dataset, rng: random.Random) -> dict:
+    start_time = BOOKINGS_START + next(_slots) * BOOKING_INTERVAL
+    id = medspa_id(dataset, rng)
+    return {
+        "medspa_id": id,
+        "services": rng.sample(dataset.service_ids(id), SERVICES_PER_BOOKING),
+        "start_time": start_time.isoformat(),
+    }
+
+
+def created_id(prepared: dict) -> int:
+    return prepared["id"]
+
+
+SCENARIOS = [
+    Scenario(
+        "GET /v1/medspas/",
+        lambda dataset, rng, _: Call("GET", "/v1/medspas/?limit=50"),
+    ),
+    Scenario(
+        "GET /v1/medspas/{medspa_id}",
+        lambda dataset, rng, _: Call("GET", f"/v1/medspas/{medspa_id(dataset, rng)}"),
+    ),
+    Scenario(
+        "GET /v1/medspas/{medspa_id}/availability",
+        lambda dataset, rng, _: Call(
+            "GET",
+            f"/v1/medspas/{medspa_id(dataset, rng)}/availability"
+            f"?date={day(dataset, rng)}&duration=60",
+        ),
+    ),
+    Scenario(
+        "GET /v1/medspas/{medspa_id}/appointments",
+        # The week view of a clinic's calendar
+        lambda dataset, rng, _: Call(
+            "GET",
+            f"/v1/medspas/{medspa_id(dataset, rng)}/appointments?{week(dataset, rng)}",
+        ),
+    ),
+    Scenario(
+        "GET /v1/medspas/{medspa_id}/stats",
+        lambda dataset, rng, _: Call(
+            "GET",
+            f"/v1/medspas/{medspa_id(dataset, rng)}/stats"
+            f"?from={dataset.today}&to={dataset.today + datetime.timedelta(days=30)}",
+        ),
+    ),
+    Scenario(
+        "POST /v1/medspas/",
+        lambda dataset, rng, _: Call("POST", "/v1/medspas/", medspa_body(rng)),
+    ),
+    Scenario(
+        "PATCH /v1/medspas/{medspa_id}",
+        lambda dataset, rng, _: Call(
+            "PATCH",
+            f"/v1/medspas/{medspa_id(dataset, rng)}",
+            {"phone_number": "555-0199"},
+        ),
+    ),
+    Scenario(
+        "DELETE /v1/medspas/{medspa_id}",
+        lambda dataset, rng, prepared: Call(
+            "DELETE", f"/v1/medspas/{created_id(prepared)}"
+        ),
+        prepare=lambda dataset, rng: Call("POST", "/v1/medspas/", medspa_body(rng)),
+    ),
+    Scenario(
+        "GET /v1/services/",
+        lambda dataset, rng, _: Call(
+            "GET", f"/v1/services/?medspa_id={medspa_id(dataset, rng)}"
+        ),
+    ),
+    Scenario(
+        "GET /v1/services/{service_id}",
+        lambda dataset, rng, _: Call("GET", f"/v1/services/{service_id(dataset, rng)}"),
+    ),
+    Scenario(
+        "POST /v1/services/",
+        lambda dataset, rng, _: Call(
+            "POST", "/v1/services/", service_body(dataset, rng)
+        ),
+    ),
+    Scenario(
+        "POST /v1/services/bulk",
+        lambda dataset, rng, _: Call(
+            "POST",
+            "/v1/services/bulk",
+            [service_body(dataset, rng) for _ in range(20)],
+        ),
+    ),
+    Scenario(
+        "PATCH /v1/services/{service_id}",
+        lambda dataset, rng, _: Call(
+            "PATCH", f"/v1/services/{service_id(dataset, rng)}", {"duration": 45}
+        ),
+    ),
+    Scenario(
+        "DELETE /v1/services/{service_id}",
+        lambda dataset, rng, prepared: Call(
+            "DELETE", f"/v1/services/{created_id(prepared)}"
+        ),
+        prepare=lambda dataset, rng: Call(
+            "POST", "/v1/services/", service_body(dataset, rng)
+        ),
+    ),
+    Scenario(
+        "GET /v1/appointments/",
+        lambda dataset, rng, _: Call(
+            "GET",
+            f"/v1/appointments/?medspa_id={medspa_id(dataset, rng)}"
+            f"&from={day(dataset, rng)}&include=services",
+        ),
+    ),
+    Scenario(
+        "GET /v1/appointments/export",
+        lambda dataset, rng, _: Call(
+            "GET",
+            f"/v1/appointments/export?format=csv&medspa_id={medspa_id(dataset, rng)}",
+        ),
+    ),
+    Scenario(
+        "GET /v1/appointments/{appointment_id}",
+        lambda dataset, rng, _: Call(
+            "GET", f"/v1/appointments/{appointment_id(dataset, rng)}"
+        ),
+    ),
+    Scenario(
+        "POST /v1/appointments/",
+        lambda dataset, rng, _: Call(
+            "POST", "/v1/appointments/", booking_body(dataset, rng)
+        ),
+    ),
+    Scenario(
+        "POST /v1/appointments/bulk",
+        lambda dataset, rng, _: Call(
+            "POST",
+            "/v1/appointments/bulk",
+            [booking_body(dataset, rng) for _ in range(10)],
+        ),
+    ),
+    Scenario(
+        "PATCH /v1/appointments/{appointment_id}",
+        # Cancelling never overlaps another booking, so it always succeeds
+        lambda dataset, rng, _: Call(
+            "PATCH",
+            f"/v1/appointments/{appointment_id(dataset, rng)}",
+            {"status": "cancelled"},
+        ),
+    ),
+    Scenario(
+        "DELETE /v1/appointments/{appointment_id}",
+        lambda dataset, rng, prepared: Call(
+            "DELETE", f"/v1/appointments/{created_id(prepared)}"
+        ),
+        prepare=lambda dataset, rng: Call(
+            "POST", "/v1/appointments/", booking_body(dataset, rng)
+        ),
+    ),
+    Scenario(
+        "GET /v1/changes/",
+        lambda dataset, rng, _: Call("GET", "/v1/changes/?since=0&limit=50"),
+    ),
+    Scenario(
+        "GET /internal/pool",
+        lambda dataset, rng, _: Call("GET", "/internal/pool"),
+    ),
+    Scenario(
+        "GET /metrics",
+        lambda dataset, rng, _: Call("GET", "/metrics"),
+    ),
+]
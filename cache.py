@@ -0,0 +1,113 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Protocol
+
+CACHE_URL = os.getenv("CACHE_URL")
+CACHE_TTL = int(os.getenv("CACHE_TTL", 300))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", 1024))
+
+
+class Cache(Protocol):
+    def get(self, key: str) -> bytes | None: ...
+
+    def set(self, key: str, value: bytes, ttl: int) -> None: ...
+
+    def get_counter(self, key: str) -> int: ...
+
+    def incr(self, key: str) -> int: ...
+
+    def clear(self) -> None: ...
+
+
+class MemoryCache:
+    """
+    In-process LRU cache whose entries also expire after their TTL. It is only
+    invalidated by writes made in the same process, so use `RedisCache` when
+    running more than one
+    """
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        # Counters are kept apart from the entries so they are never evicted
+        self._counters: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes, ttl: int) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_counter(self, key: str) -> int:
+        with self._lock:
+            return self._counters.get(key, 0)
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._counters.clear()
+
+
+class RedisCache:
+    """
+    Cache shared by every process through a Redis-compatible client
+    """
+
+    def __init__(self, client, prefix: str = "medspa:"):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key: str) -> bytes | None:
+        return self.client.get(self.prefix + key)
+
+    def set(self, key: str, value: bytes, ttl: int) -> None:
+        self.client.set(self.prefix + key, value, ex=ttl)
+
+    def get_counter(self, key: str) -> int:
+        return int(self.client.get(self.prefix + key) or 0)
+
+    def incr(self, key: str) -> int:
+        return self.client.incr(self.prefix + key)
+
+    def clear(self) -> None:
+        keys = list(self.client.scan_iter(match=self.prefix + "*"))
+        if keys:
+            self.client.delete(*keys)
+
+
+@lru_cache
+def get_cache() -> Cache:
+    """
+    Get the cache configured by CACHE_URL, or an in-process one when unset
+    """
+    if CACHE_URL:
+        import redis
+
+        return RedisCache(redis.Redis.from_url(CACHE_URL))
+
+    return MemoryCache()
@@ -0,0 +1,126 @@
+import hashlib
+import re
+from typing import Annotated, Any, Awaitable, Callable
+from fastapi import Depends, Header, HTTPException, Request, Response
+import orjson
+from pydantic_core import to_jsonable_python
+from pagination import Page
+
+
+def compute_etag(content: Any) -> str:
+    """
+    Compute a weak ETag from the JSON representation of a response content
+    """
+    # Keys are sorted because rows loaded by the ORM and rows rebuilt from the
+    # cache do not list their attributes in the same order
+    payload = orjson.dumps(to_jsonable_python(content), option=orjson.OPT_SORT_KEYS)
+    digest = hashlib.blake2b(payload, digest_size=16).hexdigest()
+    return f'W/"{digest}"'
+
+
+def fingerprint(value: Any) -> str:
+    return hashlib.blake2b(orjson.dumps(value), digest_size=16).hexdigest()
+
+
+def version_etag(version: int, related: Any = None) -> str:
+    """
+    Get the strong ETag of a row version, which PATCH routes accept in If-Match.
+    Rows embedded in the response, whose versions are given as `related`, are
+    added after a dot so that their changes also change the ETag.
+    """
+    if related is None:
+        return f'"{version}"'
+
+    return f'"{version}.{fingerprint(related)}"'
+
+
+# The columns that the ETag of a list is computed from
+LIST_ETAG_FIELDS = ["id", "version"]
+
+
+def list_etag(request: Request, versions: list[dict]) -> str:
+    """
+    Get the weak ETag of a list from the id and version of its rows, which a
+    narrow query can fetch without loading or serializing the rows themselves.
+    The query string is part of it, as it selects the fields and the page.
+    """
+    rows = [(row["id"], row["version"]) for row in versions]
+    return f'W/"{fingerprint([str(request.url.query), rows])}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """
+    Check an ETag against the If-None-Match header, using weak comparison
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+
+    if if_none_match.strip() == "*":
+        return True
+
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag.removeprefix("W/") in tags
+
+
+def check_etag(
+    request: Request, response: Response, content: Any = None, etag: str | None = None
+) -> None:
+    """
+    Set the ETag of a response, computed from its content unless given, and
+    answer with 304 Not Modified when the client already has this version
+    """
+    etag = etag or compute_etag(content)
+    response.headers["ETag"] = etag
+
+    if etag_matches(request, etag):
+        raise HTTPException(status_code=304, headers={"ETag": etag})
+
+
+async def get_page_with_etag(
+    request: Request,
+    response: Response,
+    fields: list[str],
+    get_page: Callable[[list[str]], Awaitable[Page[dict]]],
+) -> Page[dict]:
+    """
+    Load a page of projected rows and set its list ETag. A conditional request
+    first fetches only the row versions and gets 304 when they still match,
+    without loading the page.
+    """
+    if request.headers.get("if-none-match"):
+        versions = await get_page(LIST_ETAG_FIELDS)
+        check_etag(request, response, etag=list_etag(request, versions.items))
+
+    page = await get_page(list(dict.fromkeys([*fields, *LIST_ETAG_FIELDS])))
+    response.headers["ETag"] = list_etag(request, page.items)
+
+    # The version was only loaded for the ETag
+    if "version" not in fields:
+        for item in page.items:
+            del item["version"]
+
+    return page
+
+
+# A strong ETag made by `version_etag`, whose version comes before any dot
+IF_MATCH_VERSION = re.compile(r'"(\d+)(?:\.[0-9a-f]+)?"')
+
+
+def get_if_match(if_match: Annotated[str | None, Header()] = None) -> int | None:
+    """
+    Read the row version required by an If-Match header, or None when any
+    version may be updated
+    """
+    if if_match is None or if_match.strip() == "*":
+        return None
+
+    # Only a strong ETag of a version can match, never a weak one
+    match = IF_MATCH_VERSION.fullmatch(if_match.strip())
+    if match is None:
+        raise HTTPException(status_code=412, detail="If-Match does not match")
+
+    return int(match[1])
+
+
+IfMatchDep = Annotated[int | None, Depends(get_if_match)]
@@ -1,7 +1,11 @@
 import pytest
 from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
 from sqlmodel import SQLModel, create_engine, Session
-from database import get_session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from cache import get_cache
+from database import get_async_session, get_session
 from main import app
 
 
@@ -15,6 +19,17 @@ def engine_fixture():
     SQLModel.metadata.drop_all(engine)
 
 
+@pytest.fixture(name="async_engine")
+def async_engine_fixture(engine):
+    # The test client runs each request on its own event loop, so connections
+    # must not be pooled across requests
+    async_engine = create_async_engine(
+        "sqlite+aiosqlite:///./test.db", poolclass=NullPool
+    )
+    yield async_engine
+    async_engine.sync_engine.dispose()
+
+
 @pytest.fixture(name="session")
 def session_fixture(engine):
     with Session(engine) as session:
@@ -22,11 +37,23 @@ def session_fixture(engine):
 
 
 @pytest.fixture(name="client")
-def client_fixture(session):
+def client_fixture(session, async_engine):
     def get_session_override():
         yield session
 
+    async def get_async_session_override():
+        async with AsyncSession(async_engine, expire_on_commit=False) as session:
+            yield session
+
     app.dependency_overrides[get_session] = get_session_override
+    app.dependency_overrides[get_async_session] = get_async_session_override
     client = TestClient(app)
     yield client
     app.dependency_overrides.clear()
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    get_cache().clear()
+    yield
+    get_cache().clear()
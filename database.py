@@ -1,13 +1,193 @@
-from typing import Annotated
-from fastapi import Depends
+import contextlib
+import itertools
+import sqlite3
+import threading
+import time
+from typing import Annotated, AsyncIterator, Literal
+from fastapi import Depends, Request, Response
+from sqlalchemy import Engine, event, exc
+from sqlalchemy.dialects.sqlite.aiosqlite import AsyncAdapt_aiosqlite_connection
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from sqlmodel import create_engine, SQLModel, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 from dotenv import load_dotenv
 import os
+import metrics
 
 load_dotenv()
 
+# Async driver used for each database backend when ASYNC_DATABASE_URL is not set
+ASYNC_DRIVERS = {
+    "postgresql": "asyncpg",
+    "sqlite": "aiosqlite",
+}
+
+
+def get_async_database_url(database_url: str) -> str:
+    """
+    Build the async URL for a database URL by swapping in the async driver
+    of its backend
+    """
+    url = make_url(database_url)
+    backend = url.get_backend_name()
+    return url.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}").render_as_string(
+        hide_password=False
+    )
+
+
 DATABASE_URL = os.getenv("DATABASE_URL")
-engine = create_engine(DATABASE_URL)
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or get_async_database_url(
+    DATABASE_URL
+)
+
+# Read replicas that GET requests are spread across, comma-separated
+DATABASE_REPLICA_URLS = [
+    url.strip()
+    for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",")
+    if url.strip()
+]
+REPLICA_BALANCING = os.getenv("DB_REPLICA_BALANCING", "round_robin")
+# How long, in seconds, a client keeps reading from the primary after a write,
+# so that it sees its own writes despite the replication lag
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", 5))
+
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+POOL_MAX_OVERFLOW = int(os.getenv("DB_POOL_MAX_OVERFLOW", 10))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+# Fly machines auto-stop, so connections are recycled and pinged before use
+# instead of failing on the first query after a restart
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+
+class PoolStatsMixin:
+    """
+    Record how many checkouts a pool served, how long callers waited for a
+    connection and how many gave up after `pool_timeout`
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            with self._stats_lock:
+                self.checkouts += 1
+                self.wait_time_total += waited
+                self.wait_time_max = max(self.wait_time_max, waited)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "size": self.size(),
+                "checked_in": self.checkedin(),
+                "checked_out": self.checkedout(),
+                "overflow": self.overflow(),
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_time_total": self.wait_time_total,
+                "wait_time_max": self.wait_time_max,
+            }
+
+
+class StatsQueuePool(PoolStatsMixin, QueuePool):
+    pass
+
+
+class StatsAsyncAdaptedQueuePool(PoolStatsMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def get_pool_options() -> dict:
+    """
+    Get the connection pool settings shared by the sync and async engines
+    """
+    return {
+        "pool_size": POOL_SIZE,
+        "max_overflow": POOL_MAX_OVERFLOW,
+        "pool_timeout": POOL_TIMEOUT,
+        "pool_recycle": POOL_RECYCLE,
+        "pool_pre_ping": POOL_PRE_PING,
+    }
+
+
+def get_pool_stats(engine: Engine) -> dict:
+    """
+    Get the current usage of the connection pool of an engine
+    """
+    pool = engine.pool
+    if isinstance(pool, PoolStatsMixin):
+        return pool.stats()
+
+    return {"status": pool.status()}
+
+
+engine = create_engine(DATABASE_URL, poolclass=StatsQueuePool, **get_pool_options())
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL, poolclass=StatsAsyncAdaptedQueuePool, **get_pool_options()
+)
+
+replica_engines = [
+    create_async_engine(
+        get_async_database_url(url),
+        poolclass=StatsAsyncAdaptedQueuePool,
+        **get_pool_options(),
+    )
+    for url in DATABASE_REPLICA_URLS
+]
+
+
+# Engine-wide hooks, so they also count the statements of any other engine
+# such as the ones of the tests
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def start_statement_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("statement_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def record_statement(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["statement_started"].pop()
+    metrics.record_statement(time.perf_counter() - started)
+
+
+@event.listens_for(Engine, "handle_error")
+def discard_statement_timer(context):
+    if context.connection is not None:
+        context.connection.info.get("statement_started", [None]).pop()
+
+
+@event.listens_for(Engine, "commit")
+def record_commit(conn):
+    metrics.record_commit()
+
+
+@event.listens_for(Engine, "connect")
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    # SQLite ignores foreign keys, and so their ON DELETE CASCADE, unless
+    # every connection turns them on
+    if isinstance(
+        dbapi_connection, (sqlite3.Connection, AsyncAdapt_aiosqlite_connection)
+    ):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
 
 
 def init_db():
@@ -25,4 +205,94 @@ def get_session():
         yield session
 
 
+# Cookie holding the time until which a client that wrote reads from the primary
+READ_PRIMARY_COOKIE = "read_primary_until"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+class ReplicaRouter:
+    """
+    Send the sessions of GET requests to the read replicas and every other
+    one to the primary. Replicas are picked in turn, or by the fewest sessions
+    in flight with `least_connections`. After a write the client gets a cookie
+    that keeps its reads on the primary for `sticky_seconds`.
+    """
+
+    def __init__(
+        self,
+        primary: AsyncEngine,
+        replicas: list[AsyncEngine],
+        balancing: Literal["round_robin", "least_connections"] = "round_robin",
+        sticky_seconds: float = READ_YOUR_WRITES_SECONDS,
+    ):
+        if balancing not in ("round_robin", "least_connections"):
+            raise ValueError(f"Unknown replica balancing: {balancing}")
+
+        self.primary = primary
+        self.replicas = replicas
+        self.balancing = balancing
+        self.sticky_seconds = sticky_seconds
+        self.in_flight = [0] * len(replicas)
+        self._turns = itertools.count()
+
+    def choose_replica(self) -> int:
+        if self.balancing == "least_connections":
+            return min(range(len(self.replicas)), key=self.in_flight.__getitem__)
+
+        return next(self._turns) % len(self.replicas)
+
+    def reads_primary(self, request: Request) -> bool:
+        """
+        Whether a client is still within the read-your-writes window of its
+        last write
+        """
+        try:
+            until = float(request.cookies.get(READ_PRIMARY_COOKIE, 0))
+        except ValueError:
+            return False
+
+        return until > time.time()
+
+    @contextlib.asynccontextmanager
+    async def session(
+        self, request: Request, response: Response
+    ) -> AsyncIterator[AsyncSession]:
+        replica = None
+        if request.method not in SAFE_METHODS:
+            response.set_cookie(
+                READ_PRIMARY_COOKIE,
+                str(time.time() + self.sticky_seconds),
+                max_age=max(int(self.sticky_seconds), 1),
+                httponly=True,
+            )
+        elif self.replicas and not self.reads_primary(request):
+            replica = self.choose_replica()
+
+        engine = self.primary if replica is None else self.replicas[replica]
+        if replica is not None:
+            self.in_flight[replica] += 1
+        try:
+            # Objects are returned to FastAPI after the commit, so they must not
+            # be expired or serializing them would trigger a lazy load outside
+            # the driver
+            async with AsyncSession(engine, expire_on_commit=False) as session:
+                yield session
+        finally:
+            if replica is not None:
+                self.in_flight[replica] -= 1
+
+
+replica_router = ReplicaRouter(async_engine, replica_engines, REPLICA_BALANCING)
+
+
+async def get_async_session(request: Request, response: Response):
+    """
+    Get a new async session for the database, on a read replica for GET
+    requests
+    """
+    async with replica_router.session(request, response) as session:
+        yield session
+
+
 SessionDep = Annotated[Session, Depends(get_session)]
+AsyncSessionDep = Annotated[AsyncSession, Depends(get_async_session)]
@@ -0,0 +1,73 @@
+import csv
+import datetime
+import io
+from decimal import Decimal
+from enum import Enum
+from typing import Any, AsyncIterator
+import orjson
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def export_value(value: Any) -> Any:
+    """
+    Convert a column value the same way the API serializes it, so exports
+    match the JSON responses (e.g. prices stay "300.00")
+    """
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, Enum):
+        return value.value
+
+    return value
+
+
+def encode_decimal(value: Any) -> str:
+    if isinstance(value, Decimal):
+        return str(value)
+
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+async def to_ndjson(
+    columns: list[str], batches: AsyncIterator[list[tuple]]
+) -> AsyncIterator[bytes]:
+    """
+    Render batches of rows as newline-delimited JSON, one chunk per batch.
+    orjson encodes datetimes and enums like `export_value`, and only needs
+    help with decimals.
+    """
+    async for rows in batches:
+        yield b"".join(
+            orjson.dumps(
+                dict(zip(columns, row)),
+                default=encode_decimal,
+                option=orjson.OPT_APPEND_NEWLINE,
+            )
+            for row in rows
+        )
+
+
+async def to_csv(
+    columns: list[str], batches: AsyncIterator[list[tuple]]
+) -> AsyncIterator[str]:
+    """
+    Render batches of rows as CSV with a header line, one chunk per batch
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+
+    async for rows in batches:
+        writer.writerows([map(export_value, row) for row in rows])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
@@ -0,0 +1,33 @@
+from typing import Annotated, Any
+from fastapi import Depends, HTTPException, Query
+from sqlmodel import SQLModel
+
+
+def sparse_fields(model: type[SQLModel], *exclude: str) -> Any:
+    """
+    Build the dependency of a list endpoint that reads the comma-separated
+    `fields` query parameter into the columns to select, checked against the
+    fields of its read schema. `id` is always returned, and every field when
+    the parameter is missing.
+    """
+    names = [name for name in model.model_fields if name not in exclude]
+
+    def get_fields(
+        fields: Annotated[
+            str | None,
+            Query(description=f"Comma-separated subset of: {', '.join(names)}"),
+        ] = None,
+    ) -> list[str]:
+        if fields is None:
+            return names
+
+        requested = {name.strip() for name in fields.split(",") if name.strip()}
+        unknown = requested.difference(names)
+        if unknown:
+            raise HTTPException(
+                status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}"
+            )
+
+        return [name for name in names if name == "id" or name in requested]
+
+    return Annotated[list[str], Depends(get_fields)]
@@ -0,0 +1,153 @@
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlmodel.ext.asyncio.session import AsyncSession
+from database import async_engine
+from models import OutboxJob
+from repositories.outbox import APPOINTMENT_BOOKED, AsyncOutboxRepository
+
+logger = logging.getLogger(__name__)
+
+# Run the worker in the app process, which a deployment running it elsewhere
+# can turn off
+JOB_WORKER = os.getenv("JOB_WORKER", "true").lower() in ("1", "true", "yes")
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", 4))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 5))
+# Delay before the first retry, in seconds, doubled after every failure
+JOB_BACKOFF = float(os.getenv("JOB_BACKOFF", 2))
+# How long a claimed job is held before another worker may take it over
+JOB_LEASE = float(os.getenv("JOB_LEASE", 60))
+# How often the outbox is checked when no write has signalled new jobs
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", 5))
+
+Handler = Callable[[dict], Awaitable[None]]
+
+handlers: dict[str, Handler] = {}
+
+
+def handler(topic: str) -> Callable[[Handler], Handler]:
+    """
+    Register the function that runs the jobs of a topic
+    """
+
+    def register(function: Handler) -> Handler:
+        handlers[topic] = function
+        return function
+
+    return register
+
+
+@handler(APPOINTMENT_BOOKED)
+async def send_booking_confirmation(payload: dict) -> None:
+    # Stands in for the email or SMS provider until one is configured
+    logger.info("Booking confirmation for appointment %s", payload["appointment_id"])
+
+
+class JobWorker:
+    """
+    Drain the outbox with a bounded pool of tasks. A poller claims due jobs
+    when a write signals new ones, or every `poll_interval` to pick up retries
+    and the jobs left by a stopped machine. Failed jobs are retried with
+    exponential backoff until `max_attempts`, then kept with their last error.
+    """
+
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        concurrency: int = JOB_CONCURRENCY,
+        max_attempts: int = JOB_MAX_ATTEMPTS,
+        backoff: float = JOB_BACKOFF,
+        lease: float = JOB_LEASE,
+        poll_interval: float = JOB_POLL_INTERVAL,
+    ):
+        self.engine = engine
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.repository = AsyncOutboxRepository()
+        self.queue: asyncio.Queue[OutboxJob] = asyncio.Queue(maxsize=concurrency)
+        self.wakeup = asyncio.Event()
+        self.tasks: list[asyncio.Task] = []
+
+    def notify(self) -> None:
+        """
+        Signal that a committed write enqueued jobs
+        """
+        self.wakeup.set()
+
+    async def start(self) -> None:
+        self.tasks = [asyncio.create_task(self.poll())]
+        self.tasks += [
+            asyncio.create_task(self.work()) for _ in range(self.concurrency)
+        ]
+
+    async def stop(self) -> None:
+        # Claimed jobs that did not finish are due again after their lease
+        for task in self.tasks:
+            task.cancel()
+
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    async def claim(self) -> list[OutboxJob]:
+        async with AsyncSession(self.engine, expire_on_commit=False) as session:
+            return await self.repository.claim(session, self.concurrency, self.lease)
+
+    async def poll(self) -> None:
+        while True:
+            try:
+                jobs = await self.claim()
+            except Exception:
+                logger.exception("Failed to claim jobs")
+                jobs = []
+
+            # Waits while every task is busy, which bounds the claimed jobs
+            for job in jobs:
+                await self.queue.put(job)
+
+            if len(jobs) == self.concurrency:
+                continue
+
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.poll_interval)
+            except TimeoutError:
+                pass
+            self.wakeup.clear()
+
+    async def work(self) -> None:
+        while True:
+            job = await self.queue.get()
+            try:
+                await self.run(job)
+            except Exception:
+                logger.exception("Failed to record the outcome of job %s", job.id)
+            finally:
+                self.queue.task_done()
+
+    async def run(self, job: OutboxJob) -> None:
+        async with AsyncSession(self.engine) as session:
+            try:
+                await handlers[job.topic](job.payload)
+            except Exception as error:
+                delay = None
+                if job.attempts < self.max_attempts:
+                    delay = self.backoff * 2 ** (job.attempts - 1)
+
+                logger.warning("Job %s failed: %r", job.id, error)
+                await self.repository.retry(session, job.id, repr(error), delay)
+            else:
+                await self.repository.complete(session, job.id)
+
+    async def drain(self) -> None:
+        """
+        Run the due jobs until there are none left, without the pool
+        """
+        while jobs := await self.claim():
+            await asyncio.gather(*(self.run(job) for job in jobs))
+
+
+worker = JobWorker(async_engine)
@@ -1,8 +1,16 @@
+import os
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.middleware.gzip import GZipMiddleware
 
 from database import init_db
-from routes import medspa, services, appointments
+from jobs import JOB_WORKER, worker
+from metrics import MetricsMiddleware
+from routes import medspa, services, appointments, changes, internal
+
+# Responses smaller than this many bytes are not worth compressing
+GZIP_MINIMUM_SIZE = int(os.getenv("GZIP_MINIMUM_SIZE", 1000))
+GZIP_COMPRESS_LEVEL = int(os.getenv("GZIP_COMPRESS_LEVEL", 6))
 
 
 @asynccontextmanager
@@ -12,8 +20,14 @@ async def lifespan(app: FastAPI):
     # For production environments, you should implement a
     # proper database migration management
     init_db()
+    if JOB_WORKER:
+        await worker.start()
+
     yield
 
+    if JOB_WORKER:
+        await worker.stop()
+
 
 app = FastAPI(
     title="Medspa API",
@@ -24,6 +38,14 @@ app = FastAPI(
     lifespan=lifespan,
 )
 
+app.add_middleware(
+    GZipMiddleware, minimum_size=GZIP_MINIMUM_SIZE, compresslevel=GZIP_COMPRESS_LEVEL
+)
+# Added last so that it runs first and also times the compression
+app.add_middleware(MetricsMiddleware)
+
 app.include_router(medspa.router, prefix="/v1")
 app.include_router(services.router, prefix="/v1")
 app.include_router(appointments.router, prefix="/v1")
+app.include_router(changes.router, prefix="/v1")
+app.include_router(internal.router)
@@ -0,0 +1,199 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+SERVER_TIMING = os.getenv("SERVER_TIMING", "false").lower() in ("1", "true", "yes")
+
+# Upper bounds, in seconds, of the request latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class RequestMetrics:
+    """
+    Database work done while handling the current request
+    """
+
+    def __init__(self):
+        self.statements = 0
+        self.sql_time = 0.0
+        self.commits = 0
+
+
+# Set by the middleware for each request. The object itself is shared, so the
+# engine events still reach it from the threads and greenlets that copy the
+# context to run the queries.
+current_request: ContextVar[RequestMetrics | None] = ContextVar(
+    "current_request", default=None
+)
+
+
+def record_statement(duration: float) -> None:
+    metrics = current_request.get()
+    if metrics is not None:
+        metrics.statements += 1
+        metrics.sql_time += duration
+
+
+def record_commit() -> None:
+    metrics = current_request.get()
+    if metrics is not None:
+        metrics.commits += 1
+
+
+class RouteMetrics:
+    def __init__(self):
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.latency = 0.0
+        self.statements = 0
+        self.sql_time = 0.0
+        self.commits = 0
+
+
+def format_labels(labels: dict) -> str:
+    def escape(value: str) -> str:
+        return value.replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+    return ",".join(f'{name}="{escape(str(value))}"' for name, value in labels.items())
+
+
+class MetricsRegistry:
+    """
+    Per-route request latency histograms and database counters, rendered in
+    the Prometheus text format
+    """
+
+    def __init__(self):
+        self._routes: dict[tuple[str, str], RouteMetrics] = {}
+        self._lock = threading.Lock()
+
+    def observe(
+        self, method: str, route: str, latency: float, request: RequestMetrics
+    ) -> None:
+        with self._lock:
+            metrics = self._routes.setdefault((method, route), RouteMetrics())
+            bucket = bisect_left(LATENCY_BUCKETS, latency)
+            if bucket < len(LATENCY_BUCKETS):
+                metrics.buckets[bucket] += 1
+
+            metrics.count += 1
+            metrics.latency += latency
+            metrics.statements += request.statements
+            metrics.sql_time += request.sql_time
+            metrics.commits += request.commits
+
+    def clear(self) -> None:
+        with self._lock:
+            self._routes.clear()
+
+    def render(self) -> str:
+        with self._lock:
+            routes = sorted(self._routes.items())
+
+        lines = [
+            "# HELP http_request_duration_seconds Request latency by route",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        for (method, route), metrics in routes:
+            labels = {"method": method, "route": route}
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, metrics.buckets):
+                cumulative += count
+                bucket_labels = format_labels({**labels, "le": bound})
+                lines.append(
+                    f"http_request_duration_seconds_bucket{{{bucket_labels}}} "
+                    f"{cumulative}"
+                )
+
+            bucket_labels = format_labels({**labels, "le": "+Inf"})
+            lines += [
+                f"http_request_duration_seconds_bucket{{{bucket_labels}}} "
+                f"{metrics.count}",
+                f"http_request_duration_seconds_sum{{{format_labels(labels)}}} "
+                f"{metrics.latency}",
+                f"http_request_duration_seconds_count{{{format_labels(labels)}}} "
+                f"{metrics.count}",
+            ]
+
+        counters = [
+            ("db_statements_total", "SQL statements executed", "statements"),
+            ("db_duration_seconds_total", "Time spent executing SQL", "sql_time"),
+            ("db_commits_total", "Transactions committed", "commits"),
+        ]
+        for name, description, attribute in counters:
+            lines += [f"# HELP {name} {description} by route", f"# TYPE {name} counter"]
+            for (method, route), metrics in routes:
+                labels = format_labels({"method": method, "route": route})
+                lines.append(f"{name}{{{labels}}} {getattr(metrics, attribute)}")
+
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+def format_server_timing(latency: float, metrics: RequestMetrics) -> str:
+    return (
+        f"app;dur={latency * 1000:.1f}, "
+        f'db;dur={metrics.sql_time * 1000:.1f};desc="{metrics.statements} queries", '
+        f"commit;desc={metrics.commits}"
+    )
+
+
+def get_route_template(scope: Scope) -> str:
+    """
+    Get the path template of the route that handled a request, such as
+    `/v1/appointments/{appointment_id}`, so that each route is one series
+    """
+    route = scope.get("route")
+    if route is None:
+        return "unmatched"
+
+    # The route of an included router may only know its path relative to the
+    # router prefix, which is then taken from the leading segments of the path
+    segments = scope["path"].split("/")
+    template = route.path.split("/")
+    prefix = segments[: len(segments) - len(template) + 1]
+    return "/".join(prefix + template[1:])
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware that times each request, collects the database work done
+    for it and records both under the route template
+    """
+
+    def __init__(self, app: ASGIApp, registry: MetricsRegistry = registry):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        metrics = RequestMetrics()
+        token = current_request.set(metrics)
+        started = time.perf_counter()
+
+        async def send_with_timing(message: Message) -> None:
+            if message["type"] == "http.response.start" and SERVER_TIMING:
+                headers = MutableHeaders(scope=message)
+                latency = time.perf_counter() - started
+                headers.append("Server-Timing", format_server_timing(latency, metrics))
+
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_request.reset(token)
+            route = get_route_template(scope)
+            latency = time.perf_counter() - started
+            self.registry.observe(scope["method"], route, latency, metrics)
@@ -2,6 +2,7 @@ import datetime
 from decimal import Decimal
 from enum import Enum
 from typing import List
+from sqlalchemy import JSON, BigInteger, Index
 from sqlmodel import Field, Relationship, SQLModel
 
 
@@ -9,8 +10,11 @@ class Base(SQLModel):
     id: int | None = Field(
         default=None, primary_key=True, sa_column_kwargs={"autoincrement": True}
     )
-    created_at: datetime.datetime = Field(default=datetime.datetime.now())
-    updated_at: datetime.datetime = Field(default=datetime.datetime.now())
+    created_at: datetime.datetime = Field(default_factory=datetime.datetime.now)
+    updated_at: datetime.datetime = Field(default_factory=datetime.datetime.now)
+    # Bumped by every update and matched against If-Match, so that concurrent
+    # edits are rejected instead of overwriting each other
+    version: int = Field(default=1, sa_column_kwargs={"server_default": "1"})
 
 
 class Medspa(Base, table=True):
@@ -19,26 +23,73 @@ class Medspa(Base, table=True):
     phone_number: str
     email_address: str
 
+    # Children are deleted by the ON DELETE CASCADE of their foreign key, so
+    # deleting a medspa never has to load them
     services: List["Services"] = Relationship(
-        back_populates="medspa", cascade_delete=True
+        back_populates="medspa", cascade_delete=True, passive_deletes=True
     )
     appointments: List["Appointments"] = Relationship(
-        back_populates="medspa", cascade_delete=True
+        back_populates="medspa", cascade_delete=True, passive_deletes=True
     )
 
 
 class Services(Base, table=True):
-    medspa_id: int = Field(foreign_key="medspa.id")
+    medspa_id: int = Field(foreign_key="medspa.id", index=True, ondelete="CASCADE")
     name: str
     description: str
     price: Decimal = Field(max_digits=10, decimal_places=2)
     duration: int
     medspa: Medspa = Relationship(back_populates="services")
     appointments: List["AppointmentsServices"] = Relationship(
-        back_populates="service", cascade_delete=True
+        back_populates="service", cascade_delete=True, passive_deletes=True
     )
 
 
+class MedspaRead(SQLModel):
+    """
+    Medspa as listed, where `fields=` can leave out any field but `id`
+    """
+
+    id: int
+    created_at: datetime.datetime | None = None
+    updated_at: datetime.datetime | None = None
+    version: int | None = None
+    name: str | None = None
+    address: str | None = None
+    phone_number: str | None = None
+    email_address: str | None = None
+
+
+class ServiceRead(SQLModel):
+    """
+    Service as listed, where `fields=` can leave out any field but `id`
+    """
+
+    id: int
+    created_at: datetime.datetime | None = None
+    updated_at: datetime.datetime | None = None
+    version: int | None = None
+    medspa_id: int | None = None
+    name: str | None = None
+    description: str | None = None
+    price: Decimal | None = Field(default=None, max_digits=10, decimal_places=2)
+    duration: int | None = None
+
+
+class BulkMode(Enum):
+    # Nothing is created unless every item is valid
+    ATOMIC = "atomic"
+    # Valid items are created and the others are reported
+    BEST_EFFORT = "best_effort"
+
+
+class BulkItemResult(SQLModel):
+    index: int
+    status: int
+    id: int | None = None
+    detail: str | None = None
+
+
 class AppointmentStatus(Enum):
     SCHEDULED = "scheduled"
     COMPLETED = "completed"
@@ -51,30 +102,202 @@ class AppointmentCreate(SQLModel):
     services: List[int]
 
 
+class Availability(SQLModel):
+    medspa_id: int
+    date: datetime.date
+    duration: int
+    slots: List[datetime.datetime]
+
+
 class AppointmentUpdate(SQLModel):
     medspa_id: int | None = None
     status: AppointmentStatus | None = None
     services: List[int] | None = None
 
 
-class Appointments(Base, table=True):
-    medspa_id: int = Field(foreign_key="medspa.id")
+class AppointmentBase(Base):
+    medspa_id: int = Field(foreign_key="medspa.id", ondelete="CASCADE")
     start_time: datetime.datetime
     total_price: Decimal = Field(max_digits=10, decimal_places=2)
     total_duration: int
     status: AppointmentStatus = Field(default=AppointmentStatus.SCHEDULED)
 
+
+class Appointments(AppointmentBase, table=True):
+    __table_args__ = (
+        # Keyset pagination and the date filters order and seek on start_time
+        Index("ix_appointments_start_time_id", "start_time", "id"),
+        # Serves the calendar of a medspa, and the overlap checks, with one
+        # range scan in page order. On PostgreSQL it also covers the calendar
+        # columns, so the scan does not visit the table.
+        Index(
+            "ix_appointments_medspa_id_start_time_id",
+            "medspa_id",
+            "start_time",
+            "id",
+            postgresql_include=["total_duration", "status", "version"],
+        ),
+        Index("ix_appointments_status_start_time", "status", "start_time"),
+    )
+
     medspa: Medspa = Relationship(back_populates="appointments")
     services: List["AppointmentsServices"] = Relationship(
-        back_populates="appointment", cascade_delete=True
+        back_populates="appointment", cascade_delete=True, passive_deletes=True
     )
 
 
+class AppointmentStats(SQLModel, table=True):
+    """
+    Daily rollup of the appointments of a medspa per status, kept up to date
+    in the same transaction as every appointment write
+    """
+
+    __tablename__ = "appointment_stats"
+
+    medspa_id: int = Field(
+        foreign_key="medspa.id", primary_key=True, ondelete="CASCADE"
+    )
+    day: datetime.date = Field(primary_key=True)
+    status: AppointmentStatus = Field(primary_key=True)
+    count: int = 0
+    revenue: Decimal = Field(default=Decimal(0), max_digits=12, decimal_places=2)
+    booked_minutes: int = 0
+
+
+class AppointmentRead(SQLModel):
+    """
+    Appointment as listed, where `fields=` can leave out any field but `id`
+    """
+
+    id: int
+    created_at: datetime.datetime | None = None
+    updated_at: datetime.datetime | None = None
+    version: int | None = None
+    medspa_id: int | None = None
+    start_time: datetime.datetime | None = None
+    total_price: Decimal | None = Field(default=None, max_digits=10, decimal_places=2)
+    total_duration: int | None = None
+    status: AppointmentStatus | None = None
+    # Only set with include=services
+    services: List[ServiceRead] | None = None
+
+
+class CalendarEntry(SQLModel):
+    """
+    Compact appointment of a calendar view
+    """
+
+    id: int
+    start_time: datetime.datetime
+    total_duration: int
+    status: AppointmentStatus
+
+
+class AppointmentWithServices(AppointmentBase):
+    services: List[Services] | None = None
+
+    @classmethod
+    def from_row(
+        cls, appointment: Appointments, services: List[Services] | None
+    ) -> "AppointmentWithServices":
+        """
+        Build the response of an appointment from its column values, which
+        validates about twice as fast as reading the ORM row from attributes
+        """
+        values = {
+            name: getattr(appointment, name) for name in AppointmentBase.model_fields
+        }
+        return cls.model_validate({**values, "services": services})
+
+
 class AppointmentsServices(Base, table=True):
     __tablename__ = "appointments_services"
+    __table_args__ = (
+        # Also serves the lookups by appointment_id, as its leading column
+        Index(
+            "ux_appointments_services_appointment_id_service_id",
+            "appointment_id",
+            "service_id",
+            unique=True,
+        ),
+    )
 
-    appointment_id: int = Field(foreign_key="appointments.id")
-    service_id: int = Field(foreign_key="services.id")
+    appointment_id: int = Field(foreign_key="appointments.id", ondelete="CASCADE")
+    service_id: int = Field(foreign_key="services.id", index=True, ondelete="CASCADE")
 
     appointment: List["Appointments"] = Relationship(back_populates="services")
     service: List["Services"] = Relationship(back_populates="appointments")
+
+
+class IdempotencyKey(SQLModel, table=True):
+    """
+    Response of a request sent with an Idempotency-Key header, replayed to the
+    retries of that request until it expires
+    """
+
+    __tablename__ = "idempotency_keys"
+
+    key: str = Field(primary_key=True, max_length=255)
+    # Fingerprint of the request body, a key cannot be reused for another one
+    request_hash: str
+    status_code: int | None = None
+    response: dict | None = Field(default=None, sa_type=JSON)
+    created_at: datetime.datetime = Field(default_factory=datetime.datetime.now)
+    expires_at: datetime.datetime = Field(index=True)
+
+
+class OutboxJob(SQLModel, table=True):
+    """
+    Side effect of a write, such as a booking confirmation, recorded in the
+    same transaction as the write and run afterwards by the job worker
+    """
+
+    __tablename__ = "outbox"
+
+    id: int | None = Field(default=None, primary_key=True)
+    topic: str
+    payload: dict = Field(default_factory=dict, sa_type=JSON)
+    # Attempts started so far, counted when the job is claimed
+    attempts: int = 0
+    # When the job is next due, or None once it gave up after its last attempt
+    available_at: datetime.datetime | None = Field(
+        default_factory=datetime.datetime.now, index=True
+    )
+    last_error: str | None = None
+    created_at: datetime.datetime = Field(default_factory=datetime.datetime.now)
+
+
+class ChangeOperation(Enum):
+    INSERT = "insert"
+    UPDATE = "update"
+    DELETE = "delete"
+
+
+class Change(SQLModel, table=True):
+    """
+    Insert, update or delete of a row of the catalog or of an appointment. The
+    feed is ordered by (transaction_id, seq), which is commit order once every
+    older transaction has ended.
+    """
+
+    __tablename__ = "changes"
+    __table_args__ = (
+        # The feed seeks on its order, over every table or within one
+        Index("ix_changes_transaction_id_seq", "transaction_id", "seq"),
+        Index(
+            "ix_changes_table_name_transaction_id_seq",
+            "table_name",
+            "transaction_id",
+            "seq",
+        ),
+    )
+
+    seq: int | None = Field(default=None, primary_key=True)
+    transaction_id: int = Field(default=0, sa_type=BigInteger)
+    table_name: str
+    row_id: int
+    operation: ChangeOperation
+    version: int | None = None
+    # The row as written, None for deletes
+    data: dict | None = Field(default=None, sa_type=JSON(none_as_null=True))
+    created_at: datetime.datetime = Field(default_factory=datetime.datetime.now)
@@ -0,0 +1,69 @@
+import base64
+import datetime
+import json
+import os
+from typing import Annotated, Any, Generic, NamedTuple, TypeVar
+from fastapi import Depends, HTTPException, Query
+
+DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", 50))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", 200))
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+ItemType = TypeVar("ItemType")
+
+
+class Page(NamedTuple, Generic[ItemType]):
+    items: list[ItemType]
+    next_cursor: str | None
+
+
+class PageParams(NamedTuple):
+    limit: int
+    cursor: str | None
+
+
+def get_page_params(
+    limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE,
+    cursor: str | None = None,
+) -> PageParams:
+    """
+    Read the page size and the opaque cursor from the query string
+    """
+    return PageParams(limit=limit, cursor=cursor)
+
+
+PageDep = Annotated[PageParams, Depends(get_page_params)]
+
+
+def encode_cursor(values: list[Any]) -> str:
+    """
+    Encode the keyset values of the last row of a page into an opaque cursor
+    """
+    payload = [
+        value.isoformat() if isinstance(value, datetime.datetime) else value
+        for value in values
+    ]
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, types: list[type]) -> list[Any]:
+    """
+    Decode a cursor produced by `encode_cursor` back into typed keyset values
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded))
+
+        if not isinstance(payload, list) or len(payload) != len(types):
+            raise ValueError("cursor does not match the sort key")
+
+        return [
+            datetime.datetime.fromisoformat(value)
+            if python_type is datetime.datetime
+            else python_type(value)
+            for value, python_type in zip(payload, types)
+        ]
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail="Invalid cursor") from e
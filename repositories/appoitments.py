@@ -1,31 +1,544 @@
-from datetime import datetime
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from typing import AsyncIterator, Iterator
+from fastapi import HTTPException
+from sqlalchemy import delete, exists
 from sqlmodel import Session, select
-from .base import BaseRepository
-from models import Appointments
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlmodel.sql.expression import Select, SelectOfScalar
+from .appoitments_services import AppointmentsServicesRepository
+from .base import (
+    AsyncBaseRepository,
+    BaseRepository,
+    insert_changes,
+    raise_for_bulk_results,
+)
+from .outbox import APPOINTMENT_BOOKED, OutboxRepository
+from .services import rejected_services_detail
+from .stats import (
+    STATS_COLUMNS,
+    StatsDeltas,
+    apply_stats,
+    collect_stats,
+    get_stats_values,
+)
+from models import (
+    AppointmentCreate,
+    CalendarEntry,
+    AppointmentStatus,
+    AppointmentWithServices,
+    Appointments,
+    AppointmentsServices,
+    BulkItemResult,
+    BulkMode,
+    ChangeOperation,
+    Medspa,
+    OutboxJob,
+    Services,
+)
+from pagination import Page
+from scheduling import MAX_APPOINTMENT_DURATION, Interval, merge_intervals, overlaps
+
+CALENDAR_FIELDS = list(CalendarEntry.model_fields)
 
 
 class AppointmentsRepository(BaseRepository[Appointments]):
+    cursor_columns = ("start_time", "id")
+    track_changes = True
+
     def __init__(self):
         super().__init__(Appointments)
+        self.links_repository = AppointmentsServicesRepository()
+        self.outbox_repository = OutboxRepository()
+
+    def bulk_create_and_flush(
+        self, session: Session, items: list[Appointments]
+    ) -> list[Appointments]:
+        appointments = super().bulk_create_and_flush(session, items)
+
+        # A bulk insert does not emit the mapper events that keep the daily
+        # rollup up to date, so the whole batch is recorded with one upsert
+        deltas: StatsDeltas = {}
+        for appointment in appointments:
+            collect_stats(deltas, get_stats_values(appointment), 1)
+
+        apply_stats(session.connection(), deltas)
+        return appointments
+
+    def update_and_flush(
+        self,
+        session: Session,
+        id: int,
+        item: Appointments,
+        version: int | None = None,
+    ) -> Appointments:
+        """
+        Update an appointment and move it between the rows of the daily rollup.
+        The update is made conditional on the version of the loaded appointment,
+        so the values it replaces cannot have changed in between.
+        """
+        # Served from the identity map when the caller already loaded it
+        previous = session.get(self.model, id)
+        if previous is None:
+            raise HTTPException(status_code=404, detail="Appointments not found")
+
+        if version is not None and version != previous.version:
+            self.raise_version_mismatch()
+
+        old_values = get_stats_values(previous)
+        try:
+            appointment = super().update_and_flush(session, id, item, previous.version)
+        except HTTPException as error:
+            # Without If-Match the client asked for no precondition, the row
+            # was changed by another request while this one was running
+            if version is None and error.status_code == 412:
+                raise HTTPException(
+                    status_code=409, detail="Appointments was modified concurrently"
+                )
+            raise
+
+        # An UPDATE statement does not emit the mapper events either
+        new_values = get_stats_values(appointment)
+        if new_values != old_values:
+            deltas: StatsDeltas = {}
+            collect_stats(deltas, old_values, -1)
+            collect_stats(deltas, new_values, 1)
+            apply_stats(session.connection(), deltas)
+
+        return appointment
+
+    def delete_and_flush(self, session: Session, id: int) -> None:
+        """
+        Delete an appointment with a single DELETE ... RETURNING of the columns
+        the daily rollup needs, since the statement skips the mapper events
+        """
+        columns = [getattr(self.model, name) for name in STATS_COLUMNS]
+        query = delete(self.model).where(self.model.id == id).returning(*columns)
+        row = session.execute(query).first()
+        if row is None:
+            raise HTTPException(status_code=404, detail="Appointments not found")
+
+        deltas: StatsDeltas = {}
+        collect_stats(deltas, row._asdict(), -1)
+        apply_stats(session.connection(), deltas)
+        row = {"table_name": self.model.__tablename__, "row_id": id}
+        insert_changes(session, ChangeOperation.DELETE, [row])
+
+    def get_start_time_bounds(
+        self,
+        date: date | None = None,
+        from_date: date | None = None,
+        to_date: date | None = None,
+    ) -> tuple[datetime | None, datetime | None]:
+        """
+        Combine the date filters into a single half-open [start, end) range on
+        start_time. `date` is one whole day and `to_date` includes its whole
+        day, so a range that ends on a date stops at the next midnight.
+        """
+        starts = [day for day in (date, from_date) if day]
+        ends = [day + timedelta(days=1) for day in (date, to_date) if day]
+
+        start = datetime.combine(max(starts), time()) if starts else None
+        end = datetime.combine(min(ends), time()) if ends else None
+        return start, end
+
+    def filter_query(self, query: SelectOfScalar, **filters) -> SelectOfScalar:
+        """
+        Compose the appointment filters into one query. Date filters become a
+        single range on start_time so the (.., start_time) indexes can serve it,
+        `service_id` becomes an EXISTS on the join table and any other key is
+        an equality on its column.
+        """
+        filters = dict(filters)
+        start, end = self.get_start_time_bounds(
+            filters.pop("date", None),
+            filters.pop("from_date", None),
+            filters.pop("to_date", None),
+        )
+
+        if start:
+            query = query.where(self.model.start_time >= start)
 
-    def filter_date_query(self, date: datetime.date):
-        start_datetime = datetime.combine(date, datetime.min.time())
-        end_datetime = datetime.combine(date, datetime.max.time())
+        if end:
+            query = query.where(self.model.start_time < end)
 
-        query = select(self.model).filter(
-            self.model.start_time.between(start_datetime, end_datetime)
+        service_id = filters.pop("service_id", None)
+        if service_id is not None:
+            query = query.where(
+                exists().where(
+                    AppointmentsServices.appointment_id == self.model.id,
+                    AppointmentsServices.service_id == service_id,
+                )
+            )
+
+        return super().filter_query(query, **filters)
+
+    def export_query(self, **filters) -> Select:
+        """
+        Select the plain columns of the filtered appointments, without ORM
+        objects, in a stable order
+        """
+        columns = list(self.model.__table__.columns)
+        query = self.filter_query(select(*columns), **filters)
+        return query.order_by(self.model.start_time, self.model.id)
+
+    def stream_batches(
+        self, session: Session, batch_size: int, **filters
+    ) -> Iterator[list[tuple]]:
+        """
+        Stream the filtered appointments in batches from a server-side cursor
+        """
+        query = self.export_query(**filters).execution_options(yield_per=batch_size)
+        yield from session.exec(query).partitions()
+
+    def get_calendar(
+        self,
+        session: Session,
+        medspa_id: int,
+        limit: int,
+        cursor: str | None = None,
+        fields: list[str] = CALENDAR_FIELDS,
+        **filters,
+    ) -> Page[dict]:
+        """
+        Get a page of the calendar of a medspa. The equality on medspa_id and
+        the range on start_time are a single range scan on the
+        (medspa_id, start_time, id) index, which is already in page order.
+        """
+        return self.get_page(
+            session, limit, cursor, fields, medspa_id=medspa_id, **filters
         )
 
-        return query
+    def get_schedules(
+        self,
+        session: Session,
+        medspa_ids: list[int],
+        start: datetime,
+        end: datetime,
+        exclude_id: int | None = None,
+    ) -> dict[int, list[Interval]]:
+        """
+        Get the merged busy periods of each medspa that overlap [start, end),
+        from range scans on (medspa_id, start_time) in a single query
+        """
+        query = select(
+            self.model.medspa_id, self.model.start_time, self.model.total_duration
+        ).where(
+            self.model.medspa_id.in_(medspa_ids),
+            self.model.start_time >= start - MAX_APPOINTMENT_DURATION,
+            self.model.start_time < end,
+            self.model.status != AppointmentStatus.CANCELLED,
+        )
+        if exclude_id is not None:
+            query = query.where(self.model.id != exclude_id)
 
-    def get_all(self, session: Session, **filters) -> list[Appointments]:
-        query = select(self.model)
+        intervals = defaultdict(list)
+        for medspa_id, start_time, duration in session.exec(query):
+            end_time = start_time + timedelta(minutes=duration)
+            if end_time > start and end_time > start_time:
+                intervals[medspa_id].append((start_time, end_time))
+
+        return {
+            medspa_id: merge_intervals(intervals[medspa_id]) for medspa_id in medspa_ids
+        }
+
+    def get_busy_intervals(
+        self,
+        session: Session,
+        medspa_id: int,
+        start: datetime,
+        end: datetime,
+        exclude_id: int | None = None,
+    ) -> list[Interval]:
+        """
+        Get the merged busy periods of a medspa that overlap [start, end)
+        """
+        schedules = self.get_schedules(session, [medspa_id], start, end, exclude_id)
+        return schedules[medspa_id]
+
+    def lock_schedules(self, session: Session, medspa_ids: list[int]) -> set[int]:
+        """
+        Lock the rows of the given medspas until the caller commits, so that
+        concurrent bookings of a medspa are serialized and cannot both pass an
+        overlap check. Rows are locked in id order to avoid deadlocks. Returns
+        the ids of the medspas that exist.
+        """
+        query = (
+            select(Medspa.id)
+            .where(Medspa.id.in_(medspa_ids))
+            .order_by(Medspa.id)
+            .with_for_update()
+        )
+        return set(session.exec(query))
 
-        if filters:
-            for key, value in filters.items():
-                if key == "date":
-                    query = self.filter_date_query(value)
+    def check_availability(
+        self,
+        session: Session,
+        medspa_id: int,
+        start_time: datetime,
+        duration: int,
+        exclude_id: int | None = None,
+    ) -> None:
+        """
+        Reject a booking that overlaps another one of the same medspa, with
+        the medspa locked until the caller commits
+        """
+        self.lock_schedules(session, [medspa_id])
+
+        end_time = start_time + timedelta(minutes=duration)
+        busy = self.get_busy_intervals(
+            session, medspa_id, start_time, end_time, exclude_id
+        )
+        if overlaps(busy, start_time, end_time):
+            raise HTTPException(
+                status_code=409, detail="Appointment overlaps an existing booking"
+            )
+
+    def bulk_book(
+        self, session: Session, bookings: list[AppointmentCreate], mode: BulkMode
+    ) -> list[BulkItemResult]:
+        """
+        Book many appointments with a fixed number of queries: one to lock and
+        check the medspas, one for the services, one for the schedules and one
+        multi-row insert each for the appointments, their service links and
+        their jobs.
+        Each booking is also checked against the ones before it in the batch.
+        """
+        medspa_ids = list({booking.medspa_id for booking in bookings})
+        existing = self.lock_schedules(session, medspa_ids)
+
+        service_ids = {id for booking in bookings for id in booking.services}
+        services = {
+            service.id: service
+            for service in session.exec(
+                select(Services).where(Services.id.in_(service_ids))
+            )
+        }
+
+        start = min((booking.start_time for booking in bookings), default=None)
+        end = max((booking.start_time for booking in bookings), default=None)
+        schedules = {}
+        if start:
+            # Widened by the longest possible booking to cover every end time
+            schedules = self.get_schedules(
+                session, list(existing), start, end + MAX_APPOINTMENT_DURATION
+            )
+
+        results, booked = [], []
+        for index, booking in enumerate(bookings):
+            if booking.medspa_id not in existing:
+                results.append(
+                    BulkItemResult(index=index, status=404, detail="Medspa not found")
+                )
+                continue
+
+            # Only services of the selected medspa can be booked, like a single
+            # booking
+            booking_services, rejected = [], []
+            for id in dict.fromkeys(booking.services):
+                if id in services and services[id].medspa_id == booking.medspa_id:
+                    booking_services.append(services[id])
                 else:
-                    query = query.where(getattr(self.model, key) == value)
+                    rejected.append(id)
+
+            if rejected:
+                results.append(
+                    BulkItemResult(
+                        index=index,
+                        status=422,
+                        detail=rejected_services_detail(booking.medspa_id, rejected),
+                    )
+                )
+                continue
+
+            duration = sum(service.duration for service in booking_services)
+            end_time = booking.start_time + timedelta(minutes=duration)
+
+            busy = schedules[booking.medspa_id]
+            if overlaps(busy, booking.start_time, end_time):
+                results.append(
+                    BulkItemResult(
+                        index=index,
+                        status=409,
+                        detail="Appointment overlaps an existing booking",
+                    )
+                )
+                continue
+
+            schedules[booking.medspa_id] = merge_intervals(
+                [*busy, (booking.start_time, end_time)]
+            )
+            appointment = Appointments(
+                medspa_id=booking.medspa_id,
+                start_time=booking.start_time,
+                total_price=sum(service.price for service in booking_services),
+                total_duration=duration,
+                status=AppointmentStatus.SCHEDULED,
+            )
+            result = BulkItemResult(index=index, status=201)
+            results.append(result)
+            booked.append((result, appointment, booking_services))
+
+        raise_for_bulk_results(results, mode)
+
+        appointments = self.bulk_create_and_flush(
+            session, [appointment for _, appointment, _ in booked]
+        )
+        links = [
+            AppointmentsServices(appointment_id=appointment.id, service_id=service.id)
+            for appointment, (_, _, booking_services) in zip(appointments, booked)
+            for service in booking_services
+        ]
+        self.links_repository.bulk_create_and_flush(session, links)
+        self.outbox_repository.bulk_create_and_flush(
+            session,
+            [
+                OutboxJob(
+                    topic=APPOINTMENT_BOOKED, payload={"appointment_id": appointment.id}
+                )
+                for appointment in appointments
+            ],
+        )
+        session.commit()
+
+        for appointment, (result, _, _) in zip(appointments, booked):
+            result.id = appointment.id
+
+        return results
+
+    def get_by_id_with_services(
+        self, session: Session, id: int
+    ) -> AppointmentWithServices:
+        """
+        Get an appointment and its services with a single joined query
+        """
+        query = (
+            select(self.model, Services)
+            .outerjoin(
+                AppointmentsServices,
+                AppointmentsServices.appointment_id == self.model.id,
+            )
+            .outerjoin(Services, Services.id == AppointmentsServices.service_id)
+            .where(self.model.id == id)
+            .order_by(AppointmentsServices.id)
+        )
+        rows = session.exec(query).all()
+
+        if not rows:
+            raise HTTPException(
+                status_code=404, detail=f"{self.model.__name__} not found"
+            )
+
+        appointment = rows[0][0]
+        services = [service for _, service in rows if service is not None]
+        return AppointmentWithServices.from_row(appointment, services)
+
+    def get_services_by_appointment_ids(
+        self, session: Session, ids: list[int]
+    ) -> dict[int, list[Services]]:
+        """
+        Get the services of many appointments with a single query, grouped by
+        appointment id
+        """
+        query = (
+            select(AppointmentsServices.appointment_id, Services)
+            .join(Services, Services.id == AppointmentsServices.service_id)
+            .where(AppointmentsServices.appointment_id.in_(ids))
+            .order_by(AppointmentsServices.id)
+        )
+
+        services = defaultdict(list)
+        for appointment_id, service in session.exec(query):
+            services[appointment_id].append(service)
+
+        return services
+
+    def with_services(self, session: Session, appointments: list[dict]) -> list[dict]:
+        """
+        Attach their services to a page of projected appointments, using one
+        query for the whole page rather than one per appointment
+        """
+        services = self.get_services_by_appointment_ids(
+            session, [appointment["id"] for appointment in appointments]
+        )
+
+        return [
+            {**appointment, "services": services.get(appointment["id"], [])}
+            for appointment in appointments
+        ]
+
+
+class AsyncAppointmentsRepository(AsyncBaseRepository[Appointments]):
+    def __init__(self):
+        super().__init__(AppointmentsRepository())
+
+    async def stream_batches(
+        self, session: AsyncSession, batch_size: int, **filters
+    ) -> AsyncIterator[list[tuple]]:
+        # A generator cannot run through run_sync, so this one streams from the
+        # async driver directly
+        query = self.repository.export_query(**filters).execution_options(
+            yield_per=batch_size
+        )
+        result = await session.stream(query)
+        async for rows in result.partitions():
+            yield rows
+
+    async def get_calendar(
+        self,
+        session: AsyncSession,
+        medspa_id: int,
+        limit: int,
+        cursor: str | None = None,
+        fields: list[str] = CALENDAR_FIELDS,
+        **filters,
+    ) -> Page[dict]:
+        return await session.run_sync(
+            self.repository.get_calendar, medspa_id, limit, cursor, fields, **filters
+        )
+
+    async def bulk_book(
+        self,
+        session: AsyncSession,
+        bookings: list[AppointmentCreate],
+        mode: BulkMode,
+    ) -> list[BulkItemResult]:
+        return await session.run_sync(self.repository.bulk_book, bookings, mode)
+
+    async def get_busy_intervals(
+        self,
+        session: AsyncSession,
+        medspa_id: int,
+        start: datetime,
+        end: datetime,
+        exclude_id: int | None = None,
+    ) -> list[Interval]:
+        return await session.run_sync(
+            self.repository.get_busy_intervals, medspa_id, start, end, exclude_id
+        )
+
+    async def check_availability(
+        self,
+        session: AsyncSession,
+        medspa_id: int,
+        start_time: datetime,
+        duration: int,
+        exclude_id: int | None = None,
+    ) -> None:
+        await session.run_sync(
+            self.repository.check_availability,
+            medspa_id,
+            start_time,
+            duration,
+            exclude_id,
+        )
+
+    async def get_by_id_with_services(
+        self, session: AsyncSession, id: int
+    ) -> AppointmentWithServices:
+        return await session.run_sync(self.repository.get_by_id_with_services, id)
 
-        return session.exec(query).all()
+    async def with_services(
+        self, session: AsyncSession, appointments: list[dict]
+    ) -> list[dict]:
+        return await session.run_sync(self.repository.with_services, appointments)
@@ -1,6 +1,7 @@
 from sqlalchemy import delete
 from sqlmodel import Session
-from .base import BaseRepository
+from sqlmodel.ext.asyncio.session import AsyncSession
+from .base import AsyncBaseRepository, BaseRepository
 from models import AppointmentsServices
 
 
@@ -9,8 +10,21 @@ class AppointmentsServicesRepository(BaseRepository[AppointmentsServices]):
         super().__init__(AppointmentsServices)
 
     def delete_by_appointment_id(self, session: Session, appointment_id: int) -> None:
+        """
+        Delete the links of an appointment without committing, so that they can
+        be replaced in the same transaction as the appointment itself
+        """
         query = delete(AppointmentsServices).where(
             AppointmentsServices.appointment_id == appointment_id
         )
         session.exec(query)
-        session.commit()
+
+
+class AsyncAppointmentsServicesRepository(AsyncBaseRepository[AppointmentsServices]):
+    def __init__(self):
+        super().__init__(AppointmentsServicesRepository())
+
+    async def delete_by_appointment_id(
+        self, session: AsyncSession, appointment_id: int
+    ) -> None:
+        await session.run_sync(self.repository.delete_by_appointment_id, appointment_id)
@@ -1,22 +1,182 @@
+import datetime
 from typing import TypeVar, Generic, Type
 from fastapi import HTTPException
+from sqlalchemy import (
+    BigInteger,
+    ColumnElement,
+    Row,
+    Text,
+    cast,
+    delete,
+    func,
+    insert,
+    tuple_,
+    update,
+)
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlmodel import SQLModel, select, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlmodel.sql.expression import Select, SelectOfScalar
+from models import BulkItemResult, BulkMode, Change, ChangeOperation
+from pagination import Page, decode_cursor, encode_cursor
 
 ModelType = TypeVar("ModelType", bound=SQLModel)
 
+# Both dialects support INSERT ... ON CONFLICT with the same API
+UPSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def raise_for_bulk_results(results: list[BulkItemResult], mode: BulkMode) -> None:
+    """
+    Abort an atomic bulk operation, reporting every item, if any item failed
+    """
+    if mode == BulkMode.ATOMIC and any(result.status >= 400 for result in results):
+        raise HTTPException(
+            status_code=422,
+            detail=[result.model_dump(exclude_none=True) for result in results],
+        )
+
+
+def transaction_id(session: Session) -> ColumnElement[int] | int:
+    """
+    Id of the current transaction, which orders the change feed. On PostgreSQL
+    writers may commit out of the order of their seqs, so readers only return
+    the changes of transactions older than every running one. SQLite allows a
+    single writer at a time, so seq order is already commit order there.
+    """
+    if session.get_bind().dialect.name == "postgresql":
+        return cast(cast(func.pg_current_xact_id(), Text), BigInteger)
+
+    return 0
+
+
+def insert_changes(
+    session: Session, operation: ChangeOperation, rows: list[dict]
+) -> None:
+    """
+    Append changes to the feed with a single INSERT, in the same transaction.
+    Each row has the table_name and row_id, and for inserts and updates the
+    version and data of the row.
+    """
+    if not rows:
+        return
+
+    created_at = datetime.datetime.now()
+    rows = [
+        {"version": None, "data": None, **row, "created_at": created_at}
+        for row in rows
+    ]
+    query = insert(Change).values(
+        operation=operation, transaction_id=transaction_id(session)
+    )
+    session.execute(query, rows)
+
+
+def project_rows(rows: list[Row], fields: list[str]) -> list[dict]:
+    return [{name: getattr(row, name) for name in fields} for row in rows]
+
 
 class BaseRepository(Generic[ModelType]):
+    # Columns used as the keyset for cursor pagination. They must be unique
+    # together, so the primary key is always the last one.
+    cursor_columns: tuple[str, ...] = ("id",)
+    # Whether inserts, updates and deletes are recorded in the change feed
+    track_changes = False
+
     def __init__(self, model: Type[ModelType]):
         self.model = model
 
-    def get_all(self, session: Session, **filters) -> list[ModelType]:
-        query = select(self.model)
+    def record_changes(
+        self,
+        session: Session,
+        operation: ChangeOperation,
+        items: list[ModelType],
+    ) -> None:
+        """
+        Append the written rows to the change feed, in the same transaction
+        """
+        if not (self.track_changes and items):
+            return
 
-        if filters:
-            for key, value in filters.items():
-                query = query.where(getattr(self.model, key) == value)
+        rows = [
+            {
+                "table_name": self.model.__tablename__,
+                "row_id": item.id,
+                "version": item.version,
+                # Table models are not validated, so values may be of another
+                # type than their field, such as an int price
+                "data": item.model_dump(mode="json", warnings=False),
+            }
+            for item in items
+        ]
+        insert_changes(session, operation, rows)
 
-        return session.exec(query).all()
+    def filter_query(self, query: SelectOfScalar, **filters) -> SelectOfScalar:
+        for key, value in filters.items():
+            query = query.where(getattr(self.model, key) == value)
+
+        return query
+
+    def select_fields(self, fields: list[str] | None, *required: str) -> Select:
+        """
+        Select the ORM rows, or only the columns of `fields` (and `required`,
+        which the query itself needs) when given
+        """
+        if fields is None:
+            return select(self.model)
+
+        names = dict.fromkeys([*fields, *required])
+        return select(*[getattr(self.model, name) for name in names])
+
+    def get_all(
+        self, session: Session, fields: list[str] | None = None, **filters
+    ) -> list[ModelType] | list[dict]:
+        """
+        Get the filtered rows, as dicts of `fields` when a sparse fieldset is
+        requested so that the other columns are never fetched
+        """
+        query = self.filter_query(self.select_fields(fields), **filters)
+        rows = session.exec(query).all()
+        return rows if fields is None else project_rows(rows, fields)
+
+    def get_page(
+        self,
+        session: Session,
+        limit: int,
+        cursor: str | None = None,
+        fields: list[str] | None = None,
+        **filters,
+    ) -> Page[ModelType] | Page[dict]:
+        """
+        Get a page of items ordered by `cursor_columns`, starting right after
+        the row encoded in `cursor`. Seeking on the sort key instead of using
+        OFFSET keeps the cost of a page the same no matter how deep it is.
+        """
+        columns = [getattr(self.model, name) for name in self.cursor_columns]
+        query = self.select_fields(fields, *self.cursor_columns)
+        query = self.filter_query(query, **filters)
+
+        if cursor:
+            types = [column.type.python_type for column in columns]
+            values = decode_cursor(cursor, types)
+            query = query.where(tuple_(*columns) > tuple_(*values))
+
+        # Fetch one extra row to know whether there is a next page
+        query = query.order_by(*columns).limit(limit + 1)
+        items = session.exec(query).all()
+
+        next_cursor = None
+        if len(items) > limit:
+            items = items[:limit]
+            last = items[-1]
+            next_cursor = encode_cursor(
+                [getattr(last, name) for name in self.cursor_columns]
+            )
+
+        if fields is not None:
+            items = project_rows(items, fields)
+
+        return Page(items=items, next_cursor=next_cursor)
 
     def get_by_id(self, session: Session, id: int, **filters) -> ModelType:
         query = select(self.model).where(self.model.id == id)
@@ -38,8 +198,12 @@ class BaseRepository(Generic[ModelType]):
         query = select(self.model).where(self.model.id.in_(ids))
         return session.exec(query).all()
 
+    def get_existing_ids(self, session: Session, ids: list[int]) -> set[int]:
+        query = select(self.model.id).where(self.model.id.in_(ids))
+        return set(session.exec(query))
+
     def create(self, session: Session, item: ModelType) -> ModelType:
-        session.add(item)
+        self.create_and_flush(session, item)
         session.commit()
         session.refresh(item)
         return item
@@ -47,21 +211,188 @@ class BaseRepository(Generic[ModelType]):
     def create_and_flush(self, session: Session, item: ModelType) -> ModelType:
         session.add(item)
         session.flush()
+        self.record_changes(session, ChangeOperation.INSERT, [item])
         return item
 
-    def update(self, session: Session, id: int, item: ModelType) -> ModelType:
-        current_item = self.get_by_id(session, id)
-        update_data = item.model_dump(exclude_unset=True)
+    def bulk_create(self, session: Session, items: list[ModelType]) -> list[ModelType]:
+        created = self.bulk_create_and_flush(session, items)
+        session.commit()
+        return created
+
+    def bulk_create_and_flush(
+        self, session: Session, items: list[ModelType]
+    ) -> list[ModelType]:
+        """
+        Insert all items with a single multi-row INSERT ... RETURNING and get
+        back the persisted rows, instead of one round trip per item
+        """
+        if not items:
+            return []
 
-        for key, value in update_data.items():
-            setattr(current_item, key, value)
+        rows = [self._insert_values(item) for item in items]
+        query = insert(self.model).returning(self.model, sort_by_parameter_order=True)
+        created = list(session.scalars(query, rows))
+        self.record_changes(session, ChangeOperation.INSERT, created)
+        return created
 
-        session.add(current_item)
+    def _insert_values(self, item: ModelType) -> dict:
+        values = item.model_dump()
+        if values.get("id") is None:
+            values.pop("id", None)
+
+        return values
+
+    def update(
+        self, session: Session, id: int, item: ModelType, version: int | None = None
+    ) -> ModelType:
+        updated = self.update_and_flush(session, id, item, version)
         session.commit()
-        session.refresh(current_item)
-        return current_item
+        return updated
+
+    def update_and_flush(
+        self, session: Session, id: int, item: ModelType, version: int | None = None
+    ) -> ModelType:
+        """
+        Apply the fields set on `item` and bump the version with a single
+        UPDATE ... RETURNING. When `version` is given the row is only updated
+        if it still has that version, so a concurrent edit is rejected instead
+        of being overwritten.
+        """
+        values = item.model_dump(
+            exclude_unset=True, exclude={"id", "version", "created_at", "updated_at"}
+        )
+        query = update(self.model).where(self.model.id == id)
+
+        if version is not None:
+            query = query.where(self.model.version == version)
+
+        query = query.values(
+            **values,
+            version=self.model.version + 1,
+            updated_at=datetime.datetime.now(),
+        )
+        updated = session.scalars(
+            query.returning(self.model),
+            execution_options={"populate_existing": True},
+        ).first()
+
+        if updated is None:
+            # Only a failed update pays for the query telling the two cases apart
+            if version is None or not self.get_existing_ids(session, [id]):
+                raise HTTPException(
+                    status_code=404, detail=f"{self.model.__name__} not found"
+                )
+
+            self.raise_version_mismatch()
+
+        self.record_changes(session, ChangeOperation.UPDATE, [updated])
+        return updated
+
+    def raise_version_mismatch(self) -> None:
+        raise HTTPException(
+            status_code=412,
+            detail=f"{self.model.__name__} has been modified since it was read",
+        )
 
     def delete(self, session: Session, id: int) -> None:
-        item = self.get_by_id(session, id)
-        session.delete(item)
+        self.delete_and_flush(session, id)
         session.commit()
+
+    def delete_and_flush(self, session: Session, id: int) -> None:
+        """
+        Delete a row with a single DELETE ... RETURNING, without loading it.
+        Its children are removed by the ON DELETE CASCADE of their foreign keys.
+        """
+        query = delete(self.model).where(self.model.id == id)
+        if session.execute(query.returning(self.model.id)).first() is None:
+            raise HTTPException(
+                status_code=404, detail=f"{self.model.__name__} not found"
+            )
+
+        if self.track_changes:
+            row = {"table_name": self.model.__tablename__, "row_id": id}
+            insert_changes(session, ChangeOperation.DELETE, [row])
+
+
+class AsyncBaseRepository(Generic[ModelType]):
+    """
+    Async mirror of a `BaseRepository`. Every method runs the sync
+    implementation through `AsyncSession.run_sync`, so the queries are written
+    once and still go through the async driver instead of a worker thread.
+    """
+
+    def __init__(self, repository: BaseRepository[ModelType]):
+        self.repository = repository
+        self.model = repository.model
+
+    async def get_all(
+        self, session: AsyncSession, fields: list[str] | None = None, **filters
+    ) -> list[ModelType] | list[dict]:
+        return await session.run_sync(self.repository.get_all, fields, **filters)
+
+    async def get_page(
+        self,
+        session: AsyncSession,
+        limit: int,
+        cursor: str | None = None,
+        fields: list[str] | None = None,
+        **filters,
+    ) -> Page[ModelType] | Page[dict]:
+        return await session.run_sync(
+            self.repository.get_page, limit, cursor, fields, **filters
+        )
+
+    async def get_by_id(self, session: AsyncSession, id: int, **filters) -> ModelType:
+        return await session.run_sync(self.repository.get_by_id, id, **filters)
+
+    async def get_by_ids(
+        self, session: AsyncSession, ids: list[int]
+    ) -> list[ModelType]:
+        return await session.run_sync(self.repository.get_by_ids, ids)
+
+    async def get_existing_ids(self, session: AsyncSession, ids: list[int]) -> set[int]:
+        return await session.run_sync(self.repository.get_existing_ids, ids)
+
+    async def create(self, session: AsyncSession, item: ModelType) -> ModelType:
+        return await session.run_sync(self.repository.create, item)
+
+    async def create_and_flush(
+        self, session: AsyncSession, item: ModelType
+    ) -> ModelType:
+        return await session.run_sync(self.repository.create_and_flush, item)
+
+    async def bulk_create(
+        self, session: AsyncSession, items: list[ModelType]
+    ) -> list[ModelType]:
+        return await session.run_sync(self.repository.bulk_create, items)
+
+    async def bulk_create_and_flush(
+        self, session: AsyncSession, items: list[ModelType]
+    ) -> list[ModelType]:
+        return await session.run_sync(self.repository.bulk_create_and_flush, items)
+
+    async def update(
+        self,
+        session: AsyncSession,
+        id: int,
+        item: ModelType,
+        version: int | None = None,
+    ) -> ModelType:
+        return await session.run_sync(self.repository.update, id, item, version)
+
+    async def update_and_flush(
+        self,
+        session: AsyncSession,
+        id: int,
+        item: ModelType,
+        version: int | None = None,
+    ) -> ModelType:
+        return await session.run_sync(
+            self.repository.update_and_flush, id, item, version
+        )
+
+    async def delete(self, session: AsyncSession, id: int) -> None:
+        await session.run_sync(self.repository.delete, id)
+
+    async def delete_and_flush(self, session: AsyncSession, id: int) -> None:
+        await session.run_sync(self.repository.delete_and_flush, id)
@@ -0,0 +1,140 @@
+import json
+from typing import Type
+from pydantic_core import to_jsonable_python
+from sqlalchemy import event
+from sqlalchemy.orm import Session as SASession, make_transient_to_detached
+from sqlmodel import Session
+from cache import CACHE_TTL, Cache, get_cache
+from pagination import Page
+from .base import BaseRepository, ModelType
+
+PENDING_INVALIDATIONS = "cache_invalidations"
+
+
+class CachedRepository(BaseRepository[ModelType]):
+    """
+    Repository that serves reads from a cache and invalidates it once a write
+    is committed. Entries are keyed by a per-table version, so a write only
+    has to bump that version instead of finding every key it affects.
+    """
+
+    # Other tables whose cached rows a write to this one can change, e.g. the
+    # rows removed by a delete cascade
+    invalidates: tuple[str, ...] = ()
+
+    def __init__(self, model: Type[ModelType], cache: Cache | None = None):
+        super().__init__(model)
+        self.cache = cache or get_cache()
+        self.namespace = model.__tablename__
+        self.ttl = CACHE_TTL
+
+    def _key(self, *parts) -> str:
+        version = self.cache.get_counter(f"{self.namespace}:version")
+        return ":".join([self.namespace, str(version), *map(str, parts)])
+
+    def _dump(self, item: ModelType | dict) -> dict:
+        if isinstance(item, dict):
+            return to_jsonable_python(item)
+
+        return item.model_dump(mode="json")
+
+    def _load(
+        self, session: Session, data: dict, fields: list[str] | None = None
+    ) -> ModelType | dict:
+        # Projected rows are plain dicts, which the response model parses
+        if fields is not None:
+            return data
+
+        # Attach the cached row to the session as if it had been loaded, without
+        # emitting any SQL, so callers can still update or delete it
+        item = self.model.model_validate(data)
+        make_transient_to_detached(item)
+        return session.merge(item, load=False)
+
+    def _invalidate_on_commit(self, session: Session) -> None:
+        pending = session.info.setdefault(PENDING_INVALIDATIONS, set())
+        for namespace in (self.namespace, *self.invalidates):
+            pending.add((self.cache, namespace))
+
+    def get_all(
+        self, session: Session, fields: list[str] | None = None, **filters
+    ) -> list[ModelType] | list[dict]:
+        key = self._key("all", fields, sorted(filters.items()))
+        cached = self.cache.get(key)
+        if cached is not None:
+            return [self._load(session, data, fields) for data in json.loads(cached)]
+
+        items = super().get_all(session, fields, **filters)
+        payload = [self._dump(item) for item in items]
+        self.cache.set(key, json.dumps(payload).encode(), self.ttl)
+        return items
+
+    def get_page(
+        self,
+        session: Session,
+        limit: int,
+        cursor: str | None = None,
+        fields: list[str] | None = None,
+        **filters,
+    ) -> Page[ModelType] | Page[dict]:
+        key = self._key("page", limit, cursor, fields, sorted(filters.items()))
+        cached = self.cache.get(key)
+        if cached is not None:
+            payload = json.loads(cached)
+            return Page(
+                items=[self._load(session, data, fields) for data in payload["items"]],
+                next_cursor=payload["next_cursor"],
+            )
+
+        page = super().get_page(session, limit, cursor, fields, **filters)
+        payload = {
+            "items": [self._dump(item) for item in page.items],
+            "next_cursor": page.next_cursor,
+        }
+        self.cache.set(key, json.dumps(payload).encode(), self.ttl)
+        return page
+
+    def get_by_id(self, session: Session, id: int, **filters) -> ModelType:
+        key = self._key("id", id, sorted(filters.items()))
+        cached = self.cache.get(key)
+        if cached is not None:
+            return self._load(session, json.loads(cached))
+
+        item = super().get_by_id(session, id, **filters)
+        self.cache.set(key, json.dumps(self._dump(item)).encode(), self.ttl)
+        return item
+
+    def create(self, session: Session, item: ModelType) -> ModelType:
+        self._invalidate_on_commit(session)
+        return super().create(session, item)
+
+    def create_and_flush(self, session: Session, item: ModelType) -> ModelType:
+        self._invalidate_on_commit(session)
+        return super().create_and_flush(session, item)
+
+    def bulk_create_and_flush(
+        self, session: Session, items: list[ModelType]
+    ) -> list[ModelType]:
+        self._invalidate_on_commit(session)
+        return super().bulk_create_and_flush(session, items)
+
+    def update_and_flush(
+        self, session: Session, id: int, item: ModelType, version: int | None = None
+    ) -> ModelType:
+        self._invalidate_on_commit(session)
+        return super().update_and_flush(session, id, item, version)
+
+    def delete_and_flush(self, session: Session, id: int) -> None:
+        self._invalidate_on_commit(session)
+        super().delete_and_flush(session, id)
+
+
+@event.listens_for(SASession, "after_commit")
+def invalidate_committed(session: SASession) -> None:
+    for cache, namespace in session.info.pop(PENDING_INVALIDATIONS, ()):
+        cache.incr(f"{namespace}:version")
+
+
+@event.listens_for(SASession, "after_rollback")
+def discard_rolled_back(session: SASession) -> None:
+    session.info.pop(PENDING_INVALIDATIONS, None)
@@ -0,0 +1,62 @@
+from sqlalchemy import BigInteger, Text, cast, func, tuple_
+from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from .base import AsyncBaseRepository, BaseRepository
+from models import Change
+from pagination import Page, decode_cursor, encode_cursor
+
+
+class ChangesRepository(BaseRepository[Change]):
+    def __init__(self):
+        super().__init__(Change)
+
+    def get_since(
+        self,
+        session: Session,
+        since: str | None,
+        limit: int,
+        table_name: str | None = None,
+    ) -> Page[Change]:
+        """
+        Get the changes after the `since` cursor, with a range scan on
+        (transaction_id, seq), or on (table_name, transaction_id, seq) for the
+        changes of one table. The next cursor is where the following call
+        resumes, even when there are no new changes yet.
+        """
+        keyset = tuple_(self.model.transaction_id, self.model.seq)
+        query = select(self.model)
+        if since:
+            query = query.where(keyset > tuple(decode_cursor(since, [int, int])))
+        if table_name:
+            query = query.where(self.model.table_name == table_name)
+
+        # Transactions older than the snapshot's xmin have all ended, and no
+        # new one can get an older id, so the changes below it are final
+        if session.get_bind().dialect.name == "postgresql":
+            watermark = func.pg_snapshot_xmin(func.pg_current_snapshot())
+            query = query.where(
+                self.model.transaction_id < cast(cast(watermark, Text), BigInteger)
+            )
+
+        query = query.order_by(self.model.transaction_id, self.model.seq)
+        changes = session.exec(query.limit(limit)).all()
+        if changes:
+            since = encode_cursor([changes[-1].transaction_id, changes[-1].seq])
+
+        return Page(items=changes, next_cursor=since)
+
+
+class AsyncChangesRepository(AsyncBaseRepository[Change]):
+    def __init__(self):
+        super().__init__(ChangesRepository())
+
+    async def get_since(
+        self,
+        session: AsyncSession,
+        since: str | None,
+        limit: int,
+        table_name: str | None = None,
+    ) -> Page[Change]:
+        return await session.run_sync(
+            self.repository.get_since, since, limit, table_name
+        )
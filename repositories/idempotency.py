@@ -0,0 +1,93 @@
+import datetime
+import hashlib
+import os
+from typing import Any
+from fastapi import HTTPException
+from pydantic_core import to_jsonable_python
+from sqlalchemy import delete, update
+from sqlmodel import Session, SQLModel, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from .base import UPSERTS, AsyncBaseRepository, BaseRepository
+from models import IdempotencyKey
+
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", 86400))
+
+
+def hash_request(body: SQLModel) -> str:
+    return hashlib.blake2b(body.model_dump_json().encode(), digest_size=16).hexdigest()
+
+
+class IdempotencyRepository(BaseRepository[IdempotencyKey]):
+    def __init__(self):
+        super().__init__(IdempotencyKey)
+
+    def claim(
+        self, session: Session, key: str, request_hash: str
+    ) -> IdempotencyKey | None:
+        """
+        Get the stored response of a key, or claim the key for this request
+        without committing. The claim is an INSERT ... ON CONFLICT DO NOTHING,
+        which waits for a concurrent request holding the same key to finish,
+        so duplicates in flight are answered with the response of the first.
+        """
+        now = datetime.datetime.now()
+        # Expired keys are dropped as they are found, by a range on expires_at
+        session.exec(delete(self.model).where(self.model.expires_at < now))
+
+        query = (
+            UPSERTS[session.get_bind().dialect.name](self.model)
+            .values(
+                key=key,
+                request_hash=request_hash,
+                created_at=now,
+                expires_at=now + datetime.timedelta(seconds=IDEMPOTENCY_TTL),
+            )
+            .on_conflict_do_nothing(index_elements=["key"])
+        )
+        if session.exec(query).rowcount:
+            return None
+
+        stored = session.exec(select(self.model).where(self.model.key == key)).one()
+        if stored.request_hash != request_hash:
+            raise HTTPException(
+                status_code=422,
+                detail="Idempotency-Key was already used for another request",
+            )
+
+        # Only possible if the first request committed without its response
+        if stored.status_code is None:
+            raise HTTPException(
+                status_code=409, detail="Idempotency-Key has no stored response"
+            )
+
+        return stored
+
+    def store_response_and_flush(
+        self, session: Session, key: str, status_code: int, response: Any
+    ) -> None:
+        """
+        Record the response of a claimed key, committed with the work it reports
+        """
+        query = (
+            update(self.model)
+            .where(self.model.key == key)
+            .values(status_code=status_code, response=to_jsonable_python(response))
+        )
+        session.exec(query)
+
+
+class AsyncIdempotencyRepository(AsyncBaseRepository[IdempotencyKey]):
+    def __init__(self):
+        super().__init__(IdempotencyRepository())
+
+    async def claim(
+        self, session: AsyncSession, key: str, request_hash: str
+    ) -> IdempotencyKey | None:
+        return await session.run_sync(self.repository.claim, key, request_hash)
+
+    async def store_response_and_flush(
+        self, session: AsyncSession, key: str, status_code: int, response: Any
+    ) -> None:
+        await session.run_sync(
+            self.repository.store_response_and_flush, key, status_code, response
+        )
@@ -1,7 +1,47 @@
-from .base import BaseRepository
-from models import Medspa
+from fastapi import HTTPException
+from sqlalchemy import literal, union_all
+from sqlmodel import Session, select
+from cache import Cache
+from .base import AsyncBaseRepository, insert_changes
+from .cached import CachedRepository
+from models import Appointments, ChangeOperation, Medspa, Services
 
 
-class MedspaRepository(BaseRepository[Medspa]):
+class MedspaRepository(CachedRepository[Medspa]):
+    # Deleting a medspa also deletes its services
+    invalidates = ("services",)
+    track_changes = True
+
+    def __init__(self, cache: Cache | None = None):
+        super().__init__(Medspa, cache)
+
+    def delete_and_flush(self, session: Session, id: int) -> None:
+        """
+        Delete a medspa and record the services and appointments that go with
+        it through the cascade, which the change feed would not see otherwise.
+        The medspa is locked first, so none can be added between listing them
+        and the DELETE.
+        """
+        query = select(self.model.id).where(self.model.id == id).with_for_update()
+        if session.exec(query).first() is None:
+            raise HTTPException(status_code=404, detail="Medspa not found")
+
+        query = union_all(
+            *[
+                select(literal(model.__tablename__).label("table_name"), model.id)
+                .where(model.medspa_id == id)
+                for model in (Services, Appointments)
+            ]
+        )
+        rows = [
+            {"table_name": table_name, "row_id": row_id}
+            for table_name, row_id in session.execute(query)
+        ]
+        insert_changes(session, ChangeOperation.DELETE, rows)
+
+        super().delete_and_flush(session, id)
+
+
+class AsyncMedspaRepository(AsyncBaseRepository[Medspa]):
     def __init__(self):
-        super().__init__(Medspa)
+        super().__init__(MedspaRepository())
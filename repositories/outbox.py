@@ -0,0 +1,81 @@
+import datetime
+from sqlalchemy import delete, update
+from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from .base import AsyncBaseRepository, BaseRepository
+from models import OutboxJob
+
+# Topic of the job enqueued with every new appointment
+APPOINTMENT_BOOKED = "appointment.booked"
+
+
+class OutboxRepository(BaseRepository[OutboxJob]):
+    def __init__(self):
+        super().__init__(OutboxJob)
+
+    def claim(self, session: Session, limit: int, lease: float) -> list[OutboxJob]:
+        """
+        Take up to `limit` due jobs, oldest first, with a single UPDATE ...
+        RETURNING that counts the attempt and pushes them back by `lease`
+        seconds. A job whose worker dies is due again once its lease is over.
+        Rows locked by another process are skipped rather than waited for.
+        """
+        now = datetime.datetime.now()
+        due = (
+            select(self.model.id)
+            .where(self.model.available_at <= now)
+            .order_by(self.model.available_at, self.model.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        query = (
+            update(self.model)
+            .where(self.model.id.in_(due))
+            .values(
+                attempts=self.model.attempts + 1,
+                available_at=now + datetime.timedelta(seconds=lease),
+            )
+            .returning(self.model)
+        )
+        jobs = list(session.scalars(query))
+        session.commit()
+        return jobs
+
+    def complete(self, session: Session, id: int) -> None:
+        session.exec(delete(self.model).where(self.model.id == id))
+        session.commit()
+
+    def retry(self, session: Session, id: int, error: str, delay: float | None) -> None:
+        """
+        Record the failure of a job and make it due again after `delay`
+        seconds, or never again when `delay` is None
+        """
+        available_at = None
+        if delay is not None:
+            available_at = datetime.datetime.now() + datetime.timedelta(seconds=delay)
+
+        query = (
+            update(self.model)
+            .where(self.model.id == id)
+            .values(available_at=available_at, last_error=error)
+        )
+        session.exec(query)
+        session.commit()
+
+
+class AsyncOutboxRepository(AsyncBaseRepository[OutboxJob]):
+    def __init__(self):
+        super().__init__(OutboxRepository())
+
+    async def claim(
+        self, session: AsyncSession, limit: int, lease: float
+    ) -> list[OutboxJob]:
+        return await session.run_sync(self.repository.claim, limit, lease)
+
+    async def complete(self, session: AsyncSession, id: int) -> None:
+        await session.run_sync(self.repository.complete, id)
+
+    async def retry(
+        self, session: AsyncSession, id: int, error: str, delay: float | None
+    ) -> None:
+        await session.run_sync(self.repository.retry, id, error, delay)
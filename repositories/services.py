@@ -1,7 +1,104 @@
-from .base import BaseRepository
-from models import Services
+from decimal import Decimal
+from typing import NamedTuple
+from fastapi import HTTPException
+from sqlalchemy import func
+from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from cache import Cache
+from .base import AsyncBaseRepository, raise_for_bulk_results
+from .cached import CachedRepository
+from .medspa import MedspaRepository
+from models import BulkItemResult, BulkMode, Services
 
 
-class ServicesRepository(BaseRepository[Services]):
+class ServiceTotals(NamedTuple):
+    # Distinct service ids, in the order they were given
+    ids: list[int]
+    price: Decimal
+    duration: int
+
+
+def rejected_services_detail(medspa_id: int, rejected: list[int]) -> str:
+    return (
+        f"Services not offered by medspa {medspa_id}: "
+        f"{', '.join(str(id) for id in rejected)}"
+    )
+
+
+class ServicesRepository(CachedRepository[Services]):
+    track_changes = True
+
+    def __init__(self, cache: Cache | None = None):
+        super().__init__(Services, cache)
+        self.medspa_repository = MedspaRepository(cache)
+
+    def get_totals(
+        self, session: Session, ids: list[int], medspa_id: int
+    ) -> ServiceTotals:
+        """
+        Sum the price and duration of services of a medspa with one aggregate
+        query, without loading them. Ids that are not services of the medspa
+        are rejected with 422, which takes a second query to name them.
+        """
+        ids = list(dict.fromkeys(ids))
+        offered = (Services.id.in_(ids), Services.medspa_id == medspa_id)
+        query = select(
+            func.coalesce(func.sum(Services.price), 0),
+            func.coalesce(func.sum(Services.duration), 0),
+            func.count(),
+        ).where(*offered)
+        price, duration, count = session.exec(query).one()
+
+        if count < len(ids):
+            found = set(session.exec(select(Services.id).where(*offered)))
+            rejected = [id for id in ids if id not in found]
+            raise HTTPException(
+                status_code=422, detail=rejected_services_detail(medspa_id, rejected)
+            )
+
+        return ServiceTotals(ids, Decimal(price), duration)
+
+    def bulk_import(
+        self, session: Session, services: list[Services], mode: BulkMode
+    ) -> list[BulkItemResult]:
+        """
+        Create many services with one query to check their medspas and one
+        multi-row insert, reporting the outcome of each item
+        """
+        medspa_ids = list({service.medspa_id for service in services})
+        existing = self.medspa_repository.get_existing_ids(session, medspa_ids)
+
+        results = [
+            BulkItemResult(index=index, status=201)
+            if service.medspa_id in existing
+            else BulkItemResult(index=index, status=404, detail="Medspa not found")
+            for index, service in enumerate(services)
+        ]
+        raise_for_bulk_results(results, mode)
+
+        valid = [
+            (result, service)
+            for result, service in zip(results, services)
+            if result.status == 201
+        ]
+        created = self.bulk_create(session, [service for _, service in valid])
+
+        for (result, _), service in zip(valid, created):
+            result.id = service.id
+
+        return results
+
+
+class AsyncServicesRepository(AsyncBaseRepository[Services]):
     def __init__(self):
-        super().__init__(Services)
+        super().__init__(ServicesRepository())
+
+    async def get_totals(
+        self, session: AsyncSession, ids: list[int], medspa_id: int
+    ) -> ServiceTotals:
+        return await session.run_sync(self.repository.get_totals, ids, medspa_id)
+
+    async def bulk_import(
+        self, session: AsyncSession, services: list[Services], mode: BulkMode
+    ) -> list[BulkItemResult]:
+        return await session.run_sync(self.repository.bulk_import, services, mode)
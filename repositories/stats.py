@@ -0,0 +1,169 @@
+import datetime
+from decimal import Decimal
+from sqlalchemy import Connection, event, func, insert, inspect
+from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from .base import UPSERTS, AsyncBaseRepository, BaseRepository
+from models import AppointmentStats, AppointmentStatus, Appointments
+
+# Columns of an appointment that the rollup depends on
+STATS_COLUMNS = ("medspa_id", "start_time", "status", "total_price", "total_duration")
+
+StatsKey = tuple[int, datetime.date, AppointmentStatus]
+StatsDeltas = dict[StatsKey, tuple[int, Decimal, int]]
+
+
+def collect_stats(deltas: StatsDeltas, values: dict, sign: int) -> None:
+    """
+    Add (sign=1) or remove (sign=-1) an appointment from the rollup deltas
+    """
+    key = (values["medspa_id"], values["start_time"].date(), values["status"])
+    count, revenue, minutes = deltas.get(key, (0, Decimal(0), 0))
+    deltas[key] = (
+        count + sign,
+        revenue + sign * Decimal(values["total_price"]),
+        minutes + sign * values["total_duration"],
+    )
+
+
+def apply_stats(connection: Connection, deltas: StatsDeltas) -> None:
+    """
+    Add the deltas to the rollup rows with a single upsert, creating the rows
+    of days that have none yet
+    """
+    rows = [
+        {
+            "medspa_id": medspa_id,
+            "day": day,
+            "status": status,
+            "count": count,
+            "revenue": revenue,
+            "booked_minutes": minutes,
+        }
+        for (medspa_id, day, status), (count, revenue, minutes) in deltas.items()
+        if count or revenue or minutes
+    ]
+    if not rows:
+        return
+
+    table = AppointmentStats.__table__
+    query = UPSERTS[connection.dialect.name](table).values(rows)
+    query = query.on_conflict_do_update(
+        index_elements=[table.c.medspa_id, table.c.day, table.c.status],
+        set_={
+            name: table.c[name] + query.excluded[name]
+            for name in ("count", "revenue", "booked_minutes")
+        },
+    )
+    connection.execute(query)
+
+
+def get_stats_values(appointment: Appointments) -> dict:
+    return {name: getattr(appointment, name) for name in STATS_COLUMNS}
+
+
+class AppointmentStatsRepository(BaseRepository[AppointmentStats]):
+    def __init__(self):
+        super().__init__(AppointmentStats)
+
+    def get_daily(
+        self,
+        session: Session,
+        medspa_id: int,
+        from_date: datetime.date | None = None,
+        to_date: datetime.date | None = None,
+    ) -> list[AppointmentStats]:
+        """
+        Get the rollup rows of a medspa, one per day and status, reading
+        O(days) rows instead of aggregating every appointment
+        """
+        query = select(self.model).where(
+            self.model.medspa_id == medspa_id, self.model.count > 0
+        )
+
+        if from_date:
+            query = query.where(self.model.day >= from_date)
+
+        if to_date:
+            query = query.where(self.model.day <= to_date)
+
+        query = query.order_by(self.model.day, self.model.status)
+        return session.exec(query).all()
+
+    def rebuild(self, session: Session) -> None:
+        """
+        Recompute the whole rollup from the appointments table, e.g. to fill it
+        for appointments created before it existed
+        """
+        table = self.model.__table__
+        totals = select(
+            Appointments.medspa_id,
+            func.date(Appointments.start_time),
+            Appointments.status,
+            func.count(),
+            func.sum(Appointments.total_price),
+            func.sum(Appointments.total_duration),
+        ).group_by(
+            Appointments.medspa_id,
+            func.date(Appointments.start_time),
+            Appointments.status,
+        )
+
+        # Aggregated by the database in one statement, without loading the rows
+        session.exec(table.delete())
+        session.exec(insert(table).from_select(list(table.columns.keys()), totals))
+        session.commit()
+
+
+class AsyncAppointmentStatsRepository(AsyncBaseRepository[AppointmentStats]):
+    def __init__(self):
+        super().__init__(AppointmentStatsRepository())
+
+    async def get_daily(
+        self,
+        session: AsyncSession,
+        medspa_id: int,
+        from_date: datetime.date | None = None,
+        to_date: datetime.date | None = None,
+    ) -> list[AppointmentStats]:
+        return await session.run_sync(
+            self.repository.get_daily, medspa_id, from_date, to_date
+        )
+
+
+# The unit of work emits these while flushing, so the rollup is updated on the
+# same connection and committed or rolled back with the appointments. Bulk
+# inserts skip mapper events and are recorded by AppointmentsRepository.
+
+
+@event.listens_for(Appointments, "after_insert")
+def record_inserted(mapper, connection: Connection, target: Appointments) -> None:
+    deltas: StatsDeltas = {}
+    collect_stats(deltas, get_stats_values(target), 1)
+    apply_stats(connection, deltas)
+
+
+@event.listens_for(Appointments, "after_update")
+def record_updated(mapper, connection: Connection, target: Appointments) -> None:
+    state = inspect(target)
+    current = get_stats_values(target)
+    previous = dict(current)
+    for name in STATS_COLUMNS:
+        history = state.attrs[name].history
+        if history.deleted:
+            previous[name] = history.deleted[0]
+
+    if previous == current:
+        return
+
+    deltas: StatsDeltas = {}
+    collect_stats(deltas, previous, -1)
+    collect_stats(deltas, current, 1)
+    apply_stats(connection, deltas)
+
+
+@event.listens_for(Appointments, "after_delete")
+def record_deleted(mapper, connection: Connection, target: Appointments) -> None:
+    deltas: StatsDeltas = {}
+    collect_stats(deltas, get_stats_values(target), -1)
+    apply_stats(connection, deltas)
@@ -1,35 +1,69 @@
 import datetime
-from fastapi import APIRouter
-from database import SessionDep
+import os
+from typing import Annotated, Literal
+from fastapi import APIRouter, Header, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from conditional import IfMatchDep, check_etag, get_page_with_etag, version_etag
+from database import AsyncSessionDep
+from export import MEDIA_TYPES, to_csv, to_ndjson
+from fieldsets import sparse_fields
+from jobs import worker
 from models import (
+    AppointmentRead,
     AppointmentStatus,
     AppointmentUpdate,
+    AppointmentWithServices,
     Appointments,
     AppointmentsServices,
     AppointmentCreate,
+    BulkItemResult,
+    BulkMode,
+    OutboxJob,
 )
-from repositories.services import ServicesRepository
-from repositories.appoitments import AppointmentsRepository
-from repositories.appoitments_services import AppointmentsServicesRepository
-from repositories.medspa import MedspaRepository
+from pagination import NEXT_CURSOR_HEADER, PageDep
+from repositories.services import AsyncServicesRepository
+from repositories.appoitments import AsyncAppointmentsRepository
+from repositories.appoitments_services import AsyncAppointmentsServicesRepository
+from repositories.idempotency import AsyncIdempotencyRepository, hash_request
+from repositories.medspa import AsyncMedspaRepository
+from repositories.outbox import APPOINTMENT_BOOKED, AsyncOutboxRepository
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 1000))
+
+# Set on responses replayed from a previous request with the same key
+IDEMPOTENT_REPLAY_HEADER = "Idempotent-Replayed"
 
 router = APIRouter(
     prefix="/appointments",
     tags=["appointments"],
 )
 
-appointments_repository = AppointmentsRepository()
-medspa_repository = MedspaRepository()
-services_repository = ServicesRepository()
-appointments_services_repository = AppointmentsServicesRepository()
+appointments_repository = AsyncAppointmentsRepository()
+medspa_repository = AsyncMedspaRepository()
+services_repository = AsyncServicesRepository()
+appointments_services_repository = AsyncAppointmentsServicesRepository()
+idempotency_repository = AsyncIdempotencyRepository()
+outbox_repository = AsyncOutboxRepository()
+
+# The services are not a column, they are added by include=services
+FieldsDep = sparse_fields(AppointmentRead, "services")
 
 
-@router.get("/")
-def get_appointments(
-    session: SessionDep,
+@router.get("/", response_model_exclude_unset=True)
+async def get_appointments(
+    session: AsyncSessionDep,
+    page: PageDep,
+    fields: FieldsDep,
+    request: Request,
+    response: Response,
     status: AppointmentStatus | None = None,
     date: datetime.date | None = None,
-) -> list[Appointments]:
+    from_date: datetime.date | None = Query(None, alias="from"),
+    to_date: datetime.date | None = Query(None, alias="to"),
+    medspa_id: int | None = None,
+    service_id: int | None = None,
+    include: Literal["services"] | None = None,
+) -> list[AppointmentRead]:
     filter = {}
     if status:
         filter["status"] = status
@@ -37,92 +71,231 @@ def get_appointments(
     if date:
         filter["date"] = date
 
-    appointments = appointments_repository.get_all(session, **filter)
-    return appointments
+    if from_date:
+        filter["from_date"] = from_date
 
+    if to_date:
+        filter["to_date"] = to_date
 
-@router.get("/{appointment_id}")
-def get_appointment(appointment_id: int, session: SessionDep) -> dict:
-    appointment = appointments_repository.get_by_id(session, appointment_id)
+    if medspa_id:
+        filter["medspa_id"] = medspa_id
+
+    if service_id:
+        filter["service_id"] = service_id
+
+    def get_page(fields: list[str]):
+        return appointments_repository.get_page(
+            session, page.limit, page.cursor, fields, **filter
+        )
+
+    if include != "services":
+        appointments = await get_page_with_etag(request, response, fields, get_page)
+    else:
+        appointments = await get_page(fields)
+
+    if appointments.next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = appointments.next_cursor
+
+    if include == "services":
+        # The embedded services have versions of their own, so the ETag is
+        # computed from the content instead
+        items = await appointments_repository.with_services(session, appointments.items)
+        check_etag(request, response, items)
+        return items
 
-    # Get all appointment-service relationships for this appointment
-    appointment_services = appointments_services_repository.get_all(
-        session, appointment_id=appointment_id
+    return appointments.items
+
+
+@router.get("/export", response_class=StreamingResponse)
+async def export_appointments(
+    session: AsyncSessionDep,
+    format: Literal["ndjson", "csv"] = "ndjson",
+    from_date: datetime.date | None = Query(None, alias="from"),
+    to_date: datetime.date | None = Query(None, alias="to"),
+    medspa_id: int | None = None,
+):
+    filter = {}
+    if from_date:
+        filter["from_date"] = from_date
+
+    if to_date:
+        filter["to_date"] = to_date
+
+    if medspa_id:
+        filter["medspa_id"] = medspa_id
+
+    # Rows are streamed from a server-side cursor in batches, so memory stays
+    # flat no matter how many appointments are exported
+    batches = appointments_repository.stream_batches(
+        session, EXPORT_BATCH_SIZE, **filter
     )
+    columns = appointments_repository.model.__table__.columns.keys()
+    render = to_csv if format == "csv" else to_ndjson
 
-    # Get all services using the service IDs from the relationships
-    service_ids = [aps.service_id for aps in appointment_services]
-    services = services_repository.get_by_ids(session, service_ids)
+    return StreamingResponse(
+        render(columns, batches),
+        media_type=MEDIA_TYPES[format],
+        headers={
+            "Content-Disposition": f'attachment; filename="appointments.{format}"'
+        },
+    )
 
-    # Convert appointment to dict and exclude SQLModel metadata
-    response = appointment.model_dump(exclude={"services"})
-    response["services"] = [service.model_dump() for service in services]
 
-    return response
+@router.get("/{appointment_id}")
+async def get_appointment(
+    appointment_id: int, session: AsyncSessionDep, request: Request, response: Response
+) -> AppointmentWithServices:
+    appointment = await appointments_repository.get_by_id_with_services(
+        session, appointment_id
+    )
+    services = [(service.id, service.version) for service in appointment.services]
+    check_etag(request, response, etag=version_etag(appointment.version, services))
+    return appointment
 
 
 @router.post("/", status_code=201)
-def create_appointment(booking: AppointmentCreate, session: SessionDep) -> Appointments:
-    medspa = medspa_repository.get_by_id(session, booking.medspa_id)
-    services = services_repository.get_by_ids(session, booking.services)
+async def create_appointment(
+    booking: AppointmentCreate,
+    session: AsyncSessionDep,
+    idempotency_key: Annotated[str | None, Header(max_length=255)] = None,
+) -> Appointments:
+    if idempotency_key:
+        stored = await idempotency_repository.claim(
+            session, idempotency_key, hash_request(booking)
+        )
+        if stored:
+            return JSONResponse(
+                stored.response,
+                status_code=stored.status_code,
+                headers={IDEMPOTENT_REPLAY_HEADER: "true"},
+            )
 
-    # Filter services to only include those belonging to the selected medspa
-    services = [service for service in services if service.medspa_id == medspa.id]
+    medspa = await medspa_repository.get_by_id(session, booking.medspa_id)
+    totals = await services_repository.get_totals(session, booking.services, medspa.id)
 
     appointment = Appointments(
         medspa_id=medspa.id,
         start_time=booking.start_time,
-        total_price=sum(service.price for service in services),
-        total_duration=sum(service.duration for service in services),
+        total_price=totals.price,
+        total_duration=totals.duration,
         status=AppointmentStatus.SCHEDULED,
     )
 
-    appointments_repository.create_and_flush(session, appointment)
+    await appointments_repository.check_availability(
+        session,
+        appointment.medspa_id,
+        appointment.start_time,
+        appointment.total_duration,
+    )
+    await appointments_repository.create_and_flush(session, appointment)
 
-    for service in services:
-        appointments_services = AppointmentsServices(
-            appointment_id=appointment.id, service_id=service.id
+    if idempotency_key:
+        await idempotency_repository.store_response_and_flush(
+            session, idempotency_key, 201, appointment
         )
-        appointments_services_repository.create(session, appointments_services)
 
-    session.refresh(appointment)
+    # Its side effects run after the commit, from the outbox
+    await outbox_repository.bulk_create_and_flush(
+        session,
+        [
+            OutboxJob(
+                topic=APPOINTMENT_BOOKED, payload={"appointment_id": appointment.id}
+            )
+        ],
+    )
+
+    # Link all services with a single insert, committed with the appointment,
+    # its jobs and the response stored for its idempotency key
+    await appointments_services_repository.bulk_create(
+        session,
+        [
+            AppointmentsServices(appointment_id=appointment.id, service_id=service_id)
+            for service_id in totals.ids
+        ],
+    )
+    worker.notify()
+
     return appointment
 
 
+@router.post("/bulk", status_code=201, response_model_exclude_none=True)
+async def create_appointments(
+    bookings: list[AppointmentCreate],
+    session: AsyncSessionDep,
+    response: Response,
+    mode: BulkMode = BulkMode.ATOMIC,
+) -> list[BulkItemResult]:
+    results = await appointments_repository.bulk_book(session, bookings, mode)
+    worker.notify()
+
+    if any(result.status != 201 for result in results):
+        response.status_code = 207
+
+    return results
+
+
 @router.patch("/{appointment_id}")
-def update_appointment(
-    appointment_id: int, booking: AppointmentUpdate, session: SessionDep
+async def update_appointment(
+    appointment_id: int,
+    booking: AppointmentUpdate,
+    session: AsyncSessionDep,
+    response: Response,
+    version: IfMatchDep,
 ) -> Appointments:
-    appointment = appointments_repository.get_by_id(session, appointment_id)
+    appointment = await appointments_repository.get_by_id(session, appointment_id)
 
+    # The changes are collected rather than set on the loaded appointment, which
+    # the session would otherwise flush with an unconditional UPDATE
+    values = {}
     if booking.medspa_id:
-        appointment.medspa_id = booking.medspa_id
+        values["medspa_id"] = booking.medspa_id
 
     if booking.status:
-        appointment.status = booking.status
+        values["status"] = booking.status
 
     if booking.services:
-        services = services_repository.get_by_ids(session, booking.services)
-
-        appointment.total_price = sum(service.price for service in services)
-        appointment.total_duration = sum(service.duration for service in services)
+        totals = await services_repository.get_totals(
+            session,
+            booking.services,
+            values.get("medspa_id", appointment.medspa_id),
+        )
+        values["total_price"] = totals.price
+        values["total_duration"] = totals.duration
 
         # Delete existing appointment-service relationships before creating new ones
         # This ensures we don't have orphaned or duplicate relationships when
         # updating services
-        appointments_services_repository.delete_by_appointment_id(
+        await appointments_services_repository.delete_by_appointment_id(
             session, appointment_id
         )
-        for service in services:
-            appointments_services = AppointmentsServices(
-                appointment_id=appointment_id, service_id=service.id
-            )
-            appointments_services_repository.create(session, appointments_services)
+        await appointments_services_repository.bulk_create_and_flush(
+            session,
+            [
+                AppointmentsServices(appointment_id=appointment_id, service_id=id)
+                for id in totals.ids
+            ],
+        )
 
-    appointments_repository.update(session, appointment_id, appointment)
+    # A new medspa, new services or an un-cancelled status can all make the
+    # appointment collide with another booking
+    status = values.get("status", appointment.status)
+    if values and status != AppointmentStatus.CANCELLED:
+        await appointments_repository.check_availability(
+            session,
+            values.get("medspa_id", appointment.medspa_id),
+            appointment.start_time,
+            values.get("total_duration", appointment.total_duration),
+            exclude_id=appointment_id,
+        )
+
+    # Commits the appointment together with its new service links
+    appointment = await appointments_repository.update(
+        session, appointment_id, Appointments(**values), version
+    )
+    response.headers["ETag"] = version_etag(appointment.version)
     return appointment
 
 
 @router.delete("/{appointment_id}", status_code=204)
-def delete_appointment(appointment_id: int, session: SessionDep) -> None:
-    appointments_repository.delete(session, appointment_id)
+async def delete_appointment(appointment_id: int, session: AsyncSessionDep) -> None:
+    await appointments_repository.delete(session, appointment_id)
@@ -0,0 +1,106 @@
+import asyncio
+import os
+import time
+from typing import Annotated, AsyncIterator, Literal
+from fastapi import APIRouter, Header, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlmodel.ext.asyncio.session import AsyncSession
+from database import AsyncSessionDep
+from models import Change
+from pagination import (
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+    NEXT_CURSOR_HEADER,
+    encode_cursor,
+)
+from repositories.changes import AsyncChangesRepository
+
+
+router = APIRouter(
+    prefix="/changes",
+    tags=["changes"],
+)
+
+changes_repository = AsyncChangesRepository()
+
+# How often a waiting request checks for new changes, in seconds
+CHANGES_POLL_INTERVAL = float(os.getenv("CHANGES_POLL_INTERVAL", 1))
+# Longest a long-polling request may wait for changes
+CHANGES_MAX_WAIT = 30
+# How long an event stream stays open before the client reconnects with
+# Last-Event-ID, and how often an idle one sends a comment to stay open
+CHANGES_STREAM_DURATION = float(os.getenv("CHANGES_STREAM_DURATION", 300))
+CHANGES_KEEPALIVE = 15
+
+TableName = Literal["medspa", "services", "appointments"]
+
+
+async def stream_changes(
+    session: AsyncSession,
+    request: Request,
+    since: str | None,
+    table: TableName | None,
+) -> AsyncIterator[str]:
+    """
+    Send changes as server-sent events, whose ids are the cursor to resume
+    after them
+    """
+    deadline = time.monotonic() + CHANGES_STREAM_DURATION
+    keepalive = time.monotonic() + CHANGES_KEEPALIVE
+
+    while time.monotonic() < deadline and not await request.is_disconnected():
+        changes = await changes_repository.get_since(
+            session, since, MAX_PAGE_SIZE, table
+        )
+        for change in changes.items:
+            since = encode_cursor([change.transaction_id, change.seq])
+            data = change.model_dump_json()
+            yield f"id: {since}\nevent: change\ndata: {data}\n\n"
+
+        if len(changes.items) == MAX_PAGE_SIZE:
+            continue
+
+        if time.monotonic() >= keepalive:
+            yield ": keep-alive\n\n"
+            keepalive = time.monotonic() + CHANGES_KEEPALIVE
+
+        # Ends the read transaction, so that the next poll sees new commits
+        await session.commit()
+        await asyncio.sleep(CHANGES_POLL_INTERVAL)
+
+
+@router.get("/")
+async def read_changes(
+    session: AsyncSessionDep,
+    request: Request,
+    response: Response,
+    since: str | None = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    wait: float = Query(0, ge=0, le=CHANGES_MAX_WAIT),
+    table: TableName | None = None,
+    last_event_id: Annotated[str | None, Header()] = None,
+) -> list[Change]:
+    if "text/event-stream" in request.headers.get("accept", ""):
+        # A reconnecting event source resumes after the last event it got
+        if last_event_id:
+            since = last_event_id
+
+        return StreamingResponse(
+            stream_changes(session, request, since, table),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache"},
+        )
+
+    # Long polling: with `wait`, an empty answer is held until changes arrive
+    deadline = time.monotonic() + wait
+    while True:
+        changes = await changes_repository.get_since(session, since, limit, table)
+        remaining = deadline - time.monotonic()
+        if changes.items or remaining <= 0:
+            # Set even when empty, so the client keeps its place
+            if changes.next_cursor:
+                response.headers[NEXT_CURSOR_HEADER] = changes.next_cursor
+            return changes.items
+
+        await session.commit()
+        await asyncio.sleep(min(CHANGES_POLL_INTERVAL, remaining))
@@ -0,0 +1,25 @@
+from fastapi import APIRouter, Response
+from database import async_engine, engine, get_pool_stats, replica_engines
+from metrics import PROMETHEUS_CONTENT_TYPE, registry
+
+
+router = APIRouter(
+    tags=["internal"],
+    include_in_schema=False,
+)
+
+
+@router.get("/internal/pool")
+async def read_pool_stats() -> dict:
+    return {
+        "sync": get_pool_stats(engine),
+        "async": get_pool_stats(async_engine.sync_engine),
+        "replicas": [
+            get_pool_stats(replica.sync_engine) for replica in replica_engines
+        ],
+    }
+
+
+@router.get("/metrics")
+async def read_metrics() -> Response:
+    return Response(registry.render(), media_type=PROMETHEUS_CONTENT_TYPE)
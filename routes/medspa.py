@@ -1,7 +1,21 @@
-from fastapi import APIRouter
-from database import SessionDep
-from models import Medspa
-from repositories.medspa import MedspaRepository
+import datetime
+from fastapi import APIRouter, Query, Request, Response
+from conditional import IfMatchDep, check_etag, get_page_with_etag, version_etag
+from database import AsyncSessionDep
+from fieldsets import sparse_fields
+from models import (
+    AppointmentStats,
+    AppointmentStatus,
+    Availability,
+    CalendarEntry,
+    Medspa,
+    MedspaRead,
+)
+from pagination import NEXT_CURSOR_HEADER, PageDep
+from repositories.appoitments import CALENDAR_FIELDS, AsyncAppointmentsRepository
+from repositories.medspa import AsyncMedspaRepository
+from repositories.stats import AsyncAppointmentStatsRepository
+from scheduling import CLOSING_TIME, OPENING_TIME, find_free_slots
 
 
 router = APIRouter(
@@ -9,33 +23,134 @@ router = APIRouter(
     tags=["medspas"],
 )
 
-medspa_repository = MedspaRepository()
+medspa_repository = AsyncMedspaRepository()
+appointments_repository = AsyncAppointmentsRepository()
+stats_repository = AsyncAppointmentStatsRepository()
+
+FieldsDep = sparse_fields(MedspaRead)
+
 
+@router.get("/", response_model_exclude_unset=True)
+async def read_medspas(
+    session: AsyncSessionDep,
+    page: PageDep,
+    fields: FieldsDep,
+    request: Request,
+    response: Response,
+) -> list[MedspaRead]:
+    medspas = await get_page_with_etag(
+        request,
+        response,
+        fields,
+        lambda fields: medspa_repository.get_page(
+            session, page.limit, page.cursor, fields
+        ),
+    )
 
-@router.get("/")
-def read_medspas(session: SessionDep) -> list[Medspa]:
-    medspas = medspa_repository.get_all(session)
-    return medspas
+    if medspas.next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = medspas.next_cursor
+
+    return medspas.items
 
 
 @router.get("/{medspa_id}")
-def read_medspa(medspa_id: int, session: SessionDep) -> Medspa:
-    medspa = medspa_repository.get_by_id(session, medspa_id)
+async def read_medspa(
+    medspa_id: int, session: AsyncSessionDep, request: Request, response: Response
+) -> Medspa:
+    medspa = await medspa_repository.get_by_id(session, medspa_id)
+    check_etag(request, response, medspa, version_etag(medspa.version))
     return medspa
 
 
+@router.get("/{medspa_id}/availability")
+async def read_medspa_availability(
+    medspa_id: int,
+    session: AsyncSessionDep,
+    date: datetime.date,
+    duration: int = Query(gt=0),
+) -> Availability:
+    await medspa_repository.get_by_id(session, medspa_id)
+
+    opens_at = datetime.datetime.combine(date, OPENING_TIME)
+    closes_at = datetime.datetime.combine(date, CLOSING_TIME)
+    busy = await appointments_repository.get_busy_intervals(
+        session, medspa_id, opens_at, closes_at
+    )
+
+    slots = find_free_slots(
+        busy, opens_at, closes_at, datetime.timedelta(minutes=duration)
+    )
+    return Availability(medspa_id=medspa_id, date=date, duration=duration, slots=slots)
+
+
+@router.get("/{medspa_id}/appointments")
+async def read_medspa_appointments(
+    medspa_id: int,
+    session: AsyncSessionDep,
+    page: PageDep,
+    request: Request,
+    response: Response,
+    from_date: datetime.date | None = Query(None, alias="from"),
+    to_date: datetime.date | None = Query(None, alias="to"),
+    status: AppointmentStatus | None = None,
+) -> list[CalendarEntry]:
+    await medspa_repository.get_by_id(session, medspa_id)
+
+    filter = {}
+    if from_date:
+        filter["from_date"] = from_date
+
+    if to_date:
+        filter["to_date"] = to_date
+
+    if status:
+        filter["status"] = status
+
+    appointments = await get_page_with_etag(
+        request,
+        response,
+        CALENDAR_FIELDS,
+        lambda fields: appointments_repository.get_calendar(
+            session, medspa_id, page.limit, page.cursor, fields, **filter
+        ),
+    )
+
+    if appointments.next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = appointments.next_cursor
+
+    return appointments.items
+
+
+@router.get("/{medspa_id}/stats")
+async def read_medspa_stats(
+    medspa_id: int,
+    session: AsyncSessionDep,
+    from_date: datetime.date | None = Query(None, alias="from"),
+    to_date: datetime.date | None = Query(None, alias="to"),
+) -> list[AppointmentStats]:
+    await medspa_repository.get_by_id(session, medspa_id)
+    return await stats_repository.get_daily(session, medspa_id, from_date, to_date)
+
+
 @router.post("/", status_code=201)
-def create_medspa(medspa: Medspa, session: SessionDep) -> Medspa:
-    item = medspa_repository.create(session, medspa)
+async def create_medspa(medspa: Medspa, session: AsyncSessionDep) -> Medspa:
+    item = await medspa_repository.create(session, medspa)
     return item
 
 
 @router.patch("/{medspa_id}")
-def update_medspa(medspa_id: int, medspa: Medspa, session: SessionDep) -> Medspa:
-    item = medspa_repository.update(session, medspa_id, medspa)
+async def update_medspa(
+    medspa_id: int,
+    medspa: Medspa,
+    session: AsyncSessionDep,
+    response: Response,
+    version: IfMatchDep,
+) -> Medspa:
+    item = await medspa_repository.update(session, medspa_id, medspa, version)
+    response.headers["ETag"] = version_etag(item.version)
     return item
 
 
 @router.delete("/{medspa_id}", status_code=204)
-def delete_medspa(medspa_id: int, session: SessionDep) -> None:
-    medspa_repository.delete(session, medspa_id)
+async def delete_medspa(medspa_id: int, session: AsyncSessionDep) -> None:
+    await medspa_repository.delete(session, medspa_id)
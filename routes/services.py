@@ -1,8 +1,11 @@
-from fastapi import APIRouter
-from database import SessionDep
-from models import Services
-from repositories.medspa import MedspaRepository
-from repositories.services import ServicesRepository
+from fastapi import APIRouter, Request, Response
+from conditional import IfMatchDep, check_etag, get_page_with_etag, version_etag
+from database import AsyncSessionDep
+from fieldsets import sparse_fields
+from models import BulkItemResult, BulkMode, ServiceRead, Services
+from pagination import NEXT_CURSOR_HEADER, PageDep
+from repositories.medspa import AsyncMedspaRepository
+from repositories.services import AsyncServicesRepository
 
 
 router = APIRouter(
@@ -10,36 +13,81 @@ router = APIRouter(
     tags=["services"],
 )
 
-services_repository = ServicesRepository()
-medspa_repository = MedspaRepository()
+services_repository = AsyncServicesRepository()
+medspa_repository = AsyncMedspaRepository()
 
+FieldsDep = sparse_fields(ServiceRead)
 
-@router.get("/")
-def read_services(session: SessionDep, medspa_id: int | None = None) -> list[Services]:
+
+@router.get("/", response_model_exclude_unset=True)
+async def read_services(
+    session: AsyncSessionDep,
+    page: PageDep,
+    fields: FieldsDep,
+    request: Request,
+    response: Response,
+    medspa_id: int | None = None,
+) -> list[ServiceRead]:
     filter = {"medspa_id": medspa_id} if medspa_id else {}
-    services = services_repository.get_all(session, **filter)
-    return services
+    services = await get_page_with_etag(
+        request,
+        response,
+        fields,
+        lambda fields: services_repository.get_page(
+            session, page.limit, page.cursor, fields, **filter
+        ),
+    )
+
+    if services.next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = services.next_cursor
+
+    return services.items
 
 
 @router.get("/{service_id}")
-def read_service(service_id: int, session: SessionDep) -> Services:
-    service = services_repository.get_by_id(session, service_id)
+async def read_service(
+    service_id: int, session: AsyncSessionDep, request: Request, response: Response
+) -> Services:
+    service = await services_repository.get_by_id(session, service_id)
+    check_etag(request, response, service, version_etag(service.version))
     return service
 
 
 @router.post("/", status_code=201)
-def create_service(service: Services, session: SessionDep) -> Services:
-    service.medspa = medspa_repository.get_by_id(session, service.medspa_id)
-    item = services_repository.create(session, service)
+async def create_service(service: Services, session: AsyncSessionDep) -> Services:
+    service.medspa = await medspa_repository.get_by_id(session, service.medspa_id)
+    item = await services_repository.create(session, service)
     return item
 
 
+@router.post("/bulk", status_code=201, response_model_exclude_none=True)
+async def create_services(
+    services: list[Services],
+    session: AsyncSessionDep,
+    response: Response,
+    mode: BulkMode = BulkMode.ATOMIC,
+) -> list[BulkItemResult]:
+    results = await services_repository.bulk_import(session, services, mode)
+
+    if any(result.status != 201 for result in results):
+        response.status_code = 207
+
+    return results
+
+
 @router.patch("/{service_id}")
-def update_service(service_id: int, service: Services, session: SessionDep) -> Services:
-    item = services_repository.update(session, service_id, service)
+async def update_service(
+    service_id: int,
+    service: Services,
+    session: AsyncSessionDep,
+    response: Response,
+    version: IfMatchDep,
+) -> Services:
+    item = await services_repository.update(session, service_id, service, version)
+    response.headers["ETag"] = version_etag(item.version)
     return item
 
 
 @router.delete("/{service_id}", status_code=204)
-def delete_service(service_id: int, session: SessionDep) -> None:
-    services_repository.delete(session, service_id)
+async def delete_service(service_id: int, session: AsyncSessionDep) -> None:
+    await services_repository.delete(session, service_id)
@@ -0,0 +1,71 @@
+import datetime
+import os
+from bisect import bisect_right
+
+OPENING_TIME = datetime.time.fromisoformat(os.getenv("OPENING_TIME", "09:00"))
+CLOSING_TIME = datetime.time.fromisoformat(os.getenv("CLOSING_TIME", "18:00"))
+SLOT_INTERVAL = datetime.timedelta(minutes=int(os.getenv("SLOT_INTERVAL_MINUTES", 15)))
+# Upper bound of an appointment length, used to find bookings that started
+# before a time window but still run into it
+MAX_APPOINTMENT_DURATION = datetime.timedelta(days=1)
+
+Interval = tuple[datetime.datetime, datetime.datetime]
+
+
+def merge_intervals(intervals: list[Interval]) -> list[Interval]:
+    """
+    Sort intervals and merge the ones that overlap or touch, so the result is
+    a sorted list of disjoint busy periods
+    """
+    merged: list[Interval] = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+
+    return merged
+
+
+def overlaps(
+    busy: list[Interval], start: datetime.datetime, end: datetime.datetime
+) -> bool:
+    """
+    Check whether [start, end) overlaps any interval of a merged busy list
+    """
+    # The only candidate is the last busy interval starting before `end`
+    index = bisect_right(busy, (end,)) - 1
+    return index >= 0 and busy[index][1] > start
+
+
+def find_free_slots(
+    busy: list[Interval],
+    opens_at: datetime.datetime,
+    closes_at: datetime.datetime,
+    duration: datetime.timedelta,
+    step: datetime.timedelta = SLOT_INTERVAL,
+) -> list[datetime.datetime]:
+    """
+    Get every start time, aligned to `step` from the opening time, at which
+    `duration` fits between opening and closing without overlapping a busy
+    interval. Walks the gaps of the merged busy list once, so the cost is
+    linear in bookings plus returned slots.
+    """
+    slots = []
+    gap_start = opens_at
+
+    for busy_start, busy_end in [*busy, (closes_at, closes_at)]:
+        gap_end = min(busy_start, closes_at)
+
+        # First aligned start time inside the gap
+        steps = -((opens_at - gap_start) // step)
+        slot = opens_at + steps * step
+        while slot + duration <= gap_end:
+            slots.append(slot)
+            slot += step
+
+        gap_start = max(gap_start, busy_end)
+        if gap_start >= closes_at:
+            break
+
+    return slots
@@ -1,16 +1,33 @@
+import csv
+import io
+import json
 from datetime import datetime, timedelta
 from fastapi import HTTPException
 from fastapi.testclient import TestClient
-from sqlmodel import Session
+from sqlalchemy import event
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlmodel import Session, select
 from repositories.appoitments import AppointmentsRepository
+from repositories.appoitments_services import AppointmentsServicesRepository
+from repositories.idempotency import IdempotencyRepository
 from repositories.medspa import MedspaRepository
 from repositories.services import ServicesRepository
-from models import AppointmentStatus, Appointments, Medspa, Services
+from repositories.stats import AppointmentStatsRepository
+from models import (
+    AppointmentStatus,
+    Appointments,
+    AppointmentsServices,
+    Medspa,
+    Services,
+)
 import pytest
 
 medspa_repository = MedspaRepository()
 services_repository = ServicesRepository()
 appointments_repository = AppointmentsRepository()
+appointments_services_repository = AppointmentsServicesRepository()
+stats_repository = AppointmentStatsRepository()
 
 
 @pytest.fixture(autouse=True)
@@ -147,6 +164,119 @@ def test_create_appointment(
     assert response.json()["total_duration"] == 90
 
 
+def test_create_appointment_rejects_other_services(
+    client: TestClient,
+    session: Session,
+    async_engine: AsyncEngine,
+    setup_medspa: Medspa,
+    setup_service: Services,
+):
+    other_medspa = Medspa(
+        name="Other Medspa",
+        address="456 Main St",
+        phone_number="123-456-7890",
+        email_address="other@example.com",
+    )
+    medspa_repository.create(session, other_medspa)
+    other_service = Services(
+        name="Other Service",
+        description="Other Description",
+        price=50,
+        duration=15,
+        medspa_id=other_medspa.id,
+    )
+    services_repository.create(session, other_service)
+
+    statements = []
+
+    @event.listens_for(async_engine.sync_engine, "before_cursor_execute")
+    def count_statements(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    response = client.post(
+        "/v1/appointments",
+        json={
+            "medspa_id": setup_medspa.id,
+            "services": [setup_service[0].id, other_service.id, 999],
+            "start_time": datetime.now().isoformat(),
+        },
+    )
+    assert response.status_code == 422
+    assert response.json() == {
+        "detail": f"Services not offered by medspa {setup_medspa.id}: "
+        f"{other_service.id}, 999"
+    }
+    assert appointments_repository.get_all(session) == []
+    # The totals are summed in SQL rather than from loaded services
+    assert not any("services.description" in statement for statement in statements)
+
+    response = client.post(
+        "/v1/appointments",
+        json={
+            "medspa_id": setup_medspa.id,
+            "services": [setup_service[0].id, setup_service[0].id],
+            "start_time": datetime.now().isoformat(),
+        },
+    )
+    assert response.status_code == 201
+    assert response.json()["total_price"] == "100.00"
+    assert response.json()["total_duration"] == 30
+
+    response = client.patch(
+        f"/v1/appointments/{response.json()['id']}",
+        json={"services": [other_service.id]},
+    )
+    assert response.status_code == 422
+
+
+def test_create_appointment_idempotency_key(
+    client: TestClient, session: Session, setup_medspa: Medspa, setup_service: Services
+):
+    booking = {
+        "medspa_id": setup_medspa.id,
+        "services": [setup_service[0].id, setup_service[1].id],
+        "start_time": "2030-01-01T09:00:00",
+    }
+    headers = {"Idempotency-Key": "booking-1"}
+
+    created = client.post("/v1/appointments", json=booking, headers=headers)
+    assert created.status_code == 201
+    assert "Idempotent-Replayed" not in created.headers
+
+    # A retry gets the same response without booking again, which would
+    # otherwise be rejected as overlapping the first booking
+    replayed = client.post("/v1/appointments", json=booking, headers=headers)
+    assert replayed.status_code == 201
+    assert replayed.headers["Idempotent-Replayed"] == "true"
+    assert replayed.json() == created.json()
+    assert len(appointments_repository.get_all(session)) == 1
+
+    other = {**booking, "start_time": "2030-01-02T09:00:00"}
+    response = client.post("/v1/appointments", json=other, headers=headers)
+    assert response.status_code == 422
+
+    # A failed request stores nothing, so its key can be retried
+    headers = {"Idempotency-Key": "booking-2"}
+    response = client.post("/v1/appointments", json=booking, headers=headers)
+    assert response.status_code == 409
+    response = client.post("/v1/appointments", json=other, headers=headers)
+    assert response.status_code == 201
+
+
+def test_idempotency_key_expires(session: Session):
+    idempotency_repository = IdempotencyRepository()
+    assert idempotency_repository.claim(session, "key", "hash") is None
+    idempotency_repository.store_response_and_flush(session, "key", 201, {"id": 1})
+    session.commit()
+
+    stored = idempotency_repository.claim(session, "key", "hash")
+    assert (stored.status_code, stored.response) == (201, {"id": 1})
+
+    stored.expires_at = datetime.now() - timedelta(seconds=1)
+    session.commit()
+    assert idempotency_repository.claim(session, "key", "hash") is None
+
+
 def test_update_appointment_status(
     client: TestClient, session: Session, setup_medspa: Medspa, setup_service: Services
 ):
@@ -182,6 +312,52 @@ def test_update_appointment_status(
     assert response.json()["total_duration"] == 75
 
 
+def test_update_appointment_if_match(
+    client: TestClient, session: Session, setup_medspa: Medspa, setup_service: Services
+):
+    appointment = Appointments(
+        medspa_id=setup_medspa.id,
+        start_time=datetime(2030, 1, 1, 9),
+        total_price=300,
+        total_duration=90,
+    )
+    appointments_repository.create(session, appointment)
+    url = f"/v1/appointments/{appointment.id}"
+
+    response = client.patch(
+        url, json={"services": [setup_service[0].id]}, headers={"If-Match": '"1"'}
+    )
+    assert response.status_code == 200
+    assert response.headers["ETag"] == '"2"'
+
+    # A stale version is rejected and the new service links are rolled back
+    response = client.patch(
+        url,
+        json={"status": "cancelled", "services": [setup_service[1].id]},
+        headers={"If-Match": '"1"'},
+    )
+    assert response.status_code == 412
+
+    appointment = client.get(url).json()
+    assert appointment["status"] == "scheduled"
+    assert [service["id"] for service in appointment["services"]] == [
+        setup_service[0].id
+    ]
+
+    # The rollup follows the appointment to its new status and totals
+    response = client.patch(
+        url, json={"status": "cancelled"}, headers={"If-Match": '"2"'}
+    )
+    assert response.status_code == 200
+    assert response.json()["version"] == 3
+
+    stats = stats_repository.get_daily(session, setup_medspa.id)
+    assert [(row.status, row.count) for row in stats] == [
+        (AppointmentStatus.CANCELLED, 1)
+    ]
+    assert stats[0].revenue == setup_service[0].price
+
+
 def test_delete_appointment(
     client: TestClient, session: Session, setup_medspa: Medspa, setup_service: Services
 ):
@@ -201,3 +377,729 @@ def test_delete_appointment(
         appointments_repository.get_by_id(session, appointment.id)
 
     assert exc_info.value.status_code == 404
+
+
+def test_get_appointments_paginated_by_start_time(
+    client: TestClient, session: Session, setup_medspa: Medspa
+):
+    start_time = datetime(2025, 1, 1, 9)
+    # Created in reverse order so that ids and start times disagree
+    for hours in [3, 2, 2, 1, 0]:
+        appointments_repository.create(
+            session,
+            Appointments(
+                medspa_id=setup_medspa.id,
+                start_time=start_time + timedelta(hours=hours),
+                total_price=300,
+                total_duration=90,
+            ),
+        )
+
+    ids = []
+    response = client.get("/v1/appointments?limit=2")
+    while True:
+        assert response.status_code == 200
+        assert len(response.json()) <= 2
+        ids += [item["id"] for item in response.json()]
+
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+        response = client.get(f"/v1/appointments?limit=2&cursor={cursor}")
+
+    assert ids == [5, 4, 2, 3, 1]
+
+
+def test_create_and_update_appointment_services_links(
+    client: TestClient, session: Session, setup_medspa: Medspa, setup_service: Services
+):
+    appointment = {
+        "medspa_id": setup_medspa.id,
+        "services": [setup_service[0].id, setup_service[1].id],
+        "start_time": datetime.now().isoformat(),
+    }
+
+    response = client.post("/v1/appointments", json=appointment)
+    assert response.status_code == 201
+    appointment_id = response.json()["id"]
+
+    links = appointments_services_repository.get_all(
+        session, appointment_id=appointment_id
+    )
+    assert sorted(link.service_id for link in links) == [
+        setup_service[0].id,
+        setup_service[1].id,
+    ]
+
+    response = client.patch(
+        f"/v1/appointments/{appointment_id}",
+        json={"services": [setup_service[1].id]},
+    )
+    assert response.status_code == 200
+    assert response.json()["total_price"] == "200.00"
+
+    session.expire_all()
+    links = appointments_services_repository.get_all(
+        session, appointment_id=appointment_id
+    )
+    assert [link.service_id for link in links] == [setup_service[1].id]
+
+
+def test_bulk_create_returns_persisted_items(
+    session: Session, setup_medspa: Medspa, setup_service: Services
+):
+    appointment = appointments_repository.create(
+        session,
+        Appointments(
+            medspa_id=setup_medspa.id,
+            start_time=datetime.now(),
+            total_price=300,
+            total_duration=90,
+        ),
+    )
+
+    links = appointments_services_repository.bulk_create(
+        session,
+        [
+            AppointmentsServices(appointment_id=appointment.id, service_id=service.id)
+            for service in setup_service
+        ],
+    )
+
+    assert len(links) == 2
+    assert all(link.id is not None for link in links)
+    assert [link.service_id for link in links] == [s.id for s in setup_service]
+    assert appointments_services_repository.bulk_create(session, []) == []
+
+
+def test_get_appointments_include_services(
+    client: TestClient,
+    session: Session,
+    async_engine: AsyncEngine,
+    setup_medspa: Medspa,
+    setup_service: Services,
+):
+    for hours, services in enumerate([setup_service, setup_service[:1], []]):
+        response = client.post(
+            "/v1/appointments",
+            json={
+                "medspa_id": setup_medspa.id,
+                "services": [service.id for service in services],
+                "start_time": (datetime.now() + timedelta(hours=2 * hours)).isoformat(),
+            },
+        )
+        assert response.status_code == 201
+
+    statements = []
+
+    @event.listens_for(async_engine.sync_engine, "before_cursor_execute")
+    def count_statements(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    response = client.get("/v1/appointments?include=services")
+    assert response.status_code == 200
+    assert [
+        [service["name"] for service in item["services"]] for item in response.json()
+    ] == [["Test Service 1", "Test Service 2"], ["Test Service 1"], []]
+
+    # One query for the page and one for the services of the whole page
+    assert len(statements) == 2
+
+    response = client.get("/v1/appointments")
+    assert response.status_code == 200
+    assert all("services" not in item for item in response.json())
+
+    # The sort key is selected for the cursor but only returned when asked for
+    response = client.get("/v1/appointments?include=services&fields=status&limit=2")
+    assert response.status_code == 200
+    assert [set(item) for item in response.json()] == [{"id", "status", "services"}] * 2
+    cursor = response.headers["X-Next-Cursor"]
+    response = client.get(f"/v1/appointments?fields=status&cursor={cursor}")
+    assert [set(item) for item in response.json()] == [{"id", "status"}]
+
+
+def test_get_appointment_with_services_single_query(
+    client: TestClient,
+    async_engine: AsyncEngine,
+    setup_medspa: Medspa,
+    setup_service: Services,
+):
+    response = client.post(
+        "/v1/appointments",
+        json={
+            "medspa_id": setup_medspa.id,
+            "services": [service.id for service in setup_service],
+            "start_time": datetime.now().isoformat(),
+        },
+    )
+    appointment_id = response.json()["id"]
+
+    statements = []
+
+    @event.listens_for(async_engine.sync_engine, "before_cursor_execute")
+    def count_statements(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    response = client.get(f"/v1/appointments/{appointment_id}")
+    assert response.status_code == 200
+    assert response.json()["total_price"] == "300.00"
+    assert [service["price"] for service in response.json()["services"]] == [
+        "100.00",
+        "200.00",
+    ]
+    assert len(statements) == 1
+
+    response = client.get("/v1/appointments/999")
+    assert response.status_code == 404
+    assert response.json() == {"detail": "Appointments not found"}
+
+
+def test_get_appointments_not_modified(
+    client: TestClient,
+    async_engine: AsyncEngine,
+    setup_medspa: Medspa,
+    setup_service: Services,
+):
+    response = client.post(
+        "/v1/appointments",
+        json={
+            "medspa_id": setup_medspa.id,
+            "services": [setup_service[0].id],
+            "start_time": datetime.now().isoformat(),
+        },
+    )
+    appointment_id = response.json()["id"]
+
+    response = client.get("/v1/appointments?fields=status")
+    etag = response.headers["ETag"]
+    assert etag.startswith('W/"')
+    assert response.json() == [{"id": appointment_id, "status": "scheduled"}]
+
+    statements = []
+
+    @event.listens_for(async_engine.sync_engine, "before_cursor_execute")
+    def count_statements(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    response = client.get(
+        "/v1/appointments?fields=status", headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    # Only the versions of the page are read
+    assert len(statements) == 1
+
+    client.patch(f"/v1/appointments/{appointment_id}", json={"status": "completed"})
+    response = client.get(
+        "/v1/appointments?fields=status", headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert response.json() == [{"id": appointment_id, "status": "completed"}]
+
+
+def test_get_appointment_etag_follows_services(
+    client: TestClient, setup_medspa: Medspa, setup_service: Services
+):
+    response = client.post(
+        "/v1/appointments",
+        json={
+            "medspa_id": setup_medspa.id,
+            "services": [setup_service[0].id],
+            "start_time": datetime.now().isoformat(),
+        },
+    )
+    appointment_id = response.json()["id"]
+
+    etag = client.get(f"/v1/appointments/{appointment_id}").headers["ETag"]
+    response = client.get(
+        f"/v1/appointments/{appointment_id}", headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 304
+
+    client.patch(f"/v1/services/{setup_service[0].id}", json={"name": "Renamed"})
+    response = client.get(
+        f"/v1/appointments/{appointment_id}", headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 200
+    assert response.json()["services"][0]["name"] == "Renamed"
+
+    # The ETag still carries the appointment version for If-Match
+    response = client.patch(
+        f"/v1/appointments/{appointment_id}",
+        json={"status": "cancelled"},
+        headers={"If-Match": response.headers["ETag"]},
+    )
+    assert response.status_code == 200
+
+
+def test_export_appointments(
+    client: TestClient, session: Session, setup_medspa: Medspa
+):
+    other_medspa = Medspa(
+        name="Other Medspa",
+        address="456 Main St",
+        phone_number="123-456-7890",
+        email_address="other@example.com",
+    )
+    medspa_repository.create(session, other_medspa)
+
+    for medspa, start_time in [
+        (setup_medspa, datetime(2025, 1, 1, 9)),
+        (setup_medspa, datetime(2025, 1, 2, 9)),
+        (other_medspa, datetime(2025, 1, 2, 10)),
+        (setup_medspa, datetime(2025, 1, 3, 9)),
+    ]:
+        appointments_repository.create(
+            session,
+            Appointments(
+                medspa_id=medspa.id,
+                start_time=start_time,
+                total_price=300,
+                total_duration=90,
+            ),
+        )
+
+    response = client.get("/v1/appointments/export")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["id"] for row in rows] == [1, 2, 3, 4]
+    assert rows[0]["total_price"] == "300.00"
+    assert rows[0]["start_time"] == "2025-01-01T09:00:00"
+    assert rows[0]["status"] == "scheduled"
+
+    response = client.get(
+        "/v1/appointments/export?format=csv&from=2025-01-02&to=2025-01-02"
+        f"&medspa_id={setup_medspa.id}"
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [row["id"] for row in rows] == ["2"]
+    assert rows[0]["total_price"] == "300.00"
+
+    response = client.get("/v1/appointments/export?format=csv&from=2030-01-01")
+    assert response.text.splitlines() == [
+        "id,created_at,updated_at,version,medspa_id,start_time,"
+        "total_price,total_duration,status"
+    ]
+
+
+def test_create_appointment_rejects_overlapping_booking(
+    client: TestClient, session: Session, setup_medspa: Medspa, setup_service: Services
+):
+    appointments_repository.create(
+        session,
+        Appointments(
+            medspa_id=setup_medspa.id,
+            start_time=datetime(2025, 1, 1, 10),
+            total_price=300,
+            total_duration=90,
+        ),
+    )
+    appointments_repository.create(
+        session,
+        Appointments(
+            medspa_id=setup_medspa.id,
+            start_time=datetime(2025, 1, 1, 14),
+            total_price=300,
+            total_duration=90,
+            status=AppointmentStatus.CANCELLED,
+        ),
+    )
+
+    def book(start_time: datetime):
+        return client.post(
+            "/v1/appointments",
+            json={
+                "medspa_id": setup_medspa.id,
+                "services": [setup_service[0].id],
+                "start_time": start_time.isoformat(),
+            },
+        )
+
+    response = book(datetime(2025, 1, 1, 11))
+    assert response.status_code == 409
+    assert response.json() == {"detail": "Appointment overlaps an existing booking"}
+
+    # Touching the end of a booking or a cancelled slot is fine
+    assert book(datetime(2025, 1, 1, 11, 30)).status_code == 201
+    assert book(datetime(2025, 1, 1, 14)).status_code == 201
+
+    # Adding services that make it run into the next booking is rejected too
+    response = book(datetime(2025, 1, 1, 9))
+    assert response.status_code == 201
+    response = client.patch(
+        f"/v1/appointments/{response.json()['id']}",
+        json={"services": [service.id for service in setup_service]},
+    )
+    assert response.status_code == 409
+
+
+def test_get_medspa_appointments(
+    client: TestClient,
+    session: Session,
+    async_engine: AsyncEngine,
+    setup_medspa: Medspa,
+):
+    other_medspa = Medspa(
+        name="Other Medspa",
+        address="456 Main St",
+        phone_number="123-456-7890",
+        email_address="other@example.com",
+    )
+    medspa_repository.create(session, other_medspa)
+
+    for medspa, start_time, status in [
+        (setup_medspa, datetime(2025, 1, 6, 10), AppointmentStatus.SCHEDULED),
+        (setup_medspa, datetime(2025, 1, 8, 10), AppointmentStatus.CANCELLED),
+        (setup_medspa, datetime(2025, 1, 12, 17), AppointmentStatus.SCHEDULED),
+        (setup_medspa, datetime(2025, 1, 13, 9), AppointmentStatus.SCHEDULED),
+        (other_medspa, datetime(2025, 1, 7, 10), AppointmentStatus.SCHEDULED),
+    ]:
+        appointments_repository.create(
+            session,
+            Appointments(
+                medspa_id=medspa.id,
+                start_time=start_time,
+                total_price=100,
+                total_duration=30,
+                status=status,
+            ),
+        )
+
+    statements = []
+
+    @event.listens_for(async_engine.sync_engine, "before_cursor_execute")
+    def count_statements(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    url = f"/v1/medspas/{setup_medspa.id}/appointments?from=2025-01-06&to=2025-01-12"
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.json() == [
+        {
+            "id": 1,
+            "start_time": "2025-01-06T10:00:00",
+            "total_duration": 30,
+            "status": "scheduled",
+        },
+        {
+            "id": 2,
+            "start_time": "2025-01-08T10:00:00",
+            "total_duration": 30,
+            "status": "cancelled",
+        },
+        {
+            "id": 3,
+            "start_time": "2025-01-12T17:00:00",
+            "total_duration": 30,
+            "status": "scheduled",
+        },
+    ]
+    calendar = [s for s in statements if "FROM appointments" in s]
+    assert len(calendar) == 1
+    assert "appointments.medspa_id = ?" in calendar[0]
+    assert "appointments.total_price" not in calendar[0]
+
+    response = client.get(f"{url}&status=scheduled&limit=1")
+    assert [item["id"] for item in response.json()] == [1]
+    response = client.get(
+        f"{url}&status=scheduled&limit=1&cursor={response.headers['X-Next-Cursor']}"
+    )
+    assert [item["id"] for item in response.json()] == [3]
+
+    response = client.get(
+        url, headers={"If-None-Match": client.get(url).headers["ETag"]}
+    )
+    assert response.status_code == 304
+
+    response = client.get("/v1/medspas/999/appointments")
+    assert response.status_code == 404
+
+
+def test_get_medspa_availability(
+    client: TestClient, session: Session, setup_medspa: Medspa
+):
+    for start_time, duration in [
+        (datetime(2025, 1, 1, 10), 60),
+        (datetime(2025, 1, 1, 10, 30), 30),
+        (datetime(2025, 1, 1, 11), 360),
+        # Started the day before and runs past the opening time
+        (datetime(2024, 12, 31, 23), 615),
+    ]:
+        appointments_repository.create(
+            session,
+            Appointments(
+                medspa_id=setup_medspa.id,
+                start_time=start_time,
+                total_price=300,
+                total_duration=duration,
+            ),
+        )
+
+    response = client.get(
+        f"/v1/medspas/{setup_medspa.id}/availability?date=2025-01-01&duration=45"
+    )
+    assert response.status_code == 200
+    assert response.json() == {
+        "medspa_id": setup_medspa.id,
+        "date": "2025-01-01",
+        "duration": 45,
+        "slots": [
+            "2025-01-01T09:15:00",
+            "2025-01-01T17:00:00",
+            "2025-01-01T17:15:00",
+        ],
+    }
+
+    response = client.get("/v1/medspas/999/availability?date=2025-01-01&duration=45")
+    assert response.status_code == 404
+
+
+def compile_filters(**filters):
+    query = appointments_repository.filter_query(select(Appointments), **filters)
+    compiled = query.compile(dialect=sqlite.dialect())
+    where = str(compiled).split("WHERE", 1)[-1]
+    return " ".join(where.split()), compiled.params
+
+
+def test_filter_query_composes_status_and_date():
+    # The date filter used to replace the query and drop the status filter
+    where, params = compile_filters(
+        status=AppointmentStatus.SCHEDULED, date=datetime(2025, 1, 1).date()
+    )
+
+    assert where == (
+        "appointments.start_time >= ? AND appointments.start_time < ? "
+        "AND appointments.status = ?"
+    )
+    assert list(params.values()) == [
+        datetime(2025, 1, 1),
+        datetime(2025, 1, 2),
+        AppointmentStatus.SCHEDULED,
+    ]
+
+
+def test_filter_query_merges_date_ranges_into_one_range():
+    where, params = compile_filters(
+        from_date=datetime(2025, 1, 1).date(),
+        to_date=datetime(2025, 1, 31).date(),
+        date=datetime(2025, 1, 10).date(),
+        medspa_id=1,
+    )
+
+    assert where == (
+        "appointments.start_time >= ? AND appointments.start_time < ? "
+        "AND appointments.medspa_id = ?"
+    )
+    assert list(params.values()) == [datetime(2025, 1, 10), datetime(2025, 1, 11), 1]
+
+    where, params = compile_filters(to_date=datetime(2025, 1, 31).date())
+    assert where == "appointments.start_time < ?"
+    assert list(params.values()) == [datetime(2025, 2, 1)]
+
+
+def test_filter_query_by_service():
+    where, params = compile_filters(service_id=2)
+
+    assert where == (
+        "EXISTS (SELECT * FROM appointments_services "
+        "WHERE appointments_services.appointment_id = appointments.id "
+        "AND appointments_services.service_id = ?)"
+    )
+    assert list(params.values()) == [2]
+
+
+def test_get_appointments_combined_filters(
+    client: TestClient, session: Session, setup_medspa: Medspa, setup_service: Services
+):
+    for day, status in [
+        (1, AppointmentStatus.SCHEDULED),
+        (1, AppointmentStatus.CANCELLED),
+        (2, AppointmentStatus.SCHEDULED),
+        (5, AppointmentStatus.SCHEDULED),
+    ]:
+        appointments_repository.create(
+            session,
+            Appointments(
+                medspa_id=setup_medspa.id,
+                start_time=datetime(2025, 1, day, 23, 59, 59, 999999),
+                total_price=300,
+                total_duration=90,
+                status=status,
+            ),
+        )
+    appointments_services_repository.create(
+        session, AppointmentsServices(appointment_id=3, service_id=setup_service[0].id)
+    )
+
+    def ids(query: str) -> list[int]:
+        response = client.get(f"/v1/appointments?{query}")
+        assert response.status_code == 200
+        return [item["id"] for item in response.json()]
+
+    assert ids("status=scheduled&date=2025-01-01") == [1]
+    assert ids("status=scheduled&from=2025-01-01&to=2025-01-02") == [1, 3]
+    assert ids("from=2025-01-02") == [3, 4]
+    assert ids(f"medspa_id={setup_medspa.id}&to=2025-01-01") == [1, 2]
+    assert ids("medspa_id=999") == []
+    assert ids(f"service_id={setup_service[0].id}") == [3]
+
+
+def test_create_appointments_bulk(
+    client: TestClient, session: Session, setup_medspa: Medspa, setup_service: Services
+):
+    appointments_repository.create(
+        session,
+        Appointments(
+            medspa_id=setup_medspa.id,
+            start_time=datetime(2025, 1, 1, 9),
+            total_price=300,
+            total_duration=60,
+        ),
+    )
+
+    def booking(hour: int, medspa_id: int = setup_medspa.id) -> dict:
+        return {
+            "medspa_id": medspa_id,
+            "services": [service.id for service in setup_service],
+            "start_time": datetime(2025, 1, 1, hour).isoformat(),
+        }
+
+    bookings = [
+        booking(10),
+        # Overlaps the previous booking of the same batch
+        booking(11),
+        # Overlaps the existing booking
+        booking(8),
+        booking(12, medspa_id=999),
+        booking(14),
+        # Not a service of the medspa
+        {**booking(16), "services": [999]},
+    ]
+
+    response = client.post("/v1/appointments/bulk", json=bookings)
+    assert response.status_code == 422
+    assert [item["status"] for item in response.json()["detail"]] == [
+        201,
+        409,
+        409,
+        404,
+        201,
+        422,
+    ]
+    assert response.json()["detail"][5]["detail"] == (
+        f"Services not offered by medspa {setup_medspa.id}: 999"
+    )
+    assert len(appointments_repository.get_all(session)) == 1
+
+    response = client.post("/v1/appointments/bulk?mode=best_effort", json=bookings)
+    assert response.status_code == 207
+    assert [item["status"] for item in response.json()] == [
+        201,
+        409,
+        409,
+        404,
+        201,
+        422,
+    ]
+    assert [item.get("id") for item in response.json()] == [
+        2,
+        None,
+        None,
+        None,
+        3,
+        None,
+    ]
+
+    response = client.get("/v1/appointments/3")
+    assert response.json()["total_price"] == "300.00"
+    assert response.json()["total_duration"] == 90
+    assert len(response.json()["services"]) == 2
+
+
+def test_get_medspa_stats(
+    client: TestClient, session: Session, setup_medspa: Medspa, setup_service: Services
+):
+    service_ids = [service.id for service in setup_service]
+
+    def book(start_time: datetime, services: list[int]) -> int:
+        response = client.post(
+            "/v1/appointments",
+            json={
+                "medspa_id": setup_medspa.id,
+                "services": services,
+                "start_time": start_time.isoformat(),
+            },
+        )
+        return response.json()["id"]
+
+    first = book(datetime(2025, 1, 1, 9), service_ids)
+    book(datetime(2025, 1, 1, 11), service_ids[:1])
+    cancelled = book(datetime(2025, 1, 2, 9), service_ids)
+    deleted = book(datetime(2025, 1, 3, 9), service_ids)
+    client.post(
+        "/v1/appointments/bulk",
+        json=[
+            {
+                "medspa_id": setup_medspa.id,
+                "services": service_ids[1:],
+                "start_time": datetime(2025, 1, 2, 12).isoformat(),
+            }
+        ],
+    )
+
+    client.patch(f"/v1/appointments/{first}", json={"services": service_ids[1:]})
+    client.patch(f"/v1/appointments/{cancelled}", json={"status": "cancelled"})
+    client.delete(f"/v1/appointments/{deleted}")
+
+    response = client.get(
+        f"/v1/medspas/{setup_medspa.id}/stats",
+        params={"from": "2025-01-01", "to": "2025-01-03"},
+    )
+    assert response.status_code == 200
+    assert [
+        (row["day"], row["status"], row["count"], row["revenue"], row["booked_minutes"])
+        for row in response.json()
+    ] == [
+        ("2025-01-01", "scheduled", 2, "300.00", 90),
+        ("2025-01-02", "cancelled", 1, "300.00", 90),
+        ("2025-01-02", "scheduled", 1, "200.00", 60),
+    ]
+
+    response = client.get(
+        f"/v1/medspas/{setup_medspa.id}/stats", params={"from": "2025-01-02"}
+    )
+    assert [row["day"] for row in response.json()] == ["2025-01-02", "2025-01-02"]
+
+    response = client.get("/v1/medspas/999/stats")
+    assert response.status_code == 404
+
+
+def test_rebuild_medspa_stats(session: Session, setup_medspa: Medspa):
+    for hour in (9, 11):
+        appointments_repository.create(
+            session,
+            Appointments(
+                medspa_id=setup_medspa.id,
+                start_time=datetime(2025, 1, 1, hour),
+                total_price=300,
+                total_duration=90,
+            ),
+        )
+    incremental = [
+        stats.model_dump()
+        for stats in stats_repository.get_daily(session, setup_medspa.id)
+    ]
+
+    stats_repository.rebuild(session)
+    rebuilt = [
+        stats.model_dump()
+        for stats in stats_repository.get_daily(session, setup_medspa.id)
+    ]
+
+    assert rebuilt == incremental
+    assert incremental[0]["count"] == 2
+    assert incremental[0]["booked_minutes"] == 180
@@ -0,0 +1,53 @@
+from sqlalchemy import Engine, func
+from sqlmodel import Session, select
+from benchmarks.dataset import Dataset, generate
+from benchmarks.scenarios import SCENARIOS, get_routes
+from main import app
+from models import (
+    AppointmentStats,
+    AppointmentStatus,
+    Appointments,
+    AppointmentsServices,
+    Services,
+)
+
+
+def test_scenarios_cover_every_route():
+    assert {scenario.route for scenario in SCENARIOS} == get_routes(app)
+
+
+def test_generate_dataset(engine: Engine, session: Session):
+    dataset = Dataset(medspas=3, services_per_medspa=4, appointments=500, days=60)
+    generate(engine, dataset)
+
+    appointments = session.exec(select(Appointments)).all()
+    assert len(appointments) == 500
+
+    # Totals match the services each appointment is linked to
+    totals = {
+        appointment_id: (price, duration)
+        for appointment_id, price, duration in session.exec(
+            select(
+                AppointmentsServices.appointment_id,
+                func.sum(Services.price),
+                func.sum(Services.duration),
+            )
+            .join(Services, Services.id == AppointmentsServices.service_id)
+            .where(Services.medspa_id == Appointments.medspa_id)
+            .where(AppointmentsServices.appointment_id == Appointments.id)
+            .group_by(AppointmentsServices.appointment_id)
+        )
+    }
+    assert all(
+        totals[appointment.id] == (appointment.total_price, appointment.total_duration)
+        for appointment in appointments
+    )
+
+    for appointment in appointments:
+        assert appointment.start_time.hour in range(9, 18)
+        if appointment.start_time.date() >= dataset.today:
+            assert appointment.status != AppointmentStatus.COMPLETED
+
+    # The rollup is rebuilt after the bulk writes
+    count = session.exec(select(func.sum(AppointmentStats.count))).one()
+    assert count == 500
@@ -0,0 +1,83 @@
+import time
+from cache import MemoryCache, RedisCache
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        value = self.data.get(key)
+        if value is None:
+            return None
+
+        value, expires_at = value
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self.data[key]
+            return None
+
+        return value
+
+    def set(self, key, value, ex=None):
+        expires_at = time.monotonic() + ex if ex is not None else None
+        self.data[key] = (value, expires_at)
+
+    def incr(self, key):
+        value = int(self.get(key) or 0) + 1
+        self.data[key] = (str(value).encode(), None)
+        return value
+
+    def scan_iter(self, match):
+        return [key for key in self.data if key.startswith(match.rstrip("*"))]
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+
+def test_memory_cache_expires_entries():
+    cache = MemoryCache()
+    cache.set("key", b"value", ttl=60)
+    cache.set("expired", b"value", ttl=0)
+
+    assert cache.get("key") == b"value"
+    assert cache.get("expired") is None
+    assert cache.get("missing") is None
+
+
+def test_memory_cache_evicts_least_recently_used():
+    cache = MemoryCache(max_entries=2)
+    cache.set("a", b"1", ttl=60)
+    cache.set("b", b"2", ttl=60)
+    cache.get("a")
+    cache.set("c", b"3", ttl=60)
+
+    assert cache.get("a") == b"1"
+    assert cache.get("b") is None
+    assert cache.get("c") == b"3"
+
+
+def test_memory_cache_counters_are_not_evicted():
+    cache = MemoryCache(max_entries=1)
+    assert cache.get_counter("version") == 0
+    assert cache.incr("version") == 1
+
+    cache.set("a", b"1", ttl=60)
+    cache.set("b", b"2", ttl=60)
+    assert cache.get_counter("version") == 1
+
+
+def test_redis_cache():
+    client = FakeRedis()
+    cache = RedisCache(client, prefix="test:")
+    cache.set("key", b"value", ttl=60)
+
+    assert client.get("test:key") == b"value"
+    assert cache.get("key") == b"value"
+    assert cache.get_counter("version") == 0
+    assert cache.incr("version") == 1
+    assert cache.get_counter("version") == 1
+
+    cache.clear()
+    assert cache.get("key") is None
+    assert client.data == {}
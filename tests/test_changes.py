@@ -0,0 +1,141 @@
+import json
+import pytest
+from fastapi.testclient import TestClient
+from routes import changes
+
+
+@pytest.fixture(autouse=True)
+def fast_polling(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(changes, "CHANGES_POLL_INTERVAL", 0.01)
+    monkeypatch.setattr(changes, "CHANGES_STREAM_DURATION", 0.1)
+
+
+def create_medspa(client: TestClient) -> dict:
+    response = client.post(
+        "/v1/medspas",
+        json={
+            "name": "Test Medspa",
+            "address": "123 Main St",
+            "phone_number": "123-456-7890",
+            "email_address": "test@example.com",
+        },
+    )
+    assert response.status_code == 201
+    return response.json()
+
+
+def create_service(client: TestClient, medspa_id: int) -> dict:
+    response = client.post(
+        "/v1/services",
+        json={
+            "name": "Test Service",
+            "description": "Test Description",
+            "price": "100.00",
+            "duration": 30,
+            "medspa_id": medspa_id,
+        },
+    )
+    return response.json()
+
+
+def summary(changes: list[dict]) -> list[tuple]:
+    return [
+        (change["table_name"], change["row_id"], change["operation"])
+        for change in changes
+    ]
+
+
+def test_changes_record_writes(client: TestClient):
+    medspa = create_medspa(client)
+    service = create_service(client, medspa["id"])
+    client.patch(f"/v1/services/{service['id']}", json={"duration": 45})
+    client.delete(f"/v1/services/{service['id']}")
+
+    response = client.get("/v1/changes")
+    assert response.status_code == 200
+    assert summary(response.json()) == [
+        ("medspa", medspa["id"], "insert"),
+        ("services", service["id"], "insert"),
+        ("services", service["id"], "update"),
+        ("services", service["id"], "delete"),
+    ]
+    update = response.json()[2]
+    assert update["version"] == 2
+    assert update["data"]["duration"] == 45
+    assert response.json()[3]["data"] is None
+
+    # The cursor of a page is where the next sync resumes
+    response = client.get("/v1/changes?limit=2")
+    response = client.get(
+        f"/v1/changes?since={response.headers['X-Next-Cursor']}&limit=1"
+    )
+    assert summary(response.json()) == [("services", service["id"], "update")]
+    assert client.get("/v1/changes?since=bogus").status_code == 400
+
+    response = client.get("/v1/changes?table=medspa")
+    assert summary(response.json()) == [("medspa", medspa["id"], "insert")]
+
+    assert client.get("/v1/changes?table=outbox").status_code == 422
+
+
+def test_changes_record_cascaded_deletes(client: TestClient):
+    medspa = create_medspa(client)
+    service = create_service(client, medspa["id"])
+    response = client.post(
+        "/v1/appointments",
+        json={
+            "medspa_id": medspa["id"],
+            "services": [service["id"]],
+            "start_time": "2030-01-01T09:00:00",
+        },
+    )
+    appointment = response.json()
+    since = client.get("/v1/changes").headers["X-Next-Cursor"]
+
+    client.delete(f"/v1/medspas/{medspa['id']}")
+    response = client.get(f"/v1/changes?since={since}")
+    assert summary(response.json()) == [
+        ("services", service["id"], "delete"),
+        ("appointments", appointment["id"], "delete"),
+        ("medspa", medspa["id"], "delete"),
+    ]
+
+
+def test_changes_long_poll_times_out_empty(client: TestClient):
+    medspa = create_medspa(client)
+    since = client.get("/v1/changes").headers["X-Next-Cursor"]
+
+    response = client.get(f"/v1/changes?since={since}&wait=0.05")
+    assert response.status_code == 200
+    assert response.json() == []
+    assert response.headers["X-Next-Cursor"] == since
+
+    assert client.get("/v1/changes?wait=31").status_code == 422
+    assert summary(client.get("/v1/changes?wait=1").json()) == [
+        ("medspa", medspa["id"], "insert")
+    ]
+
+
+def test_changes_event_stream(client: TestClient):
+    first = create_medspa(client)
+    second = create_medspa(client)
+
+    def read_events(headers: dict) -> list[dict]:
+        headers = {"Accept": "text/event-stream", **headers}
+        response = client.get("/v1/changes", headers=headers)
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = []
+        for block in response.text.split("\n\n"):
+            fields = dict(
+                line.split(": ", 1) for line in block.splitlines() if ": " in line
+            )
+            if fields.get("event") == "change":
+                events.append({"id": fields["id"], **json.loads(fields["data"])})
+        return events
+
+    events = read_events({})
+    assert [event["row_id"] for event in events] == [first["id"], second["id"]]
+
+    # A reconnecting client resumes after the last event it received
+    events = read_events({"Last-Event-ID": events[0]["id"]})
+    assert [event["row_id"] for event in events] == [second["id"]]
@@ -0,0 +1,164 @@
+import asyncio
+from datetime import datetime, timedelta
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlmodel import Session, select
+from jobs import JobWorker, handlers
+from models import Medspa, OutboxJob, Services
+from repositories.medspa import MedspaRepository
+from repositories.outbox import APPOINTMENT_BOOKED
+from repositories.services import ServicesRepository
+
+medspa_repository = MedspaRepository()
+services_repository = ServicesRepository()
+
+
+@pytest.fixture(name="handled")
+def handled_fixture(monkeypatch: pytest.MonkeyPatch):
+    handled = []
+
+    async def record(payload: dict) -> None:
+        handled.append(payload)
+
+    monkeypatch.setitem(handlers, APPOINTMENT_BOOKED, record)
+    return handled
+
+
+@pytest.fixture(name="service")
+def service_fixture(session: Session) -> Services:
+    medspa = Medspa(
+        name="Test Medspa",
+        address="123 Main St",
+        phone_number="123-456-7890",
+        email_address="test@example.com",
+    )
+    medspa_repository.create(session, medspa)
+    service = Services(
+        name="Test Service",
+        description="Test Description",
+        price=100,
+        duration=30,
+        medspa_id=medspa.id,
+    )
+    return services_repository.create(session, service)
+
+
+def book(client: TestClient, service: Services, hour: int = 10) -> dict:
+    response = client.post(
+        "/v1/appointments",
+        json={
+            "medspa_id": service.medspa_id,
+            "services": [service.id],
+            "start_time": datetime(2025, 1, 1, hour).isoformat(),
+        },
+    )
+    assert response.status_code == 201
+    return response.json()
+
+
+def get_jobs(session: Session) -> list[OutboxJob]:
+    session.expire_all()
+    return session.exec(select(OutboxJob)).all()
+
+
+def test_booking_enqueues_job(
+    client: TestClient,
+    session: Session,
+    async_engine: AsyncEngine,
+    service: Services,
+    handled: list,
+):
+    appointment = book(client, service)
+
+    # Committed with the appointment, and not run by the request itself
+    jobs = get_jobs(session)
+    assert [(job.topic, job.payload) for job in jobs] == [
+        (APPOINTMENT_BOOKED, {"appointment_id": appointment["id"]})
+    ]
+    assert handled == []
+
+    asyncio.run(JobWorker(async_engine).drain())
+    assert handled == [{"appointment_id": appointment["id"]}]
+    assert get_jobs(session) == []
+
+
+def test_bulk_booking_enqueues_jobs(
+    client: TestClient, session: Session, service: Services
+):
+    response = client.post(
+        "/v1/appointments/bulk",
+        json=[
+            {
+                "medspa_id": service.medspa_id,
+                "services": [service.id],
+                "start_time": datetime(2025, 1, 1, hour).isoformat(),
+            }
+            for hour in (10, 11)
+        ],
+    )
+    assert response.status_code == 201
+    assert [job.payload["appointment_id"] for job in get_jobs(session)] == [
+        item["id"] for item in response.json()
+    ]
+
+
+def test_failed_job_is_retried_with_backoff(
+    client: TestClient,
+    session: Session,
+    async_engine: AsyncEngine,
+    service: Services,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    async def fail(payload: dict) -> None:
+        raise RuntimeError("provider unavailable")
+
+    monkeypatch.setitem(handlers, APPOINTMENT_BOOKED, fail)
+    book(client, service)
+    worker = JobWorker(async_engine, max_attempts=2, backoff=60)
+
+    started = datetime.now()
+    asyncio.run(worker.drain())
+    [job] = get_jobs(session)
+    assert job.attempts == 1
+    assert job.last_error == "RuntimeError('provider unavailable')"
+    assert job.available_at >= started + timedelta(seconds=60)
+
+    # Not due yet, so another drain leaves it alone
+    asyncio.run(worker.drain())
+    assert get_jobs(session)[0].attempts == 1
+
+    job.available_at = datetime.now()
+    session.add(job)
+    session.commit()
+    asyncio.run(worker.drain())
+
+    # Given up after the last attempt, and kept with its error
+    [job] = get_jobs(session)
+    assert job.attempts == 2
+    assert job.available_at is None
+
+
+def test_worker_runs_jobs_when_notified(
+    client: TestClient,
+    session: Session,
+    async_engine: AsyncEngine,
+    service: Services,
+    handled: list,
+):
+    appointments = [book(client, service, hour) for hour in (10, 11, 12)]
+
+    async def run():
+        worker = JobWorker(async_engine, concurrency=2, poll_interval=60)
+        await worker.start()
+        worker.notify()
+        for _ in range(100):
+            if len(handled) == len(appointments):
+                break
+            await asyncio.sleep(0.01)
+        await worker.stop()
+
+    asyncio.run(run())
+    assert sorted(payload["appointment_id"] for payload in handled) == [
+        appointment["id"] for appointment in appointments
+    ]
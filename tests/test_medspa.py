@@ -1,9 +1,17 @@
 from fastapi import HTTPException
 import pytest
 from fastapi.testclient import TestClient
-from sqlmodel import Session
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlmodel import Session, select
 from repositories.medspa import MedspaRepository
-from models import Medspa
+from models import (
+    AppointmentStats,
+    Appointments,
+    AppointmentsServices,
+    Medspa,
+    Services,
+)
 
 medspa_repository = MedspaRepository()
 
@@ -27,6 +35,7 @@ def test_create_medspa(client: TestClient):
         "email_address": "test@example.com",
         "created_at": response.json()["created_at"],
         "updated_at": response.json()["updated_at"],
+        "version": 1,
     }
 
 
@@ -73,6 +82,61 @@ def test_update_medspa(client: TestClient, session: Session):
     assert response.json()["phone_number"] == medspa.phone_number
 
 
+def test_update_medspa_if_match(
+    client: TestClient, session: Session, async_engine: AsyncEngine
+):
+    medspa = Medspa(
+        name="Test Medspa",
+        address="123 Main St",
+        phone_number="123-456-7890",
+        email_address="test@example.com",
+    )
+    medspa_repository.create(session, medspa)
+    etag = client.get(f"/v1/medspas/{medspa.id}").headers["ETag"]
+
+    statements = []
+
+    @event.listens_for(async_engine.sync_engine, "before_cursor_execute")
+    def count_statements(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    # The update is a single conditional statement, without a read before it,
+    # followed by the insert of its change into the feed
+    response = client.patch(
+        f"/v1/medspas/{medspa.id}", json={"name": "First"}, headers={"If-Match": etag}
+    )
+    assert response.status_code == 200
+    assert response.json()["version"] == 2
+    assert response.headers["ETag"] == '"2"'
+    assert [statement.split()[0] for statement in statements] == ["UPDATE", "INSERT"]
+
+    # Another client still holding the first version cannot overwrite it
+    response = client.patch(
+        f"/v1/medspas/{medspa.id}", json={"name": "Second"}, headers={"If-Match": etag}
+    )
+    assert response.status_code == 412
+    assert client.get(f"/v1/medspas/{medspa.id}").json()["name"] == "First"
+
+    response = client.patch(
+        f"/v1/medspas/{medspa.id}",
+        json={"name": "Second"},
+        headers={"If-Match": 'W/"2"'},
+    )
+    assert response.status_code == 412
+
+    # Without If-Match the update always applies and still bumps the version
+    response = client.patch(f"/v1/medspas/{medspa.id}", json={"name": "Second"})
+    assert response.status_code == 200
+    assert response.json()["version"] == 3
+
+    response = client.patch("/v1/medspas/999", json={"name": "Missing"})
+    assert response.status_code == 404
+    response = client.patch(
+        "/v1/medspas/999", json={"name": "Missing"}, headers={"If-Match": '"1"'}
+    )
+    assert response.status_code == 404
+
+
 def test_delete_medspa(client: TestClient, session: Session):
     medspa = Medspa(
         name="Test Medspa",
@@ -91,3 +155,203 @@ def test_delete_medspa(client: TestClient, session: Session):
         medspa_repository.get_by_id(session, medspa.id)
 
     assert exc_info.value.status_code == 404
+
+
+def test_delete_medspa_cascades(
+    client: TestClient, session: Session, async_engine: AsyncEngine
+):
+    medspa = Medspa(
+        name="Test Medspa",
+        address="123 Main St",
+        phone_number="123-456-7890",
+        email_address="test@example.com",
+    )
+    medspa_repository.create(session, medspa)
+    service = Services(
+        name="Service",
+        description="Description",
+        price=100,
+        duration=30,
+        medspa_id=medspa.id,
+    )
+    session.add(service)
+    session.commit()
+
+    booking = {
+        "medspa_id": medspa.id,
+        "services": [service.id],
+        "start_time": "2030-01-01T09:00:00",
+    }
+    assert client.post("/v1/appointments/", json=booking).status_code == 201
+
+    statements = []
+
+    @event.listens_for(async_engine.sync_engine, "before_cursor_execute")
+    def count_statements(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    # The children are removed by the database and none of them is loaded,
+    # only their ids are read in one query to record them in the change feed
+    response = client.delete(f"/v1/medspas/{medspa.id}")
+    assert response.status_code == 204
+    assert [statement.split()[0] for statement in statements] == [
+        "SELECT",
+        "SELECT",
+        "INSERT",
+        "DELETE",
+        "INSERT",
+    ]
+
+    for model in (Services, Appointments, AppointmentsServices, AppointmentStats):
+        assert session.exec(select(model)).all() == []
+
+    assert client.delete(f"/v1/medspas/{medspa.id}").status_code == 404
+
+
+def test_get_medspas_paginated(client: TestClient, session: Session):
+    for i in range(5):
+        medspa_repository.create(
+            session,
+            Medspa(
+                name=f"Test Medspa {i}",
+                address="123 Main St",
+                phone_number="123-456-7890",
+                email_address="test@example.com",
+            ),
+        )
+
+    response = client.get("/v1/medspas?limit=2")
+    assert response.status_code == 200
+    assert [item["name"] for item in response.json()] == [
+        "Test Medspa 0",
+        "Test Medspa 1",
+    ]
+
+    names = [item["name"] for item in response.json()]
+    while "X-Next-Cursor" in response.headers:
+        cursor = response.headers["X-Next-Cursor"]
+        response = client.get(f"/v1/medspas?limit=2&cursor={cursor}")
+        assert response.status_code == 200
+        names += [item["name"] for item in response.json()]
+
+    assert names == [f"Test Medspa {i}" for i in range(5)]
+
+
+def test_get_medspas_invalid_cursor(client: TestClient):
+    response = client.get("/v1/medspas?cursor=not-a-cursor")
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Invalid cursor"}
+
+
+def test_get_medspa_served_from_cache(
+    client: TestClient, session: Session, async_engine: AsyncEngine
+):
+    medspa = Medspa(
+        name="Test Medspa",
+        address="123 Main St",
+        phone_number="123-456-7890",
+        email_address="test@example.com",
+    )
+    medspa_repository.create(session, medspa)
+
+    statements = []
+
+    @event.listens_for(async_engine.sync_engine, "before_cursor_execute")
+    def count_statements(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    for path in [f"/v1/medspas/{medspa.id}", "/v1/medspas"]:
+        assert client.get(path).status_code == 200
+        statements.clear()
+
+        response = client.get(path)
+        assert response.status_code == 200
+        assert statements == []
+
+    # Writes invalidate the cached reads once they are committed
+    response = client.patch(f"/v1/medspas/{medspa.id}", json={"name": "Updated"})
+    assert response.status_code == 200
+
+    assert client.get(f"/v1/medspas/{medspa.id}").json()["name"] == "Updated"
+    assert client.get("/v1/medspas").json()[0]["name"] == "Updated"
+
+    response = client.delete(f"/v1/medspas/{medspa.id}")
+    assert response.status_code == 204
+    assert client.get(f"/v1/medspas/{medspa.id}").status_code == 404
+    assert client.get("/v1/medspas").json() == []
+
+
+def test_get_medspa_not_modified(client: TestClient, session: Session):
+    medspa = Medspa(
+        name="Test Medspa",
+        address="123 Main St",
+        phone_number="123-456-7890",
+        email_address="test@example.com",
+    )
+    medspa_repository.create(session, medspa)
+
+    response = client.get(f"/v1/medspas/{medspa.id}")
+    etag = response.headers["ETag"]
+    assert etag == '"1"'
+
+    response = client.get(f"/v1/medspas/{medspa.id}", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    assert response.content == b""
+
+    client.patch(f"/v1/medspas/{medspa.id}", json={"name": "Updated"})
+    response = client.get(f"/v1/medspas/{medspa.id}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_get_medspas_not_modified(client: TestClient, session: Session):
+    medspa = Medspa(
+        name="Test Medspa",
+        address="123 Main St",
+        phone_number="123-456-7890",
+        email_address="test@example.com",
+    )
+    medspa_repository.create(session, medspa)
+
+    response = client.get("/v1/medspas")
+    etag = response.headers["ETag"]
+    assert response.json()[0]["version"] == 1
+
+    response = client.get("/v1/medspas", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+    # Another page or set of fields is another representation
+    response = client.get("/v1/medspas?fields=name", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json() == [{"id": medspa.id, "name": "Test Medspa"}]
+
+    client.delete(f"/v1/medspas/{medspa.id}")
+    response = client.get("/v1/medspas", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json() == []
+
+
+def test_get_medspas_compressed(client: TestClient, session: Session):
+    for i in range(20):
+        medspa_repository.create(
+            session,
+            Medspa(
+                name=f"Medspa {i}",
+                address="123 Main St",
+                phone_number="123-456-7890",
+                email_address="test@example.com",
+            ),
+        )
+
+    response = client.get("/v1/medspas", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert len(response.json()) == 20
+
+    response = client.get("/v1/medspas", headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in response.headers
+
+    # Small responses are not worth compressing
+    response = client.get("/v1/medspas/1", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
@@ -0,0 +1,122 @@
+import re
+from datetime import datetime
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+import metrics
+from metrics import MetricsRegistry, RequestMetrics, registry
+from models import Appointments, Medspa
+from repositories.appoitments import AppointmentsRepository
+from repositories.medspa import MedspaRepository
+
+medspa_repository = MedspaRepository()
+appointments_repository = AppointmentsRepository()
+
+
+@pytest.fixture(autouse=True)
+def clear_metrics():
+    registry.clear()
+    yield
+    registry.clear()
+
+
+def get_sample(body: str, name: str, **labels) -> float:
+    selector = ",".join(f'{key}="{value}"' for key, value in labels.items())
+    match = re.search(rf"^{name}{{{re.escape(selector)}}} (\S+)$", body, re.M)
+    assert match, f"{name}{{{selector}}} not found"
+    return float(match.group(1))
+
+
+def test_metrics_per_route(client: TestClient, session: Session):
+    medspa = medspa_repository.create(
+        session,
+        Medspa(
+            name="Test Medspa",
+            address="123 Main St",
+            phone_number="123-456-7890",
+            email_address="test@example.com",
+        ),
+    )
+    appointment = appointments_repository.create(
+        session,
+        Appointments(
+            medspa_id=medspa.id,
+            start_time=datetime(2025, 1, 1, 9),
+            total_price=300,
+            total_duration=90,
+        ),
+    )
+
+    for _ in range(2):
+        client.get(f"/v1/appointments/{appointment.id}")
+    client.delete(f"/v1/appointments/{appointment.id}")
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+
+    route = "/v1/appointments/{appointment_id}"
+    labels = {"method": "GET", "route": route}
+    assert (
+        get_sample(response.text, "http_request_duration_seconds_count", **labels) == 2
+    )
+    assert (
+        get_sample(
+            response.text, "http_request_duration_seconds_bucket", **labels, le="+Inf"
+        )
+        == 2
+    )
+    # The appointment and its services are loaded with a single query
+    assert get_sample(response.text, "db_statements_total", **labels) == 2
+    assert get_sample(response.text, "db_commits_total", **labels) == 0
+    assert get_sample(response.text, "db_duration_seconds_total", **labels) > 0
+
+    labels = {"method": "DELETE", "route": route}
+    assert get_sample(response.text, "db_commits_total", **labels) == 1
+
+
+def test_metrics_unmatched_route(client: TestClient):
+    client.get("/missing")
+
+    body = registry.render()
+    assert (
+        get_sample(
+            body, "http_request_duration_seconds_count", method="GET", route="unmatched"
+        )
+        == 1
+    )
+
+
+def test_server_timing_header(client: TestClient, monkeypatch: pytest.MonkeyPatch):
+    response = client.get("/v1/appointments/")
+    assert "server-timing" not in response.headers
+
+    monkeypatch.setattr(metrics, "SERVER_TIMING", True)
+    response = client.get("/v1/appointments/")
+    assert re.fullmatch(
+        r'app;dur=[\d.]+, db;dur=[\d.]+;desc="1 queries", commit;desc=0',
+        response.headers["server-timing"],
+    )
+
+
+def test_registry_histogram_buckets():
+    registry = MetricsRegistry()
+    for latency in (0.001, 0.2, 20):
+        registry.observe("GET", "/", latency, RequestMetrics())
+
+    body = registry.render()
+    labels = {"method": "GET", "route": "/"}
+    assert (
+        get_sample(body, "http_request_duration_seconds_bucket", **labels, le=0.005)
+        == 1
+    )
+    assert (
+        get_sample(body, "http_request_duration_seconds_bucket", **labels, le=0.25) == 2
+    )
+    assert (
+        get_sample(body, "http_request_duration_seconds_bucket", **labels, le=10.0) == 2
+    )
+    assert (
+        get_sample(body, "http_request_duration_seconds_bucket", **labels, le="+Inf")
+        == 3
+    )
@@ -0,0 +1,51 @@
+from datetime import datetime, timedelta
+from scheduling import find_free_slots, merge_intervals, overlaps
+
+DAY = datetime(2025, 1, 1)
+
+
+def at(hour: int, minute: int = 0) -> datetime:
+    return DAY.replace(hour=hour, minute=minute)
+
+
+def test_merge_intervals():
+    assert merge_intervals(
+        [(at(11), at(12)), (at(9), at(10)), (at(9, 30), at(10, 30)), (at(12), at(13))]
+    ) == [(at(9), at(10, 30)), (at(11), at(13))]
+
+
+def test_overlaps():
+    busy = [(at(9), at(10)), (at(12), at(13))]
+
+    assert overlaps(busy, at(9, 30), at(11))
+    assert overlaps(busy, at(8), at(14))
+    assert overlaps(busy, at(12, 59), at(13, 30))
+    assert not overlaps(busy, at(10), at(12))
+    assert not overlaps(busy, at(8), at(9))
+    assert not overlaps(busy, at(13), at(14))
+    assert not overlaps([], at(8), at(9))
+
+
+def test_find_free_slots():
+    busy = [(at(8), at(9, 30)), (at(10, 10), at(11)), (at(11, 30), at(17))]
+
+    slots = find_free_slots(
+        busy, at(9), at(18), timedelta(minutes=30), step=timedelta(minutes=15)
+    )
+
+    assert slots == [
+        at(9, 30),
+        at(11),
+        at(17),
+        at(17, 15),
+        at(17, 30),
+    ]
+
+
+def test_find_free_slots_empty_day():
+    slots = find_free_slots(
+        [], at(9), at(10), timedelta(minutes=30), step=timedelta(minutes=30)
+    )
+    assert slots == [at(9), at(9, 30)]
+
+    assert find_free_slots([(at(8), at(19))], at(9), at(18), timedelta(hours=1)) == []
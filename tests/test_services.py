@@ -1,5 +1,7 @@
 from fastapi import HTTPException
 from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
 from sqlmodel import Session
 from models import Medspa, Services
 from repositories.services import ServicesRepository
@@ -99,6 +101,54 @@ def test_get_services_filter_by_medspa_id(
     assert len(response.json()) == 0
 
 
+def test_get_services_sparse_fields(
+    client: TestClient,
+    session: Session,
+    async_engine: AsyncEngine,
+    setup_medspa: Medspa,
+):
+    for i in range(3):
+        services_repository.create(
+            session,
+            Services(
+                name=f"Service {i}",
+                description="Test Description",
+                price=100,
+                duration=30,
+                medspa_id=setup_medspa.id,
+            ),
+        )
+
+    statements = []
+
+    @event.listens_for(async_engine.sync_engine, "before_cursor_execute")
+    def count_statements(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    response = client.get("/v1/services?fields=name,price&limit=2")
+    assert response.status_code == 200
+    assert response.json() == [
+        {"id": 1, "name": "Service 0", "price": "100.00"},
+        {"id": 2, "name": "Service 1", "price": "100.00"},
+    ]
+    # The other columns are not even fetched
+    assert "description" not in statements[0]
+
+    cursor = response.headers["X-Next-Cursor"]
+    response = client.get(f"/v1/services?fields=name,price&limit=2&cursor={cursor}")
+    assert response.json() == [{"id": 3, "name": "Service 2", "price": "100.00"}]
+
+    # Served from the cache, with the same fields
+    statements.clear()
+    response = client.get("/v1/services?fields=name,price&limit=2")
+    assert statements == []
+    assert [item.keys() for item in response.json()] == [{"id", "name", "price"}] * 2
+
+    response = client.get("/v1/services?fields=name,secret")
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Unknown fields: secret"
+
+
 def test_update_service(client: TestClient, session: Session, setup_medspa: Medspa):
     service = Services(
         name="Test Service",
@@ -141,3 +191,84 @@ def test_delete_service(client: TestClient, session: Session, setup_medspa: Meds
         services_repository.get_by_id(session, service.id)
 
     assert exc_info.value.status_code == 404
+
+
+def test_delete_medspa_invalidates_cached_services(
+    client: TestClient, session: Session, setup_medspa: Medspa
+):
+    service = Services(
+        name="Test Service",
+        description="Test Description",
+        price=100,
+        duration=30,
+        medspa_id=setup_medspa.id,
+    )
+    services_repository.create(session, service)
+
+    assert len(client.get("/v1/services").json()) == 1
+    assert client.get(f"/v1/services/{service.id}").status_code == 200
+
+    response = client.delete(f"/v1/medspas/{setup_medspa.id}")
+    assert response.status_code == 204
+
+    assert client.get("/v1/services").json() == []
+    assert client.get(f"/v1/services/{service.id}").status_code == 404
+
+
+def service_data(medspa_id: int, name: str) -> dict:
+    return {
+        "name": name,
+        "description": "Test Description",
+        "price": "100.00",
+        "duration": 30,
+        "medspa_id": medspa_id,
+    }
+
+
+def test_create_services_bulk(
+    client: TestClient, session: Session, setup_medspa: Medspa
+):
+    services = [service_data(setup_medspa.id, f"Service {i}") for i in range(50)]
+    response = client.post("/v1/services/bulk", json=services)
+
+    assert response.status_code == 201
+    assert response.json() == [
+        {"index": i, "status": 201, "id": i + 1} for i in range(50)
+    ]
+    assert len(services_repository.get_all(session)) == 50
+
+
+def test_create_services_bulk_atomic(
+    client: TestClient, session: Session, setup_medspa: Medspa
+):
+    services = [
+        service_data(setup_medspa.id, "Service 1"),
+        service_data(999, "Service 2"),
+    ]
+
+    response = client.post("/v1/services/bulk", json=services)
+    assert response.status_code == 422
+    assert response.json() == {
+        "detail": [
+            {"index": 0, "status": 201},
+            {"index": 1, "status": 404, "detail": "Medspa not found"},
+        ]
+    }
+    assert services_repository.get_all(session) == []
+
+
+def test_create_services_bulk_best_effort(
+    client: TestClient, session: Session, setup_medspa: Medspa
+):
+    services = [
+        service_data(999, "Service 1"),
+        service_data(setup_medspa.id, "Service 2"),
+    ]
+
+    response = client.post("/v1/services/bulk?mode=best_effort", json=services)
+    assert response.status_code == 207
+    assert response.json() == [
+        {"index": 0, "status": 404, "detail": "Medspa not found"},
+        {"index": 1, "status": 201, "id": 1},
+    ]
+    assert [s.name for s in services_repository.get_all(session)] == ["Service 2"]